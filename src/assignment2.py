@@ -3,8 +3,8 @@
 ####################
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
 from utils import get_t
+from orbits import propagate
 
 # %%
 """
@@ -43,49 +43,17 @@ def gravitational_force(r):
 
 
 # Euler method for gravity
+# both methods run in orbits.py, for as many orbits as we like at once, see the last cell
 def euler_method_gravity(r0, v0, t_max, dt):
-    t_array, n = get_t(t_max, dt)
-    # first dim is the time dimension, second dim is the position dimension
-    r = np.zeros((n, 3))
-    v = np.zeros((n, 3))
-    a = np.zeros((n, 3))
-
-    r[0] = r0
-    v[0] = v0
-    a[0] = gravitational_force(r[0]) / m
-
-    for i in tqdm(range(0, n - 1)):
-        r[i + 1] = r[i] + dt * v[i]
-        v[i + 1] = v[i] + a[i] * dt
-        a[i + 1] = gravitational_force(r[i + 1]) / m
-
-    return r, v, a
+    t, r, v, a = propagate("euler", r0, v0, dt, t_max, gm=G * M)
+    return r[0], v[0], a[0]
 
 
 # Verlet method
+# the first step is an Euler step, and v is the central difference of r, with the backward difference at the end
 def verlet_method_gravity(r0, v0, t_max, dt):
-    t_array, n = get_t(t_max, dt)
-    r = np.zeros((n, 3))
-    v = np.zeros((n, 3))
-    a = np.zeros((n, 3))
-
-    r[0] = r0
-    v[0] = v0
-    a[0] = gravitational_force(r[0]) / m
-
-    # First step using Euler method
-    r[1] = r[0] + v[0] * dt
-
-    for i in tqdm(range(1, n - 1)):
-        a[i] = gravitational_force(r[i]) / m
-        r[i + 1] = 2 * r[i] - r[i - 1] + a[i] * dt**2
-        v[i] = (r[i + 1] - r[i - 1]) / (2 * dt)
-
-    # Calculate final velocity and acceleration
-    v[-1] = (r[-1] - r[-2]) / dt
-    a[-1] = gravitational_force(r[-1]) / m
-
-    return r, v, a
+    t, r, v, a = propagate("verlet", r0, v0, dt, t_max, gm=G * M)
+    return r[0], v[0], a[0]
 
 
 # unlike previously, this has no general analytical solution!
@@ -177,3 +145,38 @@ r_hyperbolic, v_hyperbolic, a_hyperbolic = verlet_method_gravity(
     r0_hyperbolic, v0_hyperbolic, t_max_hyperbolic, dt_hyperbolic
 )
 plot_orbit(r_hyperbolic, "Scenario 4: Hyperbolic Escape")
+
+# %% All four scenarios, and a sweep of launch speeds from circular to escape velocity, in one call
+# every orbit keeps its own time step and length, and one sample per second of it
+r0_sweep = np.array([0, 4e6, 0])
+speeds = np.linspace(
+    calculate_circular_orbit_velocity(r0_sweep), calculate_escape_velocity(r0_sweep), 50
+)
+r0_all = np.vstack(
+    [[r0, r0_circular, r0_elliptical, r0_hyperbolic], np.tile(r0_sweep, (50, 1))]
+)
+v0_all = np.vstack(
+    [
+        [v0, v0_circular, v0_elliptical, v0_hyperbolic],
+        np.column_stack([speeds, np.zeros(50), np.zeros(50)]),
+    ]
+)
+dt_all = np.array([dt, dt_circular, dt_elliptical, dt_hyperbolic] + [1] * 50)
+t_max_all = np.array(
+    [t_max, t_max_circular, t_max_elliptical, t_max_hyperbolic] + [40000] * 50
+)
+
+t_all, r_all, v_all, a_all = propagate(
+    "verlet", r0_all, v0_all, dt_all, t_max_all, gm=G * M, every=np.round(1 / dt_all).astype(int)
+)
+
+plt.figure(figsize=(10, 10))
+# from circular (dark) to escape (light)
+for r_sweep, color in zip(r_all[4:], plt.cm.viridis(np.linspace(0, 1, 50))):
+    plt.plot(r_sweep[:, 0], r_sweep[:, 1], lw=0.5, color=color)
+plt.title("Launch speeds from circular to escape velocity")
+plt.xlabel("X position (m)")
+plt.ylabel("Y position (m)")
+plt.axis("equal")
+plt.grid(True)
+plt.show()
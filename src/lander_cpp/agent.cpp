@@ -1,13 +1,53 @@
 
 #include <vector>
 #include <tuple>
+#include <thread>
+#include <algorithm>
+#include <stdexcept>
 // Implementation (Agent.cpp)
-#include "lander.h"
+#include "lander_core.h"
+
+void write_state(const simulation_state_t &sim, double *state)
+// writes the N_STATE values returned by getState, in the same order
+{
+    state[0] = sim.simulation_time;
+    state[1] = sim.position.x;
+    state[2] = sim.position.y;
+    state[3] = sim.position.z;
+    state[4] = sim.velocity.x;
+    state[5] = sim.velocity.y;
+    state[6] = sim.velocity.z;
+    state[7] = sim.orientation.x;
+    state[8] = sim.orientation.y;
+    state[9] = sim.orientation.z;
+    state[10] = sim.fuel;
+    state[11] = sim.altitude;
+    state[12] = sim.climb_speed;
+    state[13] = sim.ground_speed;
+}
 
 Agent::Agent()
 {
     // empty constructor
     // make sure you dont call reset here else you run into problems
+    std::fill(this->state_buffer, this->state_buffer + N_STATE, 0.0);
+    this->integrator = VERLET;
+    this->n_substeps = 1;
+    this->delta_t = 0.1;
+    this->headless = true;
+    this->reward_config = default_reward_config(SQUARED_ALTITUDE_REWARD);
+    this->reward = 0.0;
+}
+
+void Agent::configure(integrator_t integrator, int n_substeps, double delta_t)
+{
+    if (n_substeps < 1)
+        throw std::invalid_argument("n_substeps must be at least 1");
+    if (!(delta_t > 0.0))
+        throw std::invalid_argument("delta_t must be positive");
+    this->integrator = integrator;
+    this->n_substeps = n_substeps;
+    this->delta_t = delta_t;
 }
 
 vector<double> Agent::reset(vector<double> init_conditions)
@@ -15,24 +55,30 @@ vector<double> Agent::reset(vector<double> init_conditions)
 // currently init_conditions is a length-9 vector containing position, velocity and orientation!
 {
 
-    reset_simulation();
+    reset_simulation(this->simulation);
     // Set initial conditions
-    // BE CAREFUL OF THIS GLOBAL VARIABLE POSITION
-    // we change global varibles from within; no ideal but no choice
-    // we need to do this for update_lander_state to work
+    // these now go into this agent's own simulation, not the global one used by the graphics
 
-    // Extract initial conditions from init_conditions and set globally
-    ::position = vector3d(init_conditions[0], init_conditions[1], init_conditions[2]);
-    ::velocity = vector3d(init_conditions[3], init_conditions[4], init_conditions[5]);
-    ::orientation = vector3d(init_conditions[6], init_conditions[7], init_conditions[8]);
+    // Extract initial conditions from init_conditions
+    this->simulation.position = vector3d(init_conditions[0], init_conditions[1], init_conditions[2]);
+    this->simulation.velocity = vector3d(init_conditions[3], init_conditions[4], init_conditions[5]);
+    this->simulation.orientation = vector3d(init_conditions[6], init_conditions[7], init_conditions[8]);
 
+    // the time step and integrator come from configure. with the default Verlet, increasing delta_t
+    // much more than 0.1 will break things; RK4 and Yoshida stay accurate at larger steps
+    this->simulation.delta_t = this->delta_t; // speed up environment at the expense of less accuracy, less steps needed
+    this->simulation.integrator = this->integrator;
+    this->simulation.n_substeps = this->n_substeps;
+    this->simulation.headless = this->headless;
     // these are always fixed!
-    // this is weird, increasing much more than 0.1 will break things
-    ::delta_t = 0.1; // speed up environment at the expense of less accuracy, less steps needed
-    // faster training
-    ::parachute_status = NOT_DEPLOYED;
-    ::stabilized_attitude = true;
-    ::autopilot_enabled = true;
+    this->simulation.parachute_status = NOT_DEPLOYED;
+    this->simulation.stabilized_attitude = true;
+    this->simulation.autopilot_enabled = true;
+    this->reward = 0.0;
+
+    write_state(this->simulation, this->state_buffer);
+    if (this->recorder)
+        this->recorder->startEpisode();
 
     // Convert the initial state to double and return it
     vector<double> init_state = this->getState();
@@ -49,13 +95,20 @@ void Agent::update(tuple<double> new_actions)
     // this actions will be available globally! is an instance variable, that is public
     this->actions = new_actions;
 
-    ::throttle = std::get<0>(new_actions);
+    this->simulation.throttle = std::get<0>(new_actions);
 
     // cout << "in update, agent throttle is: " << get<0>(this->actions) << " global throttle is: " << ::throttle << endl;
 
-    // global env has changed
+    // our simulation has changed
     // this will call autopilot with the agent
-    update_lander_state();
+    PROFILE_SCOPE(PROFILE_STEP);
+    update_lander_state(this->simulation);
+    {
+        PROFILE_SCOPE(PROFILE_REWARD);
+        this->reward = step_reward(this->simulation, this->reward_config);
+    }
+    if (this->recorder)
+        this->recorder->record(this->simulation, std::get<0>(new_actions));
 
     // vector<double> states = agent.getState();
     // std::cout << " Right After Update - Time: " << states[0]
@@ -72,19 +125,91 @@ void Agent::update(tuple<double> new_actions)
     //           << endl;
 }
 
+tuple<bool, bool, double> Agent::step(double throttle)
+// same as update followed by getState, isLanded and isCrashed, but without building any vectors
+{
+    PROFILE_SCOPE(PROFILE_STEP);
+    this->actions = std::make_tuple(throttle);
+    this->simulation.throttle = throttle;
+    update_lander_state(this->simulation);
+    {
+        PROFILE_SCOPE(PROFILE_REWARD);
+        this->reward = step_reward(this->simulation, this->reward_config);
+    }
+    if (this->recorder)
+        this->recorder->record(this->simulation, throttle);
+
+    {
+        PROFILE_SCOPE(PROFILE_STATE_READOUT);
+        write_state(this->simulation, this->state_buffer);
+    }
+    return std::make_tuple(this->simulation.landed, this->simulation.crashed, this->reward);
+}
+
+int Agent::rollout(const double *throttles, int n_steps, bool schedule, double *states)
+{
+    int i;
+    double total_reward = 0.0;
+    // an empty schedule has no throttle to read, not even throttles[0], and takes no steps
+    if (n_steps <= 0)
+    {
+        this->reward = 0.0;
+        write_state(this->simulation, this->state_buffer);
+        return 0;
+    }
+    for (i = 0; i < n_steps && !this->simulation.landed; i++)
+    {
+        PROFILE_SCOPE(PROFILE_STEP);
+        this->simulation.throttle = schedule ? throttles[i] : throttles[0];
+        update_lander_state(this->simulation);
+        {
+            PROFILE_SCOPE(PROFILE_REWARD);
+            total_reward += step_reward(this->simulation, this->reward_config);
+        }
+        if (this->recorder)
+            this->recorder->record(this->simulation, schedule ? throttles[i] : throttles[0]);
+        if (states != NULL)
+        {
+            PROFILE_SCOPE(PROFILE_STATE_READOUT);
+            write_state(this->simulation, states + i * N_STATE);
+        }
+    }
+    this->actions = std::make_tuple(schedule && i > 0 ? throttles[i - 1] : throttles[0]);
+    this->reward = total_reward;
+
+    write_state(this->simulation, this->state_buffer);
+    return i;
+}
+
+simulation_snapshot_t Agent::snapshot() const
+{
+    simulation_snapshot_t snapshot;
+    snapshot_simulation(this->simulation, snapshot);
+    return snapshot;
+}
+
+void Agent::restore(const simulation_snapshot_t &snapshot)
+{
+    restore_simulation(this->simulation, snapshot);
+    // the snapshot's headless flag is the agent it came from's, this agent steps as it was set up to
+    this->simulation.headless = this->headless;
+    write_state(this->simulation, this->state_buffer);
+}
+
 vector<double> Agent::getState()
 {
-    // Create a NEW vector and populate it with copies of the global variables
+    // Create a NEW vector and populate it with copies of the simulation variables
     // order of return states
+    const simulation_state_t &sim = this->simulation;
     std::vector<double> state = {
-        ::simulation_time,
-        ::position.x, ::position.y, ::position.z,
-        ::velocity.x, ::velocity.y, ::velocity.z,
-        ::orientation.x, ::orientation.y, ::orientation.z,
-        ::fuel,
-        ::altitude,
-        ::climb_speed,
-        ::ground_speed};
+        sim.simulation_time,
+        sim.position.x, sim.position.y, sim.position.z,
+        sim.velocity.x, sim.velocity.y, sim.velocity.z,
+        sim.orientation.x, sim.orientation.y, sim.orientation.z,
+        sim.fuel,
+        sim.altitude,
+        sim.climb_speed,
+        sim.ground_speed};
     return state; // This returns a COPY that can be modified without affecting the originals
 }
 
@@ -97,38 +222,81 @@ vector<double> Agent::getState()
 
 bool Agent::isLanded() const
 {
-    // return the global ones, instead of the local variables
-    return ::landed;
+    return this->simulation.landed;
 }
 
 bool Agent::isCrashed() const
 {
-    // return the global ones, instead of the local variables
-    return ::crashed;
+    return this->simulation.crashed;
 }
 
-// void Agent::syncToGlobals()
-// {
-//     // Copy our private state to the global variables
-//     ::simulation_time = this->simulation_time;
-//     ::position = this->position;
-//     ::velocity = this->velocity;
-//     ::orientation = this->orientation;
-//     ::fuel = this->fuel;
-//     ::landed = this->landed;
-//     ::crashed = this->crashed;
-//     ::altitude = this->altitude;
-// }
+/**
+ * BatchAgent implementation
+ *
+ */
 
-// void Agent::syncFromGlobals()
-// {
-//     // Copy global variables to our private state
-//     this->simulation_time = ::simulation_time;
-//     this->position = ::position;
-//     this->velocity = ::velocity;
-//     this->orientation = ::orientation;
-//     this->fuel = ::fuel;
-//     this->landed = ::landed;
-//     this->crashed = ::crashed;
-//     this->altitude = ::altitude;
-// }
\ No newline at end of file
+static int checked_size(int n_agents)
+{
+    if (n_agents < 0)
+        throw std::invalid_argument("n_agents must be at least 0, got " + std::to_string(n_agents));
+    return n_agents;
+}
+
+BatchAgent::BatchAgent(int n_agents, int n_threads)
+    : agents(checked_size(n_agents)), n_threads(n_threads < 1 ? 1 : n_threads), pool(new WorkerPool())
+{
+}
+
+void BatchAgent::reset(const double *init_conditions)
+{
+    for (int i = 0; i < this->size(); i++)
+        this->resetAgent(i, init_conditions + i * N_INIT_CONDITIONS);
+}
+
+void BatchAgent::resetAgent(int index, const double *init_conditions)
+{
+    this->agents[index].reset(vector<double>(init_conditions, init_conditions + N_INIT_CONDITIONS));
+}
+
+void BatchAgent::update(const double *throttles)
+{
+    int n = this->size();
+    // no point waking a thread for fewer landers than it takes to pay for the wake-up
+    int n_workers = std::max(1, std::min(this->n_threads, n / MIN_AGENTS_PER_THREAD));
+    int chunk = n_workers > 1 ? (n + n_workers - 1) / n_workers : n;
+
+    // each task steps its own contiguous slice of agents, so no two threads share a simulation
+    auto step_slice = [this, throttles, n, chunk](int slice)
+    {
+        for (int i = slice * chunk; i < std::min((slice + 1) * chunk, n); i++)
+        {
+            if (!this->agents[i].simulation.landed)
+                this->agents[i].update(std::make_tuple(throttles[i]));
+        }
+    };
+
+    if (n_workers <= 1)
+        step_slice(0);
+    else
+        this->pool->run(n_workers, n_workers, step_slice);
+}
+
+void BatchAgent::getStates(double *states) const
+{
+    for (int i = 0; i < this->size(); i++)
+        write_state(this->agents[i].simulation, states + i * N_STATE);
+}
+
+void BatchAgent::getFlags(bool *landed, bool *crashed) const
+{
+    for (int i = 0; i < this->size(); i++)
+    {
+        landed[i] = this->agents[i].simulation.landed;
+        crashed[i] = this->agents[i].simulation.crashed;
+    }
+}
+
+int BatchAgent::size() const
+{
+    return (int)this->agents.size();
+}
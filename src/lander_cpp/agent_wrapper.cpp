@@ -1,11 +1,24 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
-#include "lander.h"
+#include <pybind11/numpy.h>
+#include "lander_core.h"
 #include <tuple>
+#include <cstring>
 #include <vector>
+#include <limits>
+#include <algorithm>
 
 namespace py = pybind11;
 
+// C-contiguous double arrays, numpy converts anything else for us
+typedef py::array_t<double, py::array::c_style | py::array::forcecast> double_array;
+
+// whether x is one row of n values or a 2D batch of them. 0-d arrays have no rows, and no shape to index
+static bool has_rows(const py::array &x, py::ssize_t n)
+{
+    return (x.ndim() == 1 || x.ndim() == 2) && x.shape(x.ndim() - 1) == n;
+}
+
 class PyAgent : public Agent
 {
 public:
@@ -43,14 +56,511 @@ public:
     }
 };
 
+// a read-only NumPy view onto an agent's state_buffer. step() refreshes it in place,
+// so fetch it once and keep it, rather than calling get_state every step
+template <typename AgentType>
+py::array_t<double> state_buffer_view(py::object self)
+{
+    AgentType &agent = self.cast<AgentType &>();
+    py::array_t<double> view(N_STATE, agent.state_buffer, self);
+    view.attr("setflags")(py::arg("write") = false);
+    return view;
+}
+
+// runs AgentType::rollout and packs the result as (n_steps_taken, landed, crashed, states or None)
+template <typename AgentType>
+py::tuple run_rollout(AgentType &agent, const double *throttles, int n_steps, bool schedule, bool record)
+{
+    if (n_steps < 0)
+        throw py::value_error("the number of steps cannot be negative");
+    py::object states = py::none();
+    int n_taken;
+    if (record)
+    {
+        py::array_t<double> recorded({(py::ssize_t)n_steps, (py::ssize_t)N_STATE});
+        n_taken = agent.rollout(throttles, n_steps, schedule, recorded.mutable_data());
+        // only return the rows for the steps that actually happened
+        states = recorded[py::slice(0, n_taken, 1)];
+    }
+    else
+        n_taken = agent.rollout(throttles, n_steps, schedule, NULL);
+    return py::make_tuple(n_taken, agent.simulation.landed, agent.simulation.crashed, states);
+}
+
+// rollout(throttle, repeat) holds one throttle, rollout(throttles) follows a schedule
+template <typename AgentType, typename ClassType>
+void def_rollout(ClassType &cls)
+{
+    cls.def(
+           "rollout",
+           [](AgentType &agent, double throttle, int repeat, bool record)
+           { return run_rollout(agent, &throttle, repeat, false, record); },
+           py::arg("throttle"), py::arg("repeat"), py::arg("record") = false)
+        .def(
+            "rollout",
+            [](AgentType &agent, double_array throttles, bool record)
+            {
+                if (throttles.ndim() != 1)
+                    throw py::value_error("throttles must be a 1D array");
+                return run_rollout(agent, throttles.data(), (int)throttles.shape(0), true, record);
+            },
+            py::arg("throttles"), py::arg("record") = false);
+}
+
+// snapshot() returns the agent's complete dynamic state as SNAPSHOT_SIZE bytes, restore(blob) puts it back
+template <typename AgentType, typename ClassType>
+void def_snapshot(ClassType &cls)
+{
+    cls.def("snapshot", [](const AgentType &agent)
+            {
+                simulation_snapshot_t snapshot = agent.snapshot();
+                return py::bytes(reinterpret_cast<const char *>(&snapshot), sizeof(snapshot)); })
+        .def(
+            "restore",
+            [](AgentType &agent, py::bytes blob)
+            {
+                std::string bytes = blob;
+                if (bytes.size() != sizeof(simulation_snapshot_t))
+                    throw py::value_error("a snapshot must be exactly SNAPSHOT_SIZE bytes");
+                simulation_snapshot_t snapshot;
+                memcpy(&snapshot, bytes.data(), sizeof(snapshot));
+                agent.restore(snapshot);
+            },
+            py::arg("blob"));
+}
+
+// set_reward(name, **parameters) picks the reward function step and rollout compute, from REWARD_FUNCTIONS.
+// parameters it is not given keep their defaults for that function. the last reward is also a property
+template <typename AgentType, typename ClassType>
+void def_reward(ClassType &cls)
+{
+    cls.def(
+           "set_reward",
+           [](AgentType &agent, const std::string &name, py::kwargs parameters)
+           {
+               reward_function_t function;
+               try
+               {
+                   function = reward_function_from_name(name);
+               }
+               catch (const std::invalid_argument &error)
+               {
+                   throw py::value_error(error.what());
+               }
+               reward_config_t config = default_reward_config(function);
+               for (auto item : parameters)
+               {
+                   std::string key = item.first.cast<std::string>();
+                   double value = item.second.cast<double>();
+                   if (key == "kinetic_weight")
+                       config.kinetic_weight = value;
+                   else if (key == "landing_reward")
+                       config.landing_reward = value;
+                   else if (key == "crash_penalty")
+                       config.crash_penalty = value;
+                   else if (key == "step_penalty")
+                       config.step_penalty = value;
+                   else
+                       throw py::value_error("unknown reward parameter " + key);
+               }
+               agent.reward_config = config;
+           },
+           py::arg("name"))
+        .def_property_readonly("reward_function", [](const AgentType &agent)
+                               { return std::string(reward_function_names[agent.reward_config.function]); })
+        .def_property_readonly("reward_parameters", [](const AgentType &agent)
+                               {
+                                   py::dict parameters;
+                                   parameters["kinetic_weight"] = agent.reward_config.kinetic_weight;
+                                   parameters["landing_reward"] = agent.reward_config.landing_reward;
+                                   parameters["crash_penalty"] = agent.reward_config.crash_penalty;
+                                   parameters["step_penalty"] = agent.reward_config.step_penalty;
+                                   return parameters; })
+        .def_readonly("reward", &AgentType::reward);
+}
+
+// run_policy(n_steps, frame_skip) flies the agent's policy, an MlpPolicy or None, and returns
+// (n_steps_taken, landed, crashed)
+template <typename AgentType, typename ClassType>
+void def_policy(ClassType &cls)
+{
+    cls.def_readwrite("policy", &AgentType::policy)
+        .def(
+            "run_policy",
+            [](AgentType &agent, int n_steps, int frame_skip)
+            {
+                if (!agent.policy)
+                    throw py::value_error("set the agent's policy first");
+                if (frame_skip < 1)
+                    throw py::value_error("frame_skip must be at least 1");
+                int n_taken = agent.runPolicy(n_steps, frame_skip);
+                return py::make_tuple(n_taken, agent.simulation.landed, agent.simulation.crashed);
+            },
+            py::arg("n_steps"), py::arg("frame_skip") = 1);
+}
+
+// reset, with the integrator, sub-steps and time step as optional keyword arguments. any that are given are kept
+// for later resets too. the same settings, and headless, are also properties, which take effect at the next reset
+template <typename AgentType, typename ClassType>
+void def_reset(ClassType &cls)
+{
+    cls.def(
+           "reset",
+           [](AgentType &agent, std::vector<double> init_conditions, py::object integrator, py::object n_substeps, py::object delta_t)
+           {
+               agent.configure(integrator.is_none() ? agent.integrator : integrator.cast<integrator_t>(),
+                               n_substeps.is_none() ? agent.n_substeps : n_substeps.cast<int>(),
+                               delta_t.is_none() ? agent.delta_t : delta_t.cast<double>());
+               return agent.reset(init_conditions);
+           },
+           py::arg("init_conditions"), py::arg("integrator") = py::none(), py::arg("n_substeps") = py::none(),
+           py::arg("delta_t") = py::none())
+        .def_property(
+            "integrator", [](const AgentType &agent)
+            { return agent.integrator; },
+            [](AgentType &agent, integrator_t integrator)
+            { agent.configure(integrator, agent.n_substeps, agent.delta_t); })
+        .def_property(
+            "n_substeps", [](const AgentType &agent)
+            { return agent.n_substeps; },
+            [](AgentType &agent, int n_substeps)
+            { agent.configure(agent.integrator, n_substeps, agent.delta_t); })
+        .def_property(
+            "delta_t", [](const AgentType &agent)
+            { return agent.delta_t; },
+            [](AgentType &agent, double delta_t)
+            { agent.configure(agent.integrator, agent.n_substeps, delta_t); })
+        // True (the default) skips the bookkeeping only the graphics engine needs. the trajectory is the same
+        .def_readwrite("headless", &AgentType::headless)
+        // a TrajectoryRecorder, or None. it records every step from the next reset on
+        .def_readwrite("recorder", &AgentType::recorder);
+}
+
+// the scores of many landings as a dict of arrays of the given shape, one per autopilot_score_t field
+py::dict scores_dict(const vector<autopilot_score_t> &scores, const std::vector<py::ssize_t> &shape)
+{
+    py::array_t<double> fuel_used(shape), descent_rate(shape), ground_speed(shape);
+    py::array_t<bool> landed(shape), crashed(shape);
+    py::array_t<int> steps(shape);
+    for (size_t k = 0; k < scores.size(); k++)
+    {
+        fuel_used.mutable_data()[k] = scores[k].fuel_used;
+        descent_rate.mutable_data()[k] = scores[k].descent_rate;
+        ground_speed.mutable_data()[k] = scores[k].ground_speed;
+        landed.mutable_data()[k] = scores[k].landed;
+        crashed.mutable_data()[k] = scores[k].crashed;
+        steps.mutable_data()[k] = scores[k].steps;
+    }
+    py::dict result;
+    result["fuel_used"] = fuel_used;
+    result["descent_rate"] = descent_rate;
+    result["ground_speed"] = ground_speed;
+    result["landed"] = landed;
+    result["crashed"] = crashed;
+    result["steps"] = steps;
+    return result;
+}
+
+// evaluate_autopilot_gains for Python: every row of gains is (K_h, K_p, delta), every row of init_conditions
+// is one landing. returns a dict of (n_gains, n_episodes) arrays
+py::dict evaluate_autopilot_gains_py(double_array gains, double_array init_conditions, int max_steps, int n_threads)
+{
+    if (gains.ndim() != 2 || gains.shape(1) != 3)
+        throw py::value_error("gains must have shape (n_gains, 3)");
+    if (init_conditions.ndim() != 2 || init_conditions.shape(1) != N_INIT_CONDITIONS)
+        throw py::value_error("init_conditions must have shape (n_episodes, 9)");
+    int n_gains = (int)gains.shape(0), n_episodes = (int)init_conditions.shape(0);
+
+    vector<autopilot_gains_t> candidates(n_gains);
+    for (int i = 0; i < n_gains; i++)
+        candidates[i] = {gains.at(i, 0), gains.at(i, 1), gains.at(i, 2)};
+    vector<autopilot_score_t> scores(n_gains * n_episodes);
+    {
+        py::gil_scoped_release release;
+        evaluate_autopilot_gains(candidates.data(), n_gains, init_conditions.data(), n_episodes, max_steps, n_threads, scores.data());
+    }
+    return scores_dict(scores, {n_gains, n_episodes});
+}
+
+// proportional_throttle for Python, on a state of N_STATE values as getState returns it. only the position and
+// velocity are read
+double proportional_throttle_py(double_array state, std::tuple<double, double, double> gains)
+{
+    if (state.ndim() != 1 || state.shape(0) != N_STATE)
+        throw py::value_error("state must have N_STATE values");
+    simulation_state_t sim;
+    sim.position = vector3d(state.at(1), state.at(2), state.at(3));
+    sim.velocity = vector3d(state.at(4), state.at(5), state.at(6));
+    return proportional_throttle(sim, {std::get<0>(gains), std::get<1>(gains), std::get<2>(gains)});
+}
+
+// evaluate_policy for Python: every row of init_conditions is one landing. returns a dict of (n_episodes,) arrays
+py::dict evaluate_policy_py(const MlpPolicy &policy, double_array init_conditions, int max_steps, int frame_skip, int n_threads)
+{
+    if (init_conditions.ndim() != 2 || init_conditions.shape(1) != N_INIT_CONDITIONS)
+        throw py::value_error("init_conditions must have shape (n_episodes, 9)");
+    if (frame_skip < 1)
+        throw py::value_error("frame_skip must be at least 1");
+    int n_episodes = (int)init_conditions.shape(0);
+
+    vector<autopilot_score_t> scores(n_episodes);
+    {
+        py::gil_scoped_release release;
+        evaluate_policy(policy, init_conditions.data(), n_episodes, max_steps, frame_skip, n_threads, scores.data());
+    }
+    return scores_dict(scores, {n_episodes});
+}
+
+// propagate_orbits for Python: r0 and v0 are (n_orbits, 3), dt, n_steps and every (n_orbits,). returns r, v and a as
+// (n_orbits, n_samples, 3) arrays, NaN past the last sample of every orbit
+py::tuple propagate_orbits_py(const string &method, double_array r0, double_array v0, double_array dt,
+                              py::array_t<long long, py::array::c_style | py::array::forcecast> n_steps,
+                              py::array_t<long long, py::array::c_style | py::array::forcecast> every, double gm,
+                              long long n_samples, int n_threads)
+{
+    if (method != "euler" && method != "verlet")
+        throw py::value_error("method must be \"euler\" or \"verlet\"");
+    if (r0.ndim() != 2 || r0.shape(1) != 3 || v0.ndim() != 2 || v0.shape(0) != r0.shape(0) || v0.shape(1) != 3)
+        throw py::value_error("r0 and v0 must both have shape (n_orbits, 3)");
+    int n_orbits = (int)r0.shape(0);
+    if (dt.size() != n_orbits || n_steps.size() != n_orbits || every.size() != n_orbits)
+        throw py::value_error("dt, n_steps and every must have one entry per orbit");
+    for (int i = 0; i < n_orbits; i++)
+        if (every.data()[i] < 1 || (n_steps.data()[i] - 1) / every.data()[i] >= n_samples)
+            throw py::value_error("every must be at least 1, and n_samples must hold every orbit's samples");
+
+    std::vector<py::ssize_t> shape = {n_orbits, (py::ssize_t)n_samples, 3};
+    py::array_t<double> r(shape), v(shape), a(shape);
+    for (py::array_t<double> *out : {&r, &v, &a})
+        std::fill(out->mutable_data(), out->mutable_data() + out->size(), std::numeric_limits<double>::quiet_NaN());
+    {
+        py::gil_scoped_release release;
+        propagate_orbits(method == "verlet", n_orbits, r0.data(), v0.data(), dt.data(), n_steps.data(), every.data(), gm,
+                         n_samples, n_threads, r.mutable_data(), v.mutable_data(), a.mutable_data());
+    }
+    return py::make_tuple(r, v, a);
+}
+
 PYBIND11_MODULE(lander_agent_cpp, m)
 {
-    py::class_<Agent, PyAgent>(m, "PyAgent")
+    py::enum_<integrator_t>(m, "Integrator")
+        .value("VERLET", VERLET)
+        .value("RK4", RK4)
+        .value("YOSHIDA", YOSHIDA);
+
+    m.attr("SNAPSHOT_SIZE") = sizeof(simulation_snapshot_t);
+    m.attr("REWARD_FUNCTIONS") = py::tuple(py::cast(std::vector<std::string>(reward_function_names, reward_function_names + N_REWARD_FUNCTIONS)));
+
+    py::class_<TrajectoryRecorder, std::shared_ptr<TrajectoryRecorder>>(m, "TrajectoryRecorder")
+        .def(py::init<const std::string &, long>(), py::arg("directory"), py::arg("capacity") = 65536)
+        .def("flush", &TrajectoryRecorder::flush)
+        .def("__len__", &TrajectoryRecorder::size)
+        .def_property_readonly("n_episodes", &TrajectoryRecorder::nEpisodes)
+        .def_readonly("directory", &TrajectoryRecorder::directory)
+        .def_readonly("capacity", &TrajectoryRecorder::capacity)
+        .def_property_readonly_static("columns", [](py::object)
+                                      { return std::vector<std::string>(record_column_names, record_column_names + N_RECORD_COLUMNS); });
+
+    // update and normalize take one row of size values, or a 2D batch of them
+    py::class_<RunningMeanStd>(m, "RunningMeanStd")
+        .def(py::init<int, double>(), py::arg("size"), py::arg("initial_count") = 1e-4)
+        .def(
+            "update",
+            [](RunningMeanStd &rms, double_array batch)
+            {
+                if (!has_rows(batch, rms.size()))
+                    throw py::value_error("the rows must have size values");
+                rms.update(batch.data(), (long)(batch.size() / rms.size()));
+            },
+            py::arg("batch"))
+        .def(
+            "normalize",
+            [](const RunningMeanStd &rms, double_array x, double epsilon, double clip)
+            {
+                if (!has_rows(x, rms.size()))
+                    throw py::value_error("the rows must have size values");
+                py::array_t<double> out(std::vector<py::ssize_t>(x.shape(), x.shape() + x.ndim()));
+                rms.normalize(x.data(), out.mutable_data(), (long)(x.size() / rms.size()), epsilon, clip);
+                return out;
+            },
+            py::arg("x"), py::arg("epsilon") = 1e-8, py::arg("clip") = std::numeric_limits<double>::infinity())
+        .def("__len__", &RunningMeanStd::size)
+        // copies, so they can be saved. assigning them loads saved statistics
+        .def_property(
+            "mean", [](const RunningMeanStd &rms)
+            { return py::array_t<double>(rms.size(), rms.mean.data()); },
+            [](RunningMeanStd &rms, double_array mean)
+            {
+                if (mean.size() != rms.size())
+                    throw py::value_error("mean must have size values");
+                std::copy(mean.data(), mean.data() + rms.size(), rms.mean.begin());
+            })
+        .def_property(
+            "var", [](const RunningMeanStd &rms)
+            { return py::array_t<double>(rms.size(), rms.var.data()); },
+            [](RunningMeanStd &rms, double_array var)
+            {
+                if (var.size() != rms.size())
+                    throw py::value_error("var must have size values");
+                std::copy(var.data(), var.data() + rms.size(), rms.var.begin());
+            })
+        .def_readwrite("count", &RunningMeanStd::count);
+
+    // act takes one observation or a 2D batch of them, and returns the model actions in [-1, 1]
+    py::class_<MlpPolicy, std::shared_ptr<MlpPolicy>>(m, "MlpPolicy")
+        .def(py::init<const std::string &>(), py::arg("path"))
+        .def(
+            "act",
+            [](const MlpPolicy &policy, py::array_t<float, py::array::c_style | py::array::forcecast> observations)
+            {
+                if (!has_rows(observations, N_OBSERVATION))
+                    throw py::value_error("the observations must have 9 values");
+                long n_rows = (long)(observations.size() / N_OBSERVATION);
+                py::array_t<double> actions(n_rows);
+                for (long i = 0; i < n_rows; i++)
+                    actions.mutable_data()[i] = policy.act(observations.data() + i * N_OBSERVATION);
+                return actions;
+            },
+            py::arg("observations"))
+        .def(
+            "throttle",
+            [](const MlpPolicy &policy, double_array state)
+            {
+                if (state.size() != N_STATE)
+                    throw py::value_error("the state must have 14 values");
+                return policy.throttle(state.data());
+            },
+            py::arg("state"))
+        .def_readonly("layer_sizes", &MlpPolicy::layer_sizes)
+        .def_readonly("normalize_observations", &MlpPolicy::normalize_observations);
+
+    py::class_<Agent, PyAgent> py_agent(m, "PyAgent");
+    py_agent
         .def(py::init<>())
-        .def("reset", &Agent::reset)
         .def("update", &Agent::update)
         //.def("get_actions", &Agent::getActions)
         .def("get_state", &Agent::getState)
         .def("is_landed", &Agent::isLanded)
-        .def("is_crashed", &Agent::isCrashed);
-}
\ No newline at end of file
+        .def("is_crashed", &Agent::isCrashed)
+        .def("step", &Agent::step, py::arg("throttle"))
+        .def_property_readonly("state_buffer", &state_buffer_view<Agent>);
+    def_rollout<Agent>(py_agent);
+    def_reset<Agent>(py_agent);
+    def_snapshot<Agent>(py_agent);
+    def_reward<Agent>(py_agent);
+    def_policy<Agent>(py_agent);
+
+    // bound directly, without the PyAgent trampoline, for the hot path. it cannot be subclassed from Python
+    py::class_<FastAgent> fast_agent(m, "FastAgent");
+    fast_agent
+        .def(py::init<>())
+        .def("update", [](FastAgent &agent, std::tuple<double> actions)
+             { agent.update(actions); })
+        .def("get_state", [](FastAgent &agent)
+             { return agent.getState(); })
+        .def("is_landed", [](const FastAgent &agent)
+             { return agent.isLanded(); })
+        .def("is_crashed", [](const FastAgent &agent)
+             { return agent.isCrashed(); })
+        .def("step", &FastAgent::step, py::arg("throttle"))
+        .def_property_readonly("state_buffer", &state_buffer_view<FastAgent>);
+    def_rollout<FastAgent>(fast_agent);
+    def_reset<FastAgent>(fast_agent);
+    def_snapshot<FastAgent>(fast_agent);
+    def_reward<FastAgent>(fast_agent);
+    def_policy<FastAgent>(fast_agent);
+
+    py::class_<BatchAgent>(m, "PyBatchAgent")
+        .def(py::init<int, int>(), py::arg("n_agents"), py::arg("n_threads") = 1)
+        .def("__len__", &BatchAgent::size)
+        .def_readwrite("n_threads", &BatchAgent::n_threads)
+        .def(
+            "reset",
+            [](BatchAgent &batch, double_array init_conditions)
+            {
+                if (init_conditions.ndim() != 2 || init_conditions.shape(0) != batch.size() || init_conditions.shape(1) != N_INIT_CONDITIONS)
+                    throw py::value_error("init_conditions must have shape (n_agents, 9)");
+                batch.reset(init_conditions.data());
+                py::array_t<double> states({(py::ssize_t)batch.size(), (py::ssize_t)N_STATE});
+                batch.getStates(states.mutable_data());
+                return states;
+            },
+            py::arg("init_conditions"))
+        .def(
+            "reset_agent",
+            [](BatchAgent &batch, int index, double_array init_conditions)
+            {
+                if (index < 0 || index >= batch.size())
+                    throw py::index_error("agent index out of range");
+                if (init_conditions.size() != N_INIT_CONDITIONS)
+                    throw py::value_error("init_conditions must have 9 values");
+                batch.resetAgent(index, init_conditions.data());
+                py::array_t<double> state(N_STATE);
+                write_state(batch.agents[index].simulation, state.mutable_data());
+                return state;
+            },
+            py::arg("index"), py::arg("init_conditions"))
+        .def(
+            "step",
+            [](BatchAgent &batch, double_array throttles)
+            {
+                if (throttles.ndim() != 1 || throttles.shape(0) != batch.size())
+                    throw py::value_error("throttles must have shape (n_agents,)");
+                py::array_t<double> states({(py::ssize_t)batch.size(), (py::ssize_t)N_STATE});
+                py::array_t<bool> landed(batch.size());
+                py::array_t<bool> crashed(batch.size());
+                {
+                    // the simulations never touch Python objects, so other Python threads can run meanwhile
+                    py::gil_scoped_release release;
+                    batch.update(throttles.data());
+                }
+                batch.getStates(states.mutable_data());
+                batch.getFlags(landed.mutable_data(), crashed.mutable_data());
+                return py::make_tuple(states, landed, crashed);
+            },
+            py::arg("throttles"));
+
+#ifdef LANDER_PROFILE
+    m.attr("PROFILING") = true;
+#else
+    m.attr("PROFILING") = false;
+#endif
+    m.def(
+        "profile_counters", []()
+        {
+            unsigned long long calls[N_PROFILE_PHASES];
+            double seconds[N_PROFILE_PHASES];
+            read_profile_counters(calls, seconds);
+            py::dict counters;
+            for (int i = 0; i < N_PROFILE_PHASES; i++)
+            {
+                py::dict phase;
+                phase["calls"] = calls[i];
+                phase["seconds"] = seconds[i];
+                counters[profile_phase_names[i]] = phase;
+            }
+            return counters; },
+        "calls and total seconds of every phase of the steps so far, over all agents. all zero unless the module "
+        "was built with -DLANDER_PROFILE=ON (see PROFILING)");
+    m.def("reset_profile_counters", &reset_profile_counters);
+
+    m.def("evaluate_autopilot_gains", &evaluate_autopilot_gains_py,
+          "Land with the proportional autopilot for every (K_h, K_p, delta) row of gains and every row of init_conditions, "
+          "spread over n_threads threads (0 uses every core)",
+          py::arg("gains"), py::arg("init_conditions"), py::arg("max_steps") = 20000, py::arg("n_threads") = 0);
+    m.def("proportional_throttle", &proportional_throttle_py,
+          "Throttle of the proportional autopilot, clamped to [0, 1], for a state as get_state returns it and "
+          "(K_h, K_p, delta) gains",
+          py::arg("state"), py::arg("gains") = std::make_tuple(autopilot_gains.K_h, autopilot_gains.K_p, autopilot_gains.delta));
+    m.def("evaluate_policy", &evaluate_policy_py,
+          "Land with a trained MlpPolicy from every row of init_conditions, choosing a throttle every frame_skip steps, "
+          "spread over n_threads threads (0 uses every core)",
+          py::arg("policy"), py::arg("init_conditions"), py::arg("max_steps") = 20000, py::arg("frame_skip") = 1,
+          py::arg("n_threads") = 0);
+    m.def("propagate_orbits", &propagate_orbits_py,
+          "Free fall around a point mass with gravitational parameter gm for every row of r0 and v0, with the \"euler\" "
+          "or \"verlet\" loops of src/orbits.py, keeping every every-th step. spread over n_threads threads "
+          "(0 uses every core)",
+          py::arg("method"), py::arg("r0"), py::arg("v0"), py::arg("dt"), py::arg("n_steps"), py::arg("every"),
+          py::arg("gm"), py::arg("n_samples"), py::arg("n_threads") = 0);
+}
@@ -1,84 +1,106 @@
 // Abstracting out autopilot code
 
-#include "lander.h"
+#include "lander_core.h"
+#include <thread>
+#include <atomic>
+#include <algorithm>
 
-// Constants
-double K_h = 2e-2;
-double K_p = 2;
-double delta = 0.5;
+// Constants: K_h, K_p, delta
+autopilot_gains_t autopilot_gains = {2e-2, 2, 0.5};
 
 // actually declare the agent here. this should be globally accessible!
 Agent agent;
+// whether autopilot() hands over to the agent (autopilot_agent) or flies the proportional controller
+bool agent_flag = true;
 
 // Calculate error
-double calculate_error()
+double calculate_error(const simulation_state_t &sim, double K_h)
 {
-    double altitude = position.abs() - MARS_RADIUS;
-    vector3d pos_norm = position.norm();                  // Position unit vector
-    return -(0.5 + K_h * altitude + velocity * pos_norm); // Scalar product of velocity and position unit vector, custom implementation
+    double altitude = sim.position.abs() - MARS_RADIUS;
+    vector3d pos_norm = sim.position.norm();                  // Position unit vector
+    return -(0.5 + K_h * altitude + sim.velocity * pos_norm); // Scalar product of velocity and position unit vector, custom implementation
 }
 
-void autopilot(void)
-// Autopilot to adjust the engine throttle, parachute and attitude control
+double proportional_throttle(const simulation_state_t &sim, const autopilot_gains_t &gains)
+// throttle from the proportional controller, clamped to [0, 1]
 {
-    if (!agent_flag)
+    // Calculate (pure) controller output
+    double P_out = gains.K_p * calculate_error(sim, gains.K_h);
+
+    if (P_out <= -gains.delta)
     {
-        autopilot_control();
+        return 0;
+    }
+    else if (P_out > -gains.delta && P_out < 1 - gains.delta)
+    {
+        return P_out + gains.delta;
     }
     else
     {
-        autopilot_agent();
+        return 1;
     }
 }
 
-void autopilot_control(void)
+bool should_deploy_parachute(const simulation_state_t &sim)
+// the parachute goes out once it is safe to deploy and the lander is decelerating. called by the autopilots
+// after numerical_dynamics, so the engine is already up to date and the acceleration can be worked out without
+// going through the engine model again
 {
-    // Calculate (pure) controller output
-    double error, P_out;
-    error = calculate_error();
-    P_out = K_p * error;
-
-    // Calculate if it is safe to deploy the parachute
-
-    // First calculate if the lander is decelerating
-    vector3d acceleration = get_acceleration();
-    bool decelerating = (acceleration * velocity < 0);
-
-    // Then check if it is safe in general and decelerating
-    if (safe_to_deploy_parachute() && decelerating)
-    {
-        parachute_status = DEPLOYED;
-    }
+    // deploying again would change nothing: it is out already, or it was lost and update_visualization
+    // would mark it lost again straight away
+    if (sim.parachute_status == DEPLOYED || (sim.parachute_status == LOST && sim.parachute_lost))
+        return false;
+    // the cheaper check first, most steps fail it
+    if (!safe_to_deploy_parachute(sim))
+        return false;
+    bool decelerating = (current_acceleration(sim) * sim.velocity < 0);
+    return decelerating;
+}
 
-    // Calculate throttle
-    if (P_out <= -delta)
+void autopilot(simulation_state_t &sim)
+// Autopilot to adjust the engine throttle, parachute and attitude control
+{
+    if (!agent_flag)
     {
-        throttle = 0;
+        autopilot_control(sim);
     }
-    else if (P_out > -delta && P_out < 1 - delta)
+    else
     {
-        throttle = P_out + delta;
+        autopilot_agent(sim);
     }
-    else
+}
+
+void autopilot_control(simulation_state_t &sim)
+{
+    // Calculate if it is safe to deploy the parachute
+    if (should_deploy_parachute(sim))
     {
-        throttle = 1;
+        sim.parachute_status = DEPLOYED;
     }
+
+    // Calculate throttle
+    sim.throttle = proportional_throttle(sim, autopilot_gains);
 }
 
-void autopilot_agent(void)
+void autopilot_agent(simulation_state_t &sim)
 {
     // PARACHUTE ALGORITHIM GENERIC
-    //  First calculate if the lander is decelerating
-    vector3d acceleration = get_acceleration();
-    bool decelerating = (acceleration * velocity < 0);
+    if (should_deploy_parachute(sim))
+    {
+        sim.parachute_status = DEPLOYED;
+    }
 
-    // Then check if it is safe in general and decelerating
-    if (safe_to_deploy_parachute() && decelerating)
+    // a trained policy flies it, if one is loaded. this runs inside the step, after the integration, so the
+    // altitude, climb speed and fuel it sees are still those of the last update_visualization. Agent::runPolicy
+    // chooses between steps instead, exactly as LanderEnv does
+    if (sim.policy != NULL)
     {
-        parachute_status = DEPLOYED;
+        double state[N_STATE];
+        write_state(sim, state);
+        sim.throttle = sim.policy->throttle(state);
     }
 
-    // I CANT SEEM TO ACCESS GLOBAL AGENT ACTIONS, SO IVE SET THROTTLE IN UPDATE
+    // without a policy, the throttle is set in Agent::update
 
     // // get the first element of a tuple
     // double throttle_action = std::get<0>(agent.actions);
@@ -99,4 +121,124 @@ void autopilot_agent(void)
     //           // action made
     //           << " Throttle Action: " << throttle
     //           << endl;
-}
\ No newline at end of file
+}
+
+/**
+ * GAIN TUNING. Lands the lander with the proportional controller, for many gains and initial conditions at once
+ *
+ */
+
+autopilot_score_t run_autopilot_episode(const autopilot_gains_t &gains, const double *init_conditions, int max_steps)
+// one landing from init_conditions, with the controller choosing the throttle before every step,
+// the same way LanderEnv.landing_control_policy drives the environment
+{
+    Agent lander;
+    autopilot_score_t score;
+    simulation_state_t &sim = lander.simulation;
+
+    lander.reset(vector<double>(init_conditions, init_conditions + N_INIT_CONDITIONS));
+    double initial_fuel = sim.fuel;
+
+    for (score.steps = 0; score.steps < max_steps && !sim.landed; score.steps++)
+    {
+        sim.throttle = proportional_throttle(sim, gains);
+        update_lander_state(sim);
+    }
+
+    score.fuel_used = (initial_fuel - sim.fuel) * FUEL_CAPACITY;
+    score.descent_rate = -sim.climb_speed;
+    score.ground_speed = sim.ground_speed;
+    score.landed = sim.landed;
+    score.crashed = sim.crashed;
+    return score;
+}
+
+WorkerPool::~WorkerPool()
+{
+    {
+        std::lock_guard<std::mutex> lock(this->mutex);
+        this->stopping = true;
+    }
+    this->wake.notify_all();
+    for (auto &thread : this->threads)
+        thread.join();
+}
+
+void WorkerPool::take_tasks()
+{
+    for (int i = this->next_task++; i < this->n_tasks; i = this->next_task++)
+        (*this->task)(i);
+}
+
+void WorkerPool::work(int index)
+// the loop of pool thread index, which joins the runs that ask for more than index + 1 workers
+{
+    unsigned long long seen = 0;
+    std::unique_lock<std::mutex> lock(this->mutex);
+    while (true)
+    {
+        this->wake.wait(lock, [&]
+                        { return this->stopping || this->generation != seen; });
+        if (this->stopping)
+            return;
+        seen = this->generation;
+        if (index >= this->n_joining)
+            continue;
+        lock.unlock();
+        this->take_tasks();
+        lock.lock();
+        if (--this->n_busy == 0)
+            this->done.notify_one();
+    }
+}
+
+void WorkerPool::run(int n_tasks, int n_workers, const std::function<void(int)> &task)
+{
+    std::lock_guard<std::mutex> run_lock(this->run_mutex);
+    n_workers = std::min(n_workers, n_tasks);
+    if (n_workers <= 1)
+    {
+        for (int i = 0; i < n_tasks; i++)
+            task(i);
+        return;
+    }
+
+    {
+        std::unique_lock<std::mutex> lock(this->mutex);
+        while ((int)this->threads.size() < n_workers - 1)
+            this->threads.push_back(std::thread(&WorkerPool::work, this, (int)this->threads.size()));
+        this->task = &task;
+        this->n_tasks = n_tasks;
+        this->next_task = 0;
+        this->n_joining = n_workers - 1;
+        this->n_busy = n_workers - 1;
+        this->generation++;
+    }
+    this->wake.notify_all();
+    this->take_tasks();
+
+    // the tasks may all be taken while some threads are still finishing theirs
+    std::unique_lock<std::mutex> lock(this->mutex);
+    this->done.wait(lock, [&]
+                    { return this->n_busy == 0; });
+}
+
+void run_parallel_tasks(int n_tasks, int n_threads, const std::function<void(int)> &task)
+{
+    // never destroyed, so its threads need not be joined while the process exits
+    static WorkerPool *pool = new WorkerPool();
+
+    if (n_threads < 1)
+        n_threads = std::max(1, (int)std::thread::hardware_concurrency());
+    pool->run(n_tasks, n_threads, task);
+}
+
+void evaluate_autopilot_gains(const autopilot_gains_t *gains, int n_gains, const double *init_conditions, int n_episodes,
+                              int max_steps, int n_threads, autopilot_score_t *scores)
+// runs every gain on every initial condition. scores has n_gains rows of n_episodes
+{
+    run_parallel_tasks(n_gains * n_episodes, n_threads, [&](int task)
+                       {
+                           int i = task / n_episodes, j = task % n_episodes;
+                           scores[task] = run_autopilot_episode(gains[i], init_conditions + j * N_INIT_CONDITIONS, max_steps); });
+}
@@ -12,32 +12,46 @@
 // to receive any suggested modifications by private correspondence to
 // ahg@eng.cam.ac.uk and gc121@eng.cam.ac.uk.
 
-#include "lander.h"
+#include "lander_core.h"
 // this is for using the value of pi as constant M_PI
 #include <cmath>
 
-vector3d get_acceleration(void)
+vector3d gravity_force(const vector3d &pos, double gm)
+// the gravitational force on a body at pos from a point mass at the origin, with gm the product of the gravitational
+// constant and both masses. the propagate_orbits loops take gm = G M for the acceleration. zero at the origin itself
+{
+  double r2 = pos.abs2();
+  if (r2 == 0.0)
+    return vector3d(0.0, 0.0, 0.0);
+  // the unit vector of position, divided by the norm squared
+  return -gm * pos.norm() / r2;
+}
+
+vector3d acceleration_at(const simulation_state_t &sim, const vector3d &pos, const vector3d &vel, const vector3d &f_thrust)
+// acceleration of the lander if it were at pos with velocity vel, with thrust force f_thrust.
+// the mass and the parachute are taken from sim, the higher-order integrators call this at their trial points
 {
   // declare the types of all our variables used
-  vector3d a_total, f_gravity, f_thrust, lander_drag, chute_drag;
-  double mass;
+  vector3d a_total, f_gravity, lander_drag, chute_drag;
+  double mass, density;
 
   // get current mass
-  mass = UNLOADED_LANDER_MASS + FUEL_DENSITY * FUEL_CAPACITY * fuel;
+  mass = UNLOADED_LANDER_MASS + FUEL_DENSITY * FUEL_CAPACITY * sim.fuel;
 
-  // first get the acceleration due only to gravity, get the unit vector of position, then divide by the norm squared
-  f_gravity = -(GRAVITY * MARS_MASS * mass) * position.norm() / position.abs2();
+  // first get the force due only to gravity
+  f_gravity = gravity_force(pos, GRAVITY * MARS_MASS * mass);
 
-  f_thrust = thrust_wrt_world();
+  // the lander and the parachute drag share one density lookup
+  density = atmospheric_density(pos);
 
   // multiply by the relevant constants to the velocity unit vector, lander area has a circular base
-  lander_drag = -0.5 * atmospheric_density(position) * DRAG_COEF_LANDER * (M_PI * pow(LANDER_SIZE, 2)) * velocity.abs2() * velocity.norm();
+  lander_drag = -0.5 * density * DRAG_COEF_LANDER * (M_PI * pow(LANDER_SIZE, 2)) * vel.abs2() * vel.norm();
 
   // if parachute deployed, get that drag too
-  if (parachute_status == DEPLOYED)
+  if (sim.parachute_status == DEPLOYED)
   {
     // the parachute area trumps the lander area, 5 sqaures each of length 2* lander size
-    chute_drag = -0.5 * atmospheric_density(position) * DRAG_COEF_LANDER * (5.0 * 2.0 * LANDER_SIZE * 2.0 * LANDER_SIZE) * velocity.abs2() * velocity.norm();
+    chute_drag = -0.5 * density * DRAG_COEF_LANDER * (5.0 * 2.0 * LANDER_SIZE * 2.0 * LANDER_SIZE) * vel.abs2() * vel.norm();
   }
   else
   {
@@ -49,75 +63,163 @@ vector3d get_acceleration(void)
   return a_total;
 }
 
-void euler_method()
+vector3d get_acceleration(simulation_state_t &sim)
+// acceleration at the current position and velocity
+{
+  vector3d f_thrust = thrust_wrt_world(sim);
+  return acceleration_at(sim, sim.position, sim.velocity, f_thrust);
+}
+
+vector3d current_acceleration(const simulation_state_t &sim)
+// the same, but with the engine as it is, so nothing in sim changes. once numerical_dynamics has updated the
+// engine for this step, get_acceleration gives exactly this, at the cost of going through the engine model again
+{
+  return acceleration_at(sim, sim.position, sim.velocity, thrust_force(sim));
+}
+
+void euler_method(simulation_state_t &sim)
 // run simulation using euler method
 {
-  // note that position and velocity are global variables!
+  // note that position and velocity belong to the simulation passed in!
   vector3d acceleration;
 
   // // first value of position must use euler as 2 values of position needed for verlet
-  if (simulation_time == 0)
+  if (sim.simulation_time == 0)
   {
     // update acceleration
-    acceleration = get_acceleration();
+    acceleration = get_acceleration(sim);
     // use a variable to store previous position
-    position = position + delta_t * velocity;
-    velocity = velocity + delta_t * acceleration;
+    sim.position = sim.position + sim.delta_t * sim.velocity;
+    sim.velocity = sim.velocity + sim.delta_t * acceleration;
   }
 }
 
-void verlet_method()
+// All the integrators below hold the thrust force at its value at the start of the step, the same way
+// the throttle is held, and take sim.n_substeps steps of delta_t / n_substeps each
+
+void verlet_method(simulation_state_t &sim, const vector3d &f_thrust)
 // run the simulation using verlet method
 {
-  // note that position and velocity are global variables!
+  // note that position and velocity belong to the simulation passed in!
   vector3d acceleration, position_next;
+  double h = sim.delta_t / sim.n_substeps;
 
-  // we use a static variable for previous position so when calling the function again, we can simply get the previous value
-  static vector3d position_prev;
-
-  // // first value of position must use euler as 2 values of position needed for verlet
-  if (simulation_time == 0)
+  for (int i = 0; i < sim.n_substeps; i++)
   {
-    // first step,we step forward once, initialize the position and position_prev, using euler method
-    acceleration = get_acceleration();
-    position_prev = position;
-    position = position + velocity * delta_t;
+    // update acceleration
+    acceleration = acceleration_at(sim, sim.position, sim.velocity, f_thrust);
+
+    // // first value of position must use euler as 2 values of position needed for verlet
+    if (sim.simulation_time == 0 && i == 0)
+    {
+      // first step,we step forward once, initialize the position and position_prev, using euler method
+      sim.position_prev = sim.position;
+      sim.position = sim.position + sim.velocity * h;
+    }
+    else
+    {
+      // use a variable to store previous position
+      position_next = sim.position * 2 - sim.position_prev + acceleration * h * h;
+      sim.velocity = (position_next - sim.position_prev) * 0.5 / h;
+
+      // x_prev <- x, move one step forward
+      sim.position_prev = sim.position;
+      // x <- x_next, move one step forward
+      sim.position = position_next;
+    }
   }
-  else
+}
+
+void rk4_method(simulation_state_t &sim, const vector3d &f_thrust)
+// classical 4th order Runge-Kutta on position and velocity
+{
+  vector3d k1_x, k1_v, k2_x, k2_v, k3_x, k3_v, k4_x, k4_v;
+  double h = sim.delta_t / sim.n_substeps;
+
+  for (int i = 0; i < sim.n_substeps; i++)
   {
-    // update acceleration
-    acceleration = get_acceleration();
-    // use a variable to store previous position
-    position_next = position * 2 - position_prev + acceleration * delta_t * delta_t;
-    velocity = (position_next - position_prev) * 0.5 / delta_t;
+    k1_x = sim.velocity;
+    k1_v = acceleration_at(sim, sim.position, sim.velocity, f_thrust);
+    k2_x = sim.velocity + 0.5 * h * k1_v;
+    k2_v = acceleration_at(sim, sim.position + 0.5 * h * k1_x, k2_x, f_thrust);
+    k3_x = sim.velocity + 0.5 * h * k2_v;
+    k3_v = acceleration_at(sim, sim.position + 0.5 * h * k2_x, k3_x, f_thrust);
+    k4_x = sim.velocity + h * k3_v;
+    k4_v = acceleration_at(sim, sim.position + h * k3_x, k4_x, f_thrust);
 
-    // x_prev <- x, move one step forward
-    position_prev = position;
-    // x <- x_next, move one step forward
-    position = position_next;
+    sim.position_prev = sim.position;
+    sim.position += (h / 6.0) * (k1_x + 2.0 * k2_x + 2.0 * k3_x + k4_x);
+    sim.velocity += (h / 6.0) * (k1_v + 2.0 * k2_v + 2.0 * k3_v + k4_v);
   }
 }
 
-// numerical dynamics now takes in an agent
-void numerical_dynamics(void)
+void yoshida_method(simulation_state_t &sim, const vector3d &f_thrust)
+// Yoshida's 4th order integrator, three leapfrog (drift-kick-drift) steps of sizes w1, w0, w1.
+// symplectic for gravity alone; drag depends on velocity, so there it is evaluated with the latest velocity
+{
+  // w1 = 1 / (2 - 2^(1/3)), w0 = -2^(1/3) w1
+  static const double w1 = 1.0 / (2.0 - cbrt(2.0));
+  static const double w0 = -cbrt(2.0) * w1;
+  static const double c[4] = {0.5 * w1, 0.5 * (w0 + w1), 0.5 * (w0 + w1), 0.5 * w1};
+  static const double d[3] = {w1, w0, w1};
+  double h = sim.delta_t / sim.n_substeps;
+
+  for (int i = 0; i < sim.n_substeps; i++)
+  {
+    sim.position_prev = sim.position;
+    for (int j = 0; j < 3; j++)
+    {
+      sim.position += c[j] * h * sim.velocity;
+      sim.velocity += d[j] * h * acceleration_at(sim, sim.position, sim.velocity, f_thrust);
+    }
+    sim.position += c[3] * h * sim.velocity;
+  }
+}
+
+// numerical dynamics now takes in the simulation to advance
+void numerical_dynamics(simulation_state_t &sim)
 // This is the function that performs the numerical integration to update the
-// lander's pose. The time step is delta_t (global variable).
+// lander's pose. The time step is sim.delta_t.
 {
   // FIRST UPDATE POSITION WITH CURRENT THROTTLE
-  //  change this for the mode
-  verlet_method();
+  // the thrust (and the engine lag and delay behind it) is worked out once per step
+  {
+    PROFILE_SCOPE(PROFILE_INTEGRATOR);
+    vector3d f_thrust = thrust_wrt_world(sim);
+    switch (sim.integrator)
+    {
+    case RK4:
+      rk4_method(sim, f_thrust);
+      break;
+    case YOSHIDA:
+      yoshida_method(sim, f_thrust);
+      break;
+    default:
+      verlet_method(sim, f_thrust);
+      break;
+    }
+  }
 
   // THEN UPDATE THROTTLE FOR THE NEXT STEP
   //  Here we can apply an autopilot to adjust the thrust, parachute and attitude
-  if (autopilot_enabled)
-    autopilot();
+  if (sim.autopilot_enabled)
+  {
+    PROFILE_SCOPE(PROFILE_AUTOPILOT);
+    autopilot(sim);
+  }
 
   // Here we can apply 3-axis stabilization to ensure the base is always pointing downwards
-  if (stabilized_attitude)
-    attitude_stabilization();
+  if (sim.stabilized_attitude)
+  {
+    PROFILE_SCOPE(PROFILE_ATTITUDE);
+    attitude_stabilization(sim);
+  }
 }
 
-void initialize_simulation(void)
+// the scenario initialize_simulation sets up, chosen with the number keys in the graphics engine
+unsigned short scenario = 0;
+
+void initialize_simulation(simulation_state_t &sim)
 // Lander pose initialization - selects one of 10 possible scenarios
 {
   // The parameters to set are:
@@ -126,86 +228,76 @@ void initialize_simulation(void)
   // orientation - in lander coordinate system (xyz Euler angles, degrees)
   // delta_t - the simulation time step
   // boolean state variables - parachute_status, stabilized_attitude, autopilot_enabled
-  // scenario_description - a descriptive string for the help screen
-
-  scenario_description[0] = "circular orbit";
-  scenario_description[1] = "descent from 10km";
-  scenario_description[2] = "elliptical orbit, thrust changes orbital plane";
-  scenario_description[3] = "polar launch at escape velocity (but drag prevents escape)";
-  scenario_description[4] = "elliptical orbit that clips the atmosphere and decays";
-  scenario_description[5] = "descent from 200km";
-  scenario_description[6] = "";
-  scenario_description[7] = "";
-  scenario_description[8] = "";
-  scenario_description[9] = "";
+  // the descriptive strings for the help screen are in scenario_description, in lander_graphics.cpp.
+  // they are not written here, so that simulations can be reset from several threads at once
 
   switch (scenario)
   {
 
   case 0:
     // a circular equatorial orbit
-    position = vector3d(1.2 * MARS_RADIUS, 0.0, 0.0);
-    velocity = vector3d(0.0, -3247.087385863725, 0.0);
-    orientation = vector3d(0.0, 90.0, 0.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = false;
-    autopilot_enabled = true;
+    sim.position = vector3d(1.2 * MARS_RADIUS, 0.0, 0.0);
+    sim.velocity = vector3d(0.0, -3247.087385863725, 0.0);
+    sim.orientation = vector3d(0.0, 90.0, 0.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = false;
+    sim.autopilot_enabled = true;
     break;
 
   case 1:
     // a descent from rest at 10km altitude
-    position = vector3d(0.0, -(MARS_RADIUS + 10000.0), 0.0);
-    velocity = vector3d(0.0, 0.0, 0.0);
-    orientation = vector3d(0.0, 0.0, 910.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = true;
-    autopilot_enabled = true;
+    sim.position = vector3d(0.0, -(MARS_RADIUS + 10000.0), 0.0);
+    sim.velocity = vector3d(0.0, 0.0, 0.0);
+    sim.orientation = vector3d(0.0, 0.0, 910.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = true;
+    sim.autopilot_enabled = true;
     break;
 
   case 2:
     // an elliptical polar orbit
-    position = vector3d(0.0, 0.0, 1.2 * MARS_RADIUS);
-    velocity = vector3d(3500.0, 0.0, 0.0);
-    orientation = vector3d(0.0, 0.0, 90.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = false;
-    autopilot_enabled = true;
+    sim.position = vector3d(0.0, 0.0, 1.2 * MARS_RADIUS);
+    sim.velocity = vector3d(3500.0, 0.0, 0.0);
+    sim.orientation = vector3d(0.0, 0.0, 90.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = false;
+    sim.autopilot_enabled = true;
     break;
 
   case 3:
     // polar surface launch at escape velocity (but drag prevents escape)
-    position = vector3d(0.0, 0.0, MARS_RADIUS + LANDER_SIZE / 2.0);
-    velocity = vector3d(0.0, 0.0, 5027.0);
-    orientation = vector3d(0.0, 0.0, 0.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = true;
-    autopilot_enabled = true;
+    sim.position = vector3d(0.0, 0.0, MARS_RADIUS + LANDER_SIZE / 2.0);
+    sim.velocity = vector3d(0.0, 0.0, 5027.0);
+    sim.orientation = vector3d(0.0, 0.0, 0.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = true;
+    sim.autopilot_enabled = true;
     break;
 
   case 4:
     // an elliptical orbit that clips the atmosphere each time round, losing energy
-    position = vector3d(0.0, 0.0, MARS_RADIUS + 100000.0);
-    velocity = vector3d(4000.0, 0.0, 0.0);
-    orientation = vector3d(0.0, 90.0, 0.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = false;
-    autopilot_enabled = true;
+    sim.position = vector3d(0.0, 0.0, MARS_RADIUS + 100000.0);
+    sim.velocity = vector3d(4000.0, 0.0, 0.0);
+    sim.orientation = vector3d(0.0, 90.0, 0.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = false;
+    sim.autopilot_enabled = true;
     break;
 
   case 5:
     // a descent from rest at the edge of the exosphere
-    position = vector3d(0.0, -(MARS_RADIUS + EXOSPHERE), 0.0);
-    velocity = vector3d(0.0, 0.0, 0.0);
-    orientation = vector3d(0.0, 0.0, 90.0);
-    delta_t = 0.1;
-    parachute_status = NOT_DEPLOYED;
-    stabilized_attitude = false;
-    autopilot_enabled = true;
+    sim.position = vector3d(0.0, -(MARS_RADIUS + EXOSPHERE), 0.0);
+    sim.velocity = vector3d(0.0, 0.0, 0.0);
+    sim.orientation = vector3d(0.0, 0.0, 90.0);
+    sim.delta_t = 0.1;
+    sim.parachute_status = NOT_DEPLOYED;
+    sim.stabilized_attitude = false;
+    sim.autopilot_enabled = true;
     break;
 
   case 6:
@@ -12,27 +12,21 @@
 // to receive any suggested modifications by private correspondence to
 // ahg@eng.cam.ac.uk and gc121@eng.cam.ac.uk.
 
-#ifdef _WIN32
-#define _USE_MATH_DEFINES
-#include <windows.h>
-#else
-#include <sys/time.h>
-#include <unistd.h>
-#endif
+#ifndef LANDER_H
+#define LANDER_H
+
 #ifdef __APPLE__
 #include <GLUT/glut.h>
 #else
 #include <GL/glut.h>
 #endif
-#include <iostream>
-#include <string>
-#include <sstream>
-#include <fstream>
-#include <cmath>
-#include <cstdlib>
 
-#include <vector>
-#include <tuple>
+#include "lander_core.h"
+#include <cstring>
+#include <map>
+#ifndef _WIN32
+#include <sys/stat.h>
+#endif
 
 // GLUT mouse wheel operations work under Linux only
 #if !defined(GLUT_WHEEL_UP)
@@ -42,7 +36,6 @@
 
 // Graphics constants
 #define GAP 5
-#define SMALL_NUM 0.0000001
 #define N_RAND 20000
 #define PREFERRED_WIDTH 1024
 #define PREFERRED_HEIGHT 768
@@ -53,136 +46,12 @@
 #define TRANSITION_ALTITUDE 10000.0
 #define TRANSITION_ALTITUDE_NO_TEXTURE 4000.0
 #define TERRAIN_TEXTURE_SIZE 1024
+#define TERRAIN_TEXTURE_MAGIC "LNDRTEX1" // the start of a cached terrain texture, see save_terrain_texture
 #define INNER_DIAL_RADIUS 65.0
 #define OUTER_DIAL_RADIUS 75.0
 #define MAX_DELAY 160000
-#define N_TRACK 1000
-#define TRACK_DISTANCE_DELTA 100000.0
-#define TRACK_ANGLE_DELTA 0.999
 #define HEAT_FLUX_GLOW_THRESHOLD 1000000.0
 
-// Mars constants
-#define MARS_RADIUS 3386000.0 // (m)
-#define MARS_MASS 6.42E23     // (kg)
-#define GRAVITY 6.673E-11     // (m^3/kg/s^2)
-#define MARS_DAY 88642.65     // (s)
-#define EXOSPHERE 200000.0    // (m)
-
-// Lander constants
-#define LANDER_SIZE 1.0             // (m)
-#define UNLOADED_LANDER_MASS 100.0  // (kg)
-#define FUEL_CAPACITY 100.0         // (l)
-#define FUEL_RATE_AT_MAX_THRUST 0.5 // (l/s)
-#define FUEL_DENSITY 1.0            // (kg/l)
-// MAX_THRUST, as defined below, is 1.5 * weight of fully loaded lander at surface
-#define MAX_THRUST (1.5 * (FUEL_DENSITY * FUEL_CAPACITY + UNLOADED_LANDER_MASS) * (GRAVITY * MARS_MASS / (MARS_RADIUS * MARS_RADIUS))) // (N)
-#define ENGINE_LAG 0.0                                                                                                                 // (s)
-#define ENGINE_DELAY 0.0                                                                                                               // (s)
-#define DRAG_COEF_CHUTE 2.0
-#define DRAG_COEF_LANDER 1.0
-#define MAX_PARACHUTE_DRAG 20000.0  // (N)
-#define MAX_PARACHUTE_SPEED 500.0   // (m/s)
-#define THROTTLE_GRANULARITY 20     // for manual control
-#define MAX_IMPACT_GROUND_SPEED 1.0 // (m/s)
-#define MAX_IMPACT_DESCENT_RATE 1.0 // (m/s)
-
-using namespace std;
-
-class vector3d
-{
-  // Utility class for three-dimensional vector operations
-public:
-  vector3d()
-  {
-    x = 0.0;
-    y = 0.0;
-    z = 0.0;
-  }
-  vector3d(double a, double b, double c = 0.0)
-  {
-    x = a;
-    y = b;
-    z = c;
-  }
-  bool operator==(const vector3d &v) const
-  {
-    if ((x == v.x) && (y == v.y) && (z == v.z))
-      return true;
-    else
-      return false;
-  }
-  bool operator!=(const vector3d &v) const
-  {
-    if ((x != v.x) || (y != v.y) || (z != v.z))
-      return true;
-    else
-      return false;
-  }
-  vector3d operator+(const vector3d &v) const { return vector3d(x + v.x, y + v.y, z + v.z); }
-  vector3d operator-(const vector3d &v) const { return vector3d(x - v.x, y - v.y, z - v.z); }
-  friend vector3d operator-(const vector3d &v) { return vector3d(-v.x, -v.y, -v.z); }
-  vector3d &operator+=(const vector3d &v)
-  {
-    x += v.x;
-    y += v.y;
-    z += v.z;
-    return *this;
-  }
-  vector3d &operator-=(const vector3d &v)
-  {
-    x -= v.x;
-    y -= v.y;
-    z -= v.z;
-    return *this;
-  }
-  vector3d operator^(const vector3d &v) const { return vector3d(y * v.z - z * v.y, z * v.x - x * v.z, x * v.y - y * v.x); }
-  double operator*(const vector3d &v) const { return (x * v.x + y * v.y + z * v.z); }
-  friend vector3d operator*(const vector3d &v, const double &a) { return vector3d(v.x * a, v.y * a, v.z * a); }
-  friend vector3d operator*(const double &a, const vector3d &v) { return vector3d(v.x * a, v.y * a, v.z * a); }
-  vector3d &operator*=(const double &a)
-  {
-    x *= a;
-    y *= a;
-    z *= a;
-    return *this;
-  }
-  vector3d operator/(const double &a) const { return vector3d(x / a, y / a, z / a); }
-  vector3d &operator/=(const double &a)
-  {
-    x /= a;
-    y /= a;
-    z /= a;
-    return *this;
-  }
-  double abs2() const { return (x * x + y * y + z * z); }
-  double abs() const { return sqrt(this->abs2()); }
-  vector3d norm() const
-  {
-    double s(this->abs());
-    if (s == 0)
-      return *this;
-    else
-      return vector3d(x / s, y / s, z / s);
-  }
-  friend ostream &operator<<(ostream &out, const vector3d &v)
-  {
-    out << v.x << ' ' << v.y << ' ' << v.z;
-    return out;
-  }
-  double x, y, z;
-
-private:
-};
-
-// Data type for recording lander's previous positions
-struct track_t
-{
-  unsigned short n;
-  unsigned short p;
-  // this is an array of vector 3d objects
-  vector3d pos[N_TRACK];
-};
-
 // Quaternions for orbital view transformation
 struct quat_t
 {
@@ -190,90 +59,47 @@ struct quat_t
   double s;
 };
 
-// Data structure for the state of the close-up view's coordinate system
-struct closeup_coords_t
-{
-  bool initialized;
-  bool backwards;
-  vector3d right;
-};
-
-// Enumerated data type for parachute status
-enum parachute_status_t
-{
-  NOT_DEPLOYED = 0,
-  DEPLOYED = 1,
-  LOST = 2
-};
-
-/**
- * Our Agent class. this will be wrapped in Python.
- *
- *
- *
- */
-
-class Agent
-{
-public:
-  Agent();
-  // the virtual declarations here allow overriding of functions, from inherited classes!
-  virtual ~Agent() = default; // Add a virtual destructor
-  // reset and step very similar to gym env
-  virtual vector<double> reset(vector<double> init_conditions);
-  virtual void update(tuple<double> actions);
-  // this is public so numerical dynamics can use this
-  // virtual tuple<double> getActions();
-  virtual std::vector<double> getState();
-  virtual bool isLanded() const;
-  virtual bool isCrashed() const;
-
-  // virtual bool setActions(tuple<double> actions);
-  tuple<double> actions;
-};
-
 // DECLARE ALL GLOBAL VARIABLES HERE
 // WHY ARE THEY SO MANY OH GOD
 // make everything external! declaration will be handled within the files themselves
 extern int main_window, closeup_window, orbital_window, instrument_window, view_width, view_height, win_width, win_height;
 extern GLUquadricObj *quadObj;
 extern GLuint terrain_texture;
-extern short throttle_control;
-extern track_t track;
 extern bool texture_available;
 
+// The simulation driven by the graphics engine. The names below are references into it,
+// so the graphics code can keep using them as plain variables
+extern simulation_state_t simulation;
+extern short &throttle_control;
+extern track_t &track;
+
 // Simulation parameters
-extern bool help, paused, landed, crashed;
+extern bool help, paused;
+extern bool &landed, &crashed;
 extern int last_click_x, last_click_y;
 extern short simulation_speed;
-extern double delta_t, simulation_time;
-extern unsigned short scenario;
+extern double &delta_t, &simulation_time;
 extern std::string scenario_description[10];
 extern bool static_lighting;
-extern closeup_coords_t closeup_coords;
+extern closeup_coords_t &closeup_coords;
 extern float randtab[N_RAND];
 extern bool do_texture;
-extern unsigned long throttle_buffer_length, throttle_buffer_pointer;
-extern double *throttle_buffer;
 extern unsigned long long time_program_started;
 
-// this decides whether we choose to use the graphics simulation or not
+// this decides whether main.cpp runs the graphics engine or a headless episode
 extern bool render;
-// whether or not to use RL agent or default
-extern bool agent_flag;
-// need to actually access agent class
-extern Agent agent;
 
 // Lander state
-extern vector3d position, orientation, velocity, velocity_from_positions, last_position;
+extern vector3d &position, &orientation, &velocity, &velocity_from_positions, &last_position;
 // throttle defined as extern
-extern double climb_speed, ground_speed, altitude, throttle, fuel;
-extern bool stabilized_attitude, autopilot_enabled, parachute_lost;
-extern parachute_status_t parachute_status;
-extern int stabilized_attitude_angle;
+extern double &climb_speed, &ground_speed, &altitude, &throttle, &fuel;
+extern bool &stabilized_attitude, &autopilot_enabled, &parachute_lost;
+extern parachute_status_t &parachute_status;
+extern int &stabilized_attitude_angle;
 
 // Orbital and closeup view parameters
-extern double orbital_zoom, save_orbital_zoom, closeup_offset, closeup_xr, closeup_yr, terrain_angle;
+extern double orbital_zoom, save_orbital_zoom, closeup_offset, closeup_xr, closeup_yr;
+extern double &terrain_angle;
 extern quat_t orbital_quat;
 
 // For GL lights
@@ -283,8 +109,6 @@ extern GLfloat plus_y[], minus_y[], plus_z[], top_right[], straight_on[];
 
 // utility functions
 void invert(double m[], double mout[]);
-void xyz_euler_to_matrix(vector3d ang, double m[]);
-vector3d matrix_to_xyz_euler(double m[]);
 void normalize_quat(quat_t &q);
 quat_t axis_to_quat(vector3d a, const double phi);
 double project_to_sphere(const double r, const double x, const double y);
@@ -298,10 +122,10 @@ void fghCircleTable(double **sint, double **cost, const int n);
 void glutOpenHemisphere(GLdouble radius, GLint slices, GLint stacks);
 void glutMottledSphere(GLdouble radius, GLint slices, GLint stacks);
 void glutCone(GLdouble base, GLdouble height, GLint slices, GLint stacks, bool closed);
+void call_cached_list(GLuint &list, const std::function<void(void)> &draw);
 void enable_lights(void);
 void setup_lights(void);
 void glut_print(float x, float y, string s);
-double atmospheric_density(vector3d pos);
 void draw_dial(double cx, double cy, double val, string title, string units);
 void draw_control_bar(double tlx, double tly, double val, double red, double green, double blue, string title);
 void draw_indicator_lamp(double tcx, double tcy, string off_text, string on_text, bool on);
@@ -312,25 +136,22 @@ void display_help_text(void);
 void draw_orbital_window(void);
 void draw_parachute_quad(double d);
 void draw_parachute(double d);
+void draw_parachute_quads(double d);
+string terrain_texture_cache_path(void);
+bool load_terrain_texture(const string &path);
+void save_terrain_texture(const string &path, int size);
 bool generate_terrain_texture(void);
-void update_closeup_coords(void);
+void draw_ground_plane(void);
+void draw_lander_shadow(void);
 void draw_closeup_window(void);
 void draw_main_window(void);
 void refresh_all_subwindows(void);
 
-// core functionality
+// the same, acting on the global simulation used by the graphics engine
 bool safe_to_deploy_parachute(void);
-void update_visualization(void);
-void attitude_stabilization(void);
 vector3d thrust_wrt_world(void);
-void numerical_dynamics(void);
-void initialize_simulation(void);
 void update_lander_state(void);
 void reset_simulation(void);
-// autopilot stuff
-void autopilot(void);
-void autopilot_control(void);
-void autopilot_agent(void);
 
 // more rendering
 void set_orbital_projection_matrix(void);
@@ -342,10 +163,20 @@ void closeup_mouse_motion(int x, int y);
 void glut_special(int key, int x, int y);
 void glut_key(unsigned char k, int x, int y);
 
-// these files are in autopilot.cpp
-//  my custom methods in lander.cpp
-vector3d get_acceleration(void);
-
-// these are the main functions in main.cpp
+// in main.cpp, opens the GLUT windows and runs the graphics engine
 void run_graphics(int argc, char *argv[]);
-void run_one_episode();
\ No newline at end of file
+
+// in replay.cpp, shows a TrajectoryRecorder's recording instead of a live simulation
+extern bool replaying;
+// loads the recording before the windows open, prints why and returns false if it cannot be replayed
+bool start_replay(const string &directory, int episode);
+// shows the first row of the episode and starts playing, in place of reset_simulation
+void begin_replay(void);
+int replay_episodes(void);
+void replay_idle(void);
+string replay_status(void);
+// glut_key and glut_special hand every key press to these while replaying
+bool replay_key(unsigned char k);
+void replay_special(int key);
+
+#endif
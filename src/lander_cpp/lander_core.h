@@ -0,0 +1,724 @@
+// Mars lander simulator
+// Version 1.11
+// Header file for the simulation core, with no graphics dependencies
+// Gabor Csanyi and Andrew Gee, August 2019
+
+// Permission is hereby granted, free of charge, to any person obtaining
+// a copy of this software and associated documentation, to make use of it
+// for non-commercial purposes, provided that (a) its original authorship
+// is acknowledged and (b) no modified versions of the source code are
+// published. Restriction (b) is designed to protect the integrity of the
+// exercise for future generations of students. The authors would be happy
+// to receive any suggested modifications by private correspondence to
+// ahg@eng.cam.ac.uk and gc121@eng.cam.ac.uk.
+
+// The physics, autopilot and Agent interface only need this header, so they build without OpenGL or GLUT.
+// lander.h adds the graphics engine on top of it
+
+#ifndef LANDER_CORE_H
+#define LANDER_CORE_H
+
+#ifdef _WIN32
+#define _USE_MATH_DEFINES
+#include <windows.h>
+#else
+#include <sys/time.h>
+#include <unistd.h>
+#endif
+#include <iostream>
+#include <string>
+#include <sstream>
+#include <fstream>
+#include <cmath>
+#include <cstdlib>
+
+#include <vector>
+#include <tuple>
+#include <memory>
+#include <functional>
+#include <atomic>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#ifdef LANDER_PROFILE
+#include <chrono>
+#endif
+
+// Constants shared with the graphics
+#define SMALL_NUM 0.0000001
+#define N_TRACK 1000
+#define TRACK_DISTANCE_DELTA 100000.0
+#define TRACK_ANGLE_DELTA 0.999
+
+// Mars constants
+#define MARS_RADIUS 3386000.0 // (m)
+#define MARS_MASS 6.42E23     // (kg)
+#define GRAVITY 6.673E-11     // (m^3/kg/s^2)
+#define MARS_DAY 88642.65     // (s)
+#define EXOSPHERE 200000.0    // (m)
+
+// Lander constants
+#define LANDER_SIZE 1.0             // (m)
+#define UNLOADED_LANDER_MASS 100.0  // (kg)
+#define FUEL_CAPACITY 100.0         // (l)
+#define FUEL_RATE_AT_MAX_THRUST 0.5 // (l/s)
+#define FUEL_DENSITY 1.0            // (kg/l)
+// MAX_THRUST, as defined below, is 1.5 * weight of fully loaded lander at surface
+#define MAX_THRUST (1.5 * (FUEL_DENSITY * FUEL_CAPACITY + UNLOADED_LANDER_MASS) * (GRAVITY * MARS_MASS / (MARS_RADIUS * MARS_RADIUS))) // (N)
+#define ENGINE_LAG 0.0                                                                                                                 // (s)
+#define ENGINE_DELAY 0.0                                                                                                               // (s)
+#define DRAG_COEF_CHUTE 2.0
+#define DRAG_COEF_LANDER 1.0
+#define MAX_PARACHUTE_DRAG 20000.0  // (N)
+#define MAX_PARACHUTE_SPEED 500.0   // (m/s)
+#define THROTTLE_GRANULARITY 20     // for manual control
+#define MAX_IMPACT_GROUND_SPEED 1.0 // (m/s)
+#define MAX_IMPACT_DESCENT_RATE 1.0 // (m/s)
+
+// Agent interface sizes
+#define N_INIT_CONDITIONS 9 // position, velocity, orientation
+#define N_STATE 14          // see Agent::getState
+#define N_RECORD_COLUMNS 16 // see TrajectoryRecorder: the N_STATE state values, the throttle and the parachute status
+#define N_REWARD_FUNCTIONS 4 // see reward_function_t
+#define N_OBSERVATION 9      // LanderEnv's observation: position, velocity, fuel, altitude and climb speed
+#define MLP_MAX_WIDTH 256    // the widest layer MlpPolicy takes
+#define MLP_MAX_LAYERS 16    // the most layers MlpPolicy takes
+
+using namespace std;
+
+class vector3d
+{
+  // Utility class for three-dimensional vector operations
+public:
+  vector3d()
+  {
+    x = 0.0;
+    y = 0.0;
+    z = 0.0;
+  }
+  vector3d(double a, double b, double c = 0.0)
+  {
+    x = a;
+    y = b;
+    z = c;
+  }
+  bool operator==(const vector3d &v) const
+  {
+    if ((x == v.x) && (y == v.y) && (z == v.z))
+      return true;
+    else
+      return false;
+  }
+  bool operator!=(const vector3d &v) const
+  {
+    if ((x != v.x) || (y != v.y) || (z != v.z))
+      return true;
+    else
+      return false;
+  }
+  vector3d operator+(const vector3d &v) const { return vector3d(x + v.x, y + v.y, z + v.z); }
+  vector3d operator-(const vector3d &v) const { return vector3d(x - v.x, y - v.y, z - v.z); }
+  friend vector3d operator-(const vector3d &v) { return vector3d(-v.x, -v.y, -v.z); }
+  vector3d &operator+=(const vector3d &v)
+  {
+    x += v.x;
+    y += v.y;
+    z += v.z;
+    return *this;
+  }
+  vector3d &operator-=(const vector3d &v)
+  {
+    x -= v.x;
+    y -= v.y;
+    z -= v.z;
+    return *this;
+  }
+  vector3d operator^(const vector3d &v) const { return vector3d(y * v.z - z * v.y, z * v.x - x * v.z, x * v.y - y * v.x); }
+  double operator*(const vector3d &v) const { return (x * v.x + y * v.y + z * v.z); }
+  friend vector3d operator*(const vector3d &v, const double &a) { return vector3d(v.x * a, v.y * a, v.z * a); }
+  friend vector3d operator*(const double &a, const vector3d &v) { return vector3d(v.x * a, v.y * a, v.z * a); }
+  vector3d &operator*=(const double &a)
+  {
+    x *= a;
+    y *= a;
+    z *= a;
+    return *this;
+  }
+  vector3d operator/(const double &a) const { return vector3d(x / a, y / a, z / a); }
+  vector3d &operator/=(const double &a)
+  {
+    x /= a;
+    y /= a;
+    z /= a;
+    return *this;
+  }
+  double abs2() const { return (x * x + y * y + z * z); }
+  double abs() const { return sqrt(this->abs2()); }
+  vector3d norm() const
+  {
+    double s(this->abs());
+    if (s == 0)
+      return *this;
+    else
+      return vector3d(x / s, y / s, z / s);
+  }
+  friend ostream &operator<<(ostream &out, const vector3d &v)
+  {
+    out << v.x << ' ' << v.y << ' ' << v.z;
+    return out;
+  }
+  double x, y, z;
+
+private:
+};
+
+// Data type for recording lander's previous positions
+struct track_t
+{
+  unsigned short n;
+  unsigned short p;
+  // this is an array of vector 3d objects
+  vector3d pos[N_TRACK];
+};
+
+// Data structure for the state of the close-up view's coordinate system
+struct closeup_coords_t
+{
+  bool initialized;
+  bool backwards;
+  vector3d right;
+};
+
+// Enumerated data type for parachute status
+enum parachute_status_t
+{
+  NOT_DEPLOYED = 0,
+  DEPLOYED = 1,
+  LOST = 2
+};
+
+// Enumerated data type for the numerical integrator used by numerical_dynamics
+enum integrator_t
+{
+  VERLET = 0,  // position Verlet, the original integrator. 2nd order
+  RK4 = 1,     // classical Runge-Kutta, 4th order
+  YOSHIDA = 2  // Yoshida's 4th order symplectic composition of leapfrog steps
+};
+
+// Enumerated data type for the reward functions of step_reward, named in reward_function_names
+enum reward_function_t
+{
+  SQUARED_ALTITUDE_REWARD = 0, // -(altitude^2 + kinetic_weight * kinetic energy)
+  KINETIC_REWARD = 1,          // -kinetic_weight * kinetic energy
+  MECHANICAL_REWARD = 2,       // -(potential + kinetic energy)
+  SPARSE_REWARD = 3            // landing_reward on a safe landing, -crash_penalty on a crash, -step_penalty otherwise
+};
+
+// A reward function and its parameters. default_reward_config fills in the ones it does not use
+struct reward_config_t
+{
+  reward_function_t function;
+  double kinetic_weight;
+  double landing_reward, crash_penalty, step_penalty;
+};
+
+// the trained policy autopilot_agent can fly, see MlpPolicy
+class MlpPolicy;
+
+// Data structure for the complete dynamic state of one lander simulation. Every core function operates
+// on one of these, so several landers can be simulated independently within the same process
+struct simulation_state_t
+{
+  simulation_state_t()
+  {
+    climb_speed = 0.0;
+    ground_speed = 0.0;
+    altitude = 0.0;
+    throttle = 0.0;
+    fuel = 0.0;
+    stabilized_attitude = false;
+    autopilot_enabled = false;
+    parachute_lost = false;
+    parachute_status = NOT_DEPLOYED;
+    stabilized_attitude_angle = 0;
+    landed = false;
+    crashed = false;
+    delta_t = 0.0;
+    simulation_time = 0.0;
+    throttle_control = 0;
+    lagged_throttle = 0.0;
+    last_time_lag_updated = -1.0;
+    throttle_buffer_pointer = 0;
+    track.n = 0;
+    track.p = 0;
+    closeup_coords.initialized = false;
+    closeup_coords.backwards = false;
+    closeup_coords.right = vector3d(1.0, 0.0, 0.0);
+    terrain_angle = 0.0;
+    integrator = VERLET;
+    n_substeps = 1;
+    headless = false;
+    policy = NULL;
+  }
+
+  // Lander state
+  vector3d position, orientation, velocity, velocity_from_positions, last_position;
+  double climb_speed, ground_speed, altitude, throttle, fuel;
+  bool stabilized_attitude, autopilot_enabled, parachute_lost;
+  parachute_status_t parachute_status;
+  int stabilized_attitude_angle;
+  bool landed, crashed;
+  double delta_t, simulation_time;
+  short throttle_control;
+
+  // Numerical integrator, and how many integrator steps it takes per delta_t
+  integrator_t integrator;
+  int n_substeps;
+
+  // Previous position for the Verlet integrator (used to be a static in verlet_method)
+  vector3d position_prev;
+  // Engine lag state (used to be statics in thrust_wrt_world)
+  double lagged_throttle, last_time_lag_updated;
+  // Throttle history buffer, models ENGINE_DELAY
+  vector<double> throttle_buffer;
+  unsigned long throttle_buffer_pointer;
+
+  // Skips the bookkeeping below, and throttle_control, which only the graphics engine reads.
+  // The trajectory is the same either way
+  bool headless;
+
+  // Records only needed by the visualization
+  track_t track;
+  vector3d last_track_position;
+  closeup_coords_t closeup_coords;
+  double terrain_angle;
+
+  // If set, autopilot_agent takes the throttle from this policy. Not owned, and not part of a snapshot
+  const MlpPolicy *policy;
+};
+
+// The longest throttle history a snapshot can hold, ENGINE_DELAY / delta_t steps (none while ENGINE_DELAY is 0)
+#define SNAPSHOT_MAX_THROTTLE_BUFFER 64
+// Bumped whenever simulation_snapshot_t changes, so older snapshots are refused instead of misread
+#define SNAPSHOT_VERSION 1
+
+// Everything in simulation_state_t that is carried from one step to the next, in a plain fixed-size struct,
+// so a snapshot can be handled as a block of bytes. The track of past positions is left out, it is only drawn.
+// Snapshots are only meant to be restored by the same build, on the same machine
+struct simulation_snapshot_t
+{
+  unsigned int version;
+  vector3d position, orientation, velocity, velocity_from_positions, last_position, position_prev;
+  double climb_speed, ground_speed, altitude, throttle, fuel;
+  bool stabilized_attitude, autopilot_enabled, parachute_lost, landed, crashed, headless;
+  int parachute_status, stabilized_attitude_angle, integrator, n_substeps;
+  double delta_t, simulation_time;
+  short throttle_control;
+  double lagged_throttle, last_time_lag_updated;
+  unsigned int throttle_buffer_length, throttle_buffer_pointer;
+  double throttle_buffer[SNAPSHOT_MAX_THROTTLE_BUFFER];
+  closeup_coords_t closeup_coords;
+  double terrain_angle;
+};
+
+// Gains of the proportional autopilot, see autopilot_control
+struct autopilot_gains_t
+{
+  double K_h;
+  double K_p;
+  double delta;
+};
+
+// How one autopilot landing went, see run_autopilot_episode
+struct autopilot_score_t
+{
+  double fuel_used;    // (l)
+  double descent_rate; // at touchdown (m/s)
+  double ground_speed; // at touchdown (m/s)
+  bool landed, crashed;
+  int steps;
+};
+
+/**
+ * Records the state, throttle and parachute status after every step into a preallocated buffer, one column per value,
+ * and appends the buffered rows to one .npy file per column (named in record_column_names) whenever the
+ * buffer fills up or flush is called. Python can open the files zero-copy with np.load(..., mmap_mode="r").
+ * episode_starts.npy holds the row at which every episode begins.
+ */
+
+class TrajectoryRecorder
+{
+public:
+  // directory must exist, any recording already in it is overwritten. capacity rows are buffered between writes.
+  // throws std::runtime_error if the files cannot be written
+  TrajectoryRecorder(const string &directory, long capacity = 65536);
+  // flushes what is left
+  ~TrajectoryRecorder();
+  // the rows recorded from now on belong to a new episode
+  void startEpisode();
+  void record(const simulation_state_t &sim, double throttle);
+  // appends the buffered rows to the files, and brings their headers up to date
+  void flush();
+  // rows recorded so far, flushed or not
+  long size() const;
+  long nEpisodes() const;
+
+  const string directory;
+  const long capacity;
+
+private:
+  string columnPath(int column) const;
+  // the buffer is column-major: column c of row i is at buffer[c * capacity + i]
+  vector<double> buffer;
+  long n_buffered, n_flushed;
+  vector<long long> episode_starts;
+};
+
+// the file names of the recorded columns, without the .npy. the state ones match LanderEnv's info keys
+extern const char *record_column_names[N_RECORD_COLUMNS];
+
+// A whole recording read back into memory, for the lander executable's replay mode. column c of row i is
+// columns[c][i]. recordings made before the parachute_status column read it as NOT_DEPLOYED throughout
+struct recording_t
+{
+  vector<vector<double>> columns;
+  vector<long long> episode_starts;
+  long n_rows;
+};
+
+// in recorder.cpp. every column is cut to the shortest one, so a recording still being written can be read.
+// throws std::runtime_error if a column is missing or is not a 1D array of the type the recorder writes
+recording_t load_recording(const string &directory);
+
+/**
+ * Running mean and variance of a stream of vectors, as used to normalize observations and rewards.
+ * Every update merges the moments of a whole batch of rows into the running ones (Chan et al.'s parallel
+ * form of Welford's algorithm), with the same arithmetic as gymnasium's and stable baselines' RunningMeanStd,
+ * so a batch of one row gives exactly what their wrappers would.
+ */
+
+class RunningMeanStd
+{
+public:
+  // the count starts slightly above 0, as in gymnasium, so the first update does not divide by zero
+  RunningMeanStd(int size, double initial_count = 1e-4);
+  // n_rows rows of size values, back to back
+  void update(const double *batch, long n_rows);
+  // (x - mean) / sqrt(var + epsilon) for n_rows rows, clipped to [-clip, clip]. in and out may be the same
+  void normalize(const double *in, double *out, long n_rows, double epsilon, double clip) const;
+  int size() const;
+
+  vector<double> mean, var;
+  double count;
+};
+
+/**
+ * A trained policy's actor, as written by export_policy.py: the observation normalization saved with the model,
+ * then dense layers with tanh (or relu) between them, computed in float like torch. The action is the mean of
+ * the policy's distribution clipped to [-1, 1], as stable baselines' predict(deterministic=True) gives it.
+ *
+ * The file is little-endian: the magic "LNDRMLP1", then int32 n_inputs, n_layers, activation, normalize, then
+ * int32 output sizes of the n_layers layers, float64 observation mean and variance (n_inputs each), epsilon and
+ * clip, then every layer's float32 weights (outputs x inputs, row-major) and biases.
+ */
+
+enum activation_t
+{
+  TANH_ACTIVATION = 0,
+  RELU_ACTIVATION = 1
+};
+
+class MlpPolicy
+{
+public:
+  // throws std::runtime_error if the file cannot be read, or is not a policy for LanderEnv's observation
+  explicit MlpPolicy(const string &path);
+  // the model action in [-1, 1] for one observation of N_OBSERVATION values
+  double act(const float *observation) const;
+  // the throttle in [0, 1] for a state in Agent::getState order, with the observation picked out of it and
+  // rounded to float exactly as LanderEnv does
+  double throttle(const double *state) const;
+
+  int n_inputs;
+  // the outputs of every layer, the last one is the action
+  vector<int> layer_sizes;
+  activation_t activation;
+  bool normalize_observations;
+  vector<double> obs_mean, obs_var;
+  double epsilon, clip;
+  vector<vector<float>> weights, biases;
+};
+
+// the Agent::getState values the observation is made of, in order
+extern const int observation_state_indices[N_OBSERVATION];
+
+/**
+ * Our Agent class. this will be wrapped in Python.
+ *
+ *
+ *
+ */
+
+class Agent
+{
+public:
+  Agent();
+  // the virtual declarations here allow overriding of functions, from inherited classes!
+  virtual ~Agent() = default; // Add a virtual destructor
+  // reset and step very similar to gym env
+  virtual vector<double> reset(vector<double> init_conditions);
+  virtual void update(tuple<double> actions);
+  // this is public so numerical dynamics can use this
+  // virtual tuple<double> getActions();
+  virtual std::vector<double> getState();
+  virtual bool isLanded() const;
+  virtual bool isCrashed() const;
+  // update, reward and state readout fused into one call. the new state is written into state_buffer,
+  // so nothing is allocated per step. returns the landed and crashed flags and the reward
+  tuple<bool, bool, double> step(double throttle);
+  // up to n_steps steps in one call, stopping early on touchdown. step i uses throttles[i], or throttles[0]
+  // on every step if schedule is false. if states is not NULL, the state after every step is written there
+  // (n_steps rows of N_STATE). returns the number of steps taken; the final state is in state_buffer and
+  // the summed reward of the steps in reward. an empty schedule (n_steps <= 0) takes no steps and reads no throttle
+  int rollout(const double *throttles, int n_steps, bool schedule, double *states);
+  // flies the policy for up to n_steps steps, stopping early on touchdown. it chooses a throttle from the state
+  // after every frame_skip steps, as LanderEnv(frame_skip) would step it, and the throttle is held in between.
+  // returns the number of steps taken, with the final state in state_buffer and the summed reward in reward.
+  // throws std::logic_error without a policy
+  int runPolicy(int n_steps, int frame_skip = 1);
+
+  // the complete dynamic state of the simulation, and putting it back. after restore the agent carries on
+  // exactly as it would have from the moment of the snapshot, which may have come from another agent
+  simulation_snapshot_t snapshot() const;
+  void restore(const simulation_snapshot_t &snapshot);
+
+  // the integrator, sub-steps per step and time step used from the next reset on.
+  // throws std::invalid_argument unless n_substeps >= 1 and delta_t > 0
+  void configure(integrator_t integrator, int n_substeps, double delta_t);
+
+  // virtual bool setActions(tuple<double> actions);
+  tuple<double> actions;
+
+  // set by configure, copied into the simulation by reset
+  integrator_t integrator;
+  int n_substeps;
+  double delta_t;
+  // agents are never drawn, so by default they skip the visualization bookkeeping. also copied by reset
+  bool headless;
+  // if set, every step is recorded, and every reset starts a new episode in it
+  shared_ptr<TrajectoryRecorder> recorder;
+  // the reward function, kept across resets
+  reward_config_t reward_config;
+  // the reward of the last update or step, or the sum over the last rollout
+  double reward;
+  // the policy runPolicy flies, kept across resets
+  shared_ptr<MlpPolicy> policy;
+
+  // each agent owns its own lander, so agents no longer share the global state
+  simulation_state_t simulation;
+  // the latest state, in getState order. refreshed by reset and step
+  double state_buffer[N_STATE];
+};
+
+/**
+ * The same agent, but final: nothing can override it, so calls never go through the Python
+ * override lookup in PyAgent and the compiler can devirtualize them. Bound as FastAgent.
+ */
+
+class FastAgent final : public Agent
+{
+};
+
+/**
+ * Threads that are started once and then wait for work, so handing out tasks costs a wake-up rather than
+ * starting and joining a thread every time. One run at a time: a second caller waits for the first.
+ */
+
+class WorkerPool
+{
+public:
+  WorkerPool() = default;
+  WorkerPool(const WorkerPool &) = delete;
+  WorkerPool &operator=(const WorkerPool &) = delete;
+  ~WorkerPool();
+  // calls task(0) to task(n_tasks - 1) on up to n_workers threads, the calling thread included, and returns once
+  // all of them are done. the threads take tasks off a shared counter, and more are started the first time they
+  // are needed
+  void run(int n_tasks, int n_workers, const std::function<void(int)> &task);
+
+private:
+  void work(int index);
+  void take_tasks();
+
+  vector<std::thread> threads;
+  std::mutex run_mutex, mutex;
+  std::condition_variable wake, done;
+  const std::function<void(int)> *task = nullptr;
+  int n_tasks = 0, n_joining = 0, n_busy = 0;
+  std::atomic<int> next_task{0};
+  unsigned long long generation = 0;
+  bool stopping = false;
+};
+
+// a slice smaller than this is stepped faster on the calling thread than a wake-up of another thread costs
+#define MIN_AGENTS_PER_THREAD 64
+
+/**
+ * Many agents stepped together, for vectorized environments.
+ * Large batches are advanced in parallel, split across up to n_threads threads of a pool that lives as long as
+ * the batch. Each thread gets at least MIN_AGENTS_PER_THREAD landers, so small batches step on the calling thread.
+ */
+
+class BatchAgent
+{
+public:
+  // throws std::invalid_argument if n_agents is negative
+  BatchAgent(int n_agents, int n_threads = 1);
+  // init_conditions holds n_agents rows of 9 (position, velocity and orientation), back to back
+  void reset(const double *init_conditions);
+  void resetAgent(int index, const double *init_conditions);
+  // one throttle per agent. landers that have already landed are left untouched until reset
+  void update(const double *throttles);
+  // writes n_agents rows of the 14 Agent::getState values, and the termination flags
+  void getStates(double *states) const;
+  void getFlags(bool *landed, bool *crashed) const;
+  int size() const;
+
+  vector<Agent> agents;
+  int n_threads;
+
+private:
+  shared_ptr<WorkerPool> pool;
+};
+
+// The phases of a step that are timed when the core is built with LANDER_PROFILE, see PROFILE_SCOPE
+enum profile_phase_t
+{
+  PROFILE_STEP = 0,           // a whole Agent update, step or rollout step, including the phases below
+  PROFILE_INTEGRATOR,         // numerical integration, with the thrust
+  PROFILE_AUTOPILOT,          // the autopilot hook
+  PROFILE_ATTITUDE,           // attitude stabilization
+  PROFILE_VISUALIZATION,      // update_visualization and the close-up coordinates: speeds, touchdown, fuel, track
+  PROFILE_REWARD,             // step_reward
+  PROFILE_STATE_READOUT,      // write_state into the agent's state buffer
+  N_PROFILE_PHASES
+};
+
+extern const char *profile_phase_names[N_PROFILE_PHASES];
+
+#ifdef LANDER_PROFILE
+// calls and total time of every phase, summed over all agents and threads
+struct profile_counter_t
+{
+  std::atomic<unsigned long long> calls;
+  std::atomic<unsigned long long> nanoseconds;
+};
+extern profile_counter_t profile_counters[N_PROFILE_PHASES];
+
+// adds the time from its construction to the end of the enclosing block to a phase
+class profile_scope_t
+{
+public:
+  explicit profile_scope_t(profile_phase_t phase) : phase(phase), start(std::chrono::steady_clock::now()) {}
+  ~profile_scope_t()
+  {
+    auto elapsed = std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now() - start);
+    profile_counters[phase].calls.fetch_add(1, std::memory_order_relaxed);
+    profile_counters[phase].nanoseconds.fetch_add(elapsed.count(), std::memory_order_relaxed);
+  }
+
+private:
+  profile_phase_t phase;
+  std::chrono::steady_clock::time_point start;
+};
+
+#define PROFILE_CONCAT_(a, b) a##b
+#define PROFILE_CONCAT(a, b) PROFILE_CONCAT_(a, b)
+#define PROFILE_SCOPE(phase) profile_scope_t PROFILE_CONCAT(profile_scope_, __LINE__)(phase)
+#else
+// without LANDER_PROFILE the timers are not compiled in at all
+#define PROFILE_SCOPE(phase)
+#endif
+
+// the calls and seconds of every phase so far, all zero without LANDER_PROFILE, and setting them back to zero
+void read_profile_counters(unsigned long long *calls, double *seconds);
+void reset_profile_counters();
+
+// Global variables of the core. The graphics engine's own globals are in lander.h
+// the scenario initialize_simulation sets up
+extern unsigned short scenario;
+// whether or not to use RL agent or default
+extern bool agent_flag;
+// need to actually access agent class
+extern Agent agent;
+// gains used by autopilot_control
+extern autopilot_gains_t autopilot_gains;
+
+// Function prototypes
+
+// utility functions
+void xyz_euler_to_matrix(vector3d ang, double m[]);
+vector3d matrix_to_xyz_euler(double m[]);
+double atmospheric_density(vector3d pos);
+void update_closeup_coords(simulation_state_t &sim);
+
+// core functionality, each operating on one simulation
+bool safe_to_deploy_parachute(const simulation_state_t &sim);
+void update_visualization(simulation_state_t &sim);
+void update_track(simulation_state_t &sim);
+void attitude_stabilization(simulation_state_t &sim);
+vector3d thrust_wrt_world(simulation_state_t &sim);
+void update_engine(simulation_state_t &sim);
+vector3d thrust_force(const simulation_state_t &sim);
+void numerical_dynamics(simulation_state_t &sim);
+void initialize_simulation(simulation_state_t &sim);
+void update_lander_state(simulation_state_t &sim);
+void reset_simulation(simulation_state_t &sim);
+// throw std::length_error if the throttle history is too long, and std::invalid_argument for another version
+void snapshot_simulation(const simulation_state_t &sim, simulation_snapshot_t &snapshot);
+void restore_simulation(simulation_state_t &sim, const simulation_snapshot_t &snapshot);
+// autopilot stuff
+void autopilot(simulation_state_t &sim);
+void autopilot_control(simulation_state_t &sim);
+void autopilot_agent(simulation_state_t &sim);
+bool should_deploy_parachute(const simulation_state_t &sim);
+double proportional_throttle(const simulation_state_t &sim, const autopilot_gains_t &gains);
+autopilot_score_t run_autopilot_episode(const autopilot_gains_t &gains, const double *init_conditions, int max_steps);
+void evaluate_autopilot_gains(const autopilot_gains_t *gains, int n_gains, const double *init_conditions, int n_episodes,
+                              int max_steps, int n_threads, autopilot_score_t *scores);
+// calls task(0) to task(n_tasks - 1) on n_threads threads (fewer than 1 uses every core), from a pool shared by
+// every caller
+void run_parallel_tasks(int n_tasks, int n_threads, const std::function<void(int)> &task);
+
+// in policy.cpp, the same landings flown by a trained policy. scores has one entry per episode
+autopilot_score_t run_policy_episode(const MlpPolicy &policy, const double *init_conditions, int max_steps, int frame_skip);
+void evaluate_policy(const MlpPolicy &policy, const double *init_conditions, int n_episodes, int max_steps,
+                     int frame_skip, int n_threads, autopilot_score_t *scores);
+
+// these files are in autopilot.cpp
+//  my custom methods in lander.cpp
+vector3d get_acceleration(simulation_state_t &sim);
+vector3d current_acceleration(const simulation_state_t &sim);
+vector3d acceleration_at(const simulation_state_t &sim, const vector3d &pos, const vector3d &vel, const vector3d &f_thrust);
+vector3d gravity_force(const vector3d &pos, double gm);
+
+// in orbits.cpp, free fall under gravity_force alone for many orbits, one task per orbit. r0 and v0 are (n_orbits, 3),
+// dt, n_steps and every have one entry per orbit. every every-th step of orbit i goes to row i of r, v and a, which are
+// (n_orbits, n_samples, 3), and the rows past the last sample of an orbit are left as they are
+void propagate_orbits(bool verlet, int n_orbits, const double *r0, const double *v0, const double *dt,
+                      const long long *n_steps, const long long *every, double gm, long long n_samples, int n_threads,
+                      double *r, double *v, double *a);
+
+// in reward.cpp. reward_function_from_name throws std::invalid_argument for an unknown name
+extern const char *reward_function_names[N_REWARD_FUNCTIONS];
+reward_function_t reward_function_from_name(const string &name);
+reward_config_t default_reward_config(reward_function_t function);
+double step_reward(const simulation_state_t &sim, const reward_config_t &config);
+
+// in agent.cpp, copies the state returned by Agent::getState into a buffer of N_STATE doubles
+void write_state(const simulation_state_t &sim, double *state);
+
+// in main.cpp, runs one episode with the global agent and no graphics
+void run_one_episode();
+
+#endif
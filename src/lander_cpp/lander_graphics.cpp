@@ -80,46 +80,62 @@
 int main_window, closeup_window, orbital_window, instrument_window, view_width, view_height, win_width, win_height;
 GLUquadricObj *quadObj;
 GLuint terrain_texture;
-short throttle_control;
-track_t track;
 bool texture_available;
 
+// The simulation shown by the graphics engine, everything it draws is read from here
+simulation_state_t simulation;
+short &throttle_control = simulation.throttle_control;
+track_t &track = simulation.track;
+
 // Simulation parameters
 bool help = false;
 bool paused = false;
-bool landed = false;
-bool crashed = false;
+bool &landed = simulation.landed;
+bool &crashed = simulation.crashed;
 int last_click_x = -1;
 int last_click_y = -1;
 short simulation_speed = 5;
 // this delta_t be carefu;l
-double delta_t, simulation_time;
-unsigned short scenario = 0;
-string scenario_description[10];
+double &delta_t = simulation.delta_t;
+double &simulation_time = simulation.simulation_time;
+string scenario_description[10] = {
+    "circular orbit",
+    "descent from 10km",
+    "elliptical orbit, thrust changes orbital plane",
+    "polar launch at escape velocity (but drag prevents escape)",
+    "elliptical orbit that clips the atmosphere and decays",
+    "descent from 200km",
+    "",
+    "",
+    "",
+    ""};
 bool static_lighting = false;
-closeup_coords_t closeup_coords;
+closeup_coords_t &closeup_coords = simulation.closeup_coords;
 float randtab[N_RAND];
 bool do_texture = true;
-unsigned long throttle_buffer_length, throttle_buffer_pointer;
-double *throttle_buffer = NULL; // this is an array
 unsigned long long time_program_started;
 
-// // Lander state - the visualization routines use velocity_from_positions, so not sensitive to
-// // any errors in the velocity update in numerical_dynamics
-// vector3d velocity_from_positions, last_position;
-// double climb_speed, ground_speed, altitude, throttle, fuel;
-// bool parachute_lost;
-// int stabilized_attitude_angle;
-
-/// throttle is defined externally here!
-vector3d position, orientation, velocity, velocity_from_positions, last_position;
-double climb_speed, ground_speed, altitude, throttle, fuel;
-bool stabilized_attitude, autopilot_enabled, parachute_lost;
-parachute_status_t parachute_status;
-int stabilized_attitude_angle;
+// Lander state - the visualization routines use velocity_from_positions, so not sensitive to
+// any errors in the velocity update in numerical_dynamics
+vector3d &position = simulation.position;
+vector3d &orientation = simulation.orientation;
+vector3d &velocity = simulation.velocity;
+vector3d &velocity_from_positions = simulation.velocity_from_positions;
+vector3d &last_position = simulation.last_position;
+double &climb_speed = simulation.climb_speed;
+double &ground_speed = simulation.ground_speed;
+double &altitude = simulation.altitude;
+double &throttle = simulation.throttle;
+double &fuel = simulation.fuel;
+bool &stabilized_attitude = simulation.stabilized_attitude;
+bool &autopilot_enabled = simulation.autopilot_enabled;
+bool &parachute_lost = simulation.parachute_lost;
+parachute_status_t &parachute_status = simulation.parachute_status;
+int &stabilized_attitude_angle = simulation.stabilized_attitude_angle;
 
 // Orbital and closeup view parameters
-double orbital_zoom, save_orbital_zoom, closeup_offset, closeup_xr, closeup_yr, terrain_angle;
+double orbital_zoom, save_orbital_zoom, closeup_offset, closeup_xr, closeup_yr;
+double &terrain_angle = simulation.terrain_angle;
 quat_t orbital_quat;
 
 // For GL lights
@@ -161,105 +177,6 @@ void invert(double m[], double mout[])
   mout[11] = 0.0;
 }
 
-void xyz_euler_to_matrix(vector3d ang, double m[])
-// Constructs a 4x4 OpenGL rotation matrix from xyz Euler angles
-{
-  double sin_a, sin_b, sin_g, cos_a, cos_b, cos_g;
-  double ra, rb, rg;
-
-  // Pre-calculate radian angles
-  ra = ang.x * M_PI / (double)180;
-  rb = ang.y * M_PI / (double)180;
-  rg = ang.z * M_PI / (double)180;
-
-  // Pre-calculate sines and cosines
-  cos_a = cos(ra);
-  cos_b = cos(rb);
-  cos_g = cos(rg);
-  sin_a = sin(ra);
-  sin_b = sin(rb);
-  sin_g = sin(rg);
-
-  // Create the correct matrix coefficients
-  m[0] = cos_a * cos_b;
-  m[1] = sin_a * cos_b;
-  m[2] = -sin_b;
-  m[3] = 0.0;
-  m[4] = cos_a * sin_b * sin_g - sin_a * cos_g;
-  m[5] = sin_a * sin_b * sin_g + cos_a * cos_g;
-  m[6] = cos_b * sin_g;
-  m[7] = 0.0;
-  m[8] = cos_a * sin_b * cos_g + sin_a * sin_g;
-  m[9] = sin_a * sin_b * cos_g - cos_a * sin_g;
-  m[10] = cos_b * cos_g;
-  m[11] = 0.0;
-  m[12] = 0.0;
-  m[13] = 0.0;
-  m[14] = 0.0;
-  m[15] = 1.0;
-}
-
-vector3d matrix_to_xyz_euler(double m[])
-// Decomposes a 4x4 OpenGL rotation matrix into xyz Euler angles
-{
-  double tmp;
-  vector3d ang;
-
-  // Catch degenerate elevation cases
-  if (m[2] < -0.99999999)
-  {
-    ang.y = 90.0;
-    ang.x = 0.0;
-    ang.z = acos(m[8]);
-    if ((sin(ang.z) > 0.0) ^ (m[4] > 0.0))
-      ang.z = -ang.z;
-    ang.z *= 180.0 / M_PI;
-    return ang;
-  }
-  if (m[2] > 0.99999999)
-  {
-    ang.y = -90.0;
-    ang.x = 0.0;
-    ang.z = acos(m[5]);
-    if ((sin(ang.z) < 0.0) ^ (m[4] > 0.0))
-      ang.z = -ang.z;
-    ang.z *= 180.0 / M_PI;
-    return ang;
-  }
-
-  // Non-degenerate elevation - between -90 and +90
-  ang.y = asin(-m[2]);
-
-  // Now work out azimuth - between -180 and +180
-  tmp = m[0] / cos(ang.y); // the denominator will not be zero
-  if (tmp <= -1.0)
-    ang.x = M_PI;
-  else if (tmp >= 1.0)
-    ang.x = 0.0;
-  else
-    ang.x = acos(tmp);
-  if (((sin(ang.x) * cos(ang.y)) > 0.0) ^ ((m[1]) > 0.0))
-    ang.x = -ang.x;
-
-  // Now work out roll - between -180 and +180
-  tmp = m[10] / cos(ang.y); // the denominator will not be zero
-  if (tmp <= -1.0)
-    ang.z = M_PI;
-  else if (tmp >= 1.0)
-    ang.z = 0.0;
-  else
-    ang.z = acos(tmp);
-  if (((sin(ang.z) * cos(ang.y)) > 0.0) ^ ((m[6]) > 0.0))
-    ang.z = -ang.z;
-
-  // Convert to degrees
-  ang.y *= 180.0 / M_PI;
-  ang.x *= 180.0 / M_PI;
-  ang.z *= 180.0 / M_PI;
-
-  return ang;
-}
-
 void normalize_quat(quat_t &q)
 // Normalizes a quaternion
 {
@@ -625,6 +542,21 @@ void glutCone(GLdouble base, GLdouble height, GLint slices, GLint stacks, bool c
   free(cost);
 }
 
+void call_cached_list(GLuint &list, const std::function<void(void)> &draw)
+// Draws through a display list, which is compiled from draw the first time. The geometry is then computed
+// only once, and the GL keeps its vertices ready to render. Every GLUT subwindow has its own GL context,
+// so a list must only be called in the window that compiled it
+{
+  if (!list)
+  {
+    list = glGenLists(1);
+    glNewList(list, GL_COMPILE);
+    draw();
+    glEndList();
+  }
+  glCallList(list);
+}
+
 void enable_lights(void)
 // Enable the appropriate subset of lights
 {
@@ -695,19 +627,6 @@ void glut_print(float x, float y, string s)
     glutBitmapCharacter(GLUT_BITMAP_HELVETICA_10, s[i]);
 }
 
-double atmospheric_density(vector3d pos)
-// Simple exponential model between surface and exosphere (around 200km), surface density is approximately 0.017 kg/m^3,
-// scale height is approximately 11km
-{
-  double alt;
-
-  alt = pos.abs() - MARS_RADIUS;
-  if ((alt > EXOSPHERE) || (alt < 0.0))
-    return 0.0;
-  else
-    return (0.017 * exp(-alt / 11000.0));
-}
-
 void draw_dial(double cx, double cy, double val, string title, string units)
 // Draws a single instrument dial, position (cx, cy), value val, title
 {
@@ -889,8 +808,9 @@ void draw_instrument_window(void)
     break;
   }
 
-  // Draw speed bar
-  draw_control_bar(view_width + GAP + 240, INSTRUMENT_HEIGHT - 18, simulation_speed / 10.0, 0.0, 0.0, 1.0, "Simulation speed");
+  // Draw speed bar, a replay has its speed in the status line instead
+  if (!replaying)
+    draw_control_bar(view_width + GAP + 240, INSTRUMENT_HEIGHT - 18, simulation_speed / 10.0, 0.0, 0.0, 1.0, "Simulation speed");
 
   // Draw digital clock
   glColor3f(1.0, 1.0, 1.0);
@@ -945,10 +865,15 @@ void draw_instrument_window(void)
   else
     glColor3f(1.0, 1.0, 1.0);
   s.str("");
-  s << "Scenario " << scenario;
-  if (!landed)
-    s << ": " << scenario_description[scenario];
-  glut_print(view_width + GAP - 488, 17, s.str());
+  if (replaying)
+    s << replay_status();
+  else
+  {
+    s << "Scenario " << scenario;
+    if (!landed)
+      s << ": " << scenario_description[scenario];
+  }
+  glut_print(view_width + GAP - 488, landed && replaying ? 37 : 17, s.str());
   if (landed)
   {
     if (altitude < LANDER_SIZE / 2.0)
@@ -1045,38 +970,60 @@ void display_help_text(void)
   glDisable(GL_LIGHTING);
   glDisable(GL_DEPTH_TEST);
 
-  glut_print(20, view_height - 20, "Left arrow - decrease simulation speed");
-  glut_print(20, view_height - 35, "Right arrow - increase simulation speed");
-  glut_print(20, view_height - 50, "Space - single step through simulation");
+  if (replaying)
+  {
+    glut_print(20, view_height - 20, "Space - pause or play the replay");
+    glut_print(20, view_height - 35, "Up/down arrow - double/halve the replay speed");
+    glut_print(20, view_height - 50, "Left/right arrow - seek back/forward 10 s");
+    glut_print(20, view_height - 65, ", and . - step back/forward one step");
+    glut_print(20, view_height - 80, "[ and ] - previous/next episode");
+    glut_print(20, view_height - 95, "r - restart the episode");
+    glut_print(20, view_height - 110, "f - toggle frame skipping");
+
+    glut_print(20, view_height - 130, "Left mouse - rotate 3D views");
+    glut_print(20, view_height - 145, "Middle/shift mouse or up wheel - zoom in 3D views");
+    glut_print(20, view_height - 160, "Right mouse or down wheel - zoom out 3D views");
+
+    glut_print(20, view_height - 180, "l - toggle lighting model");
+    glut_print(20, view_height - 195, "t - toggle terrain texture");
+    glut_print(20, view_height - 210, "h - toggle help");
+    glut_print(20, view_height - 225, "Esc/q - quit");
+  }
+  else
+  {
+    glut_print(20, view_height - 20, "Left arrow - decrease simulation speed");
+    glut_print(20, view_height - 35, "Right arrow - increase simulation speed");
+    glut_print(20, view_height - 50, "Space - single step through simulation");
 
-  glut_print(20, view_height - 70, "Up arrow - more thrust");
-  glut_print(20, view_height - 85, "Down arrow - less thrust");
+    glut_print(20, view_height - 70, "Up arrow - more thrust");
+    glut_print(20, view_height - 85, "Down arrow - less thrust");
 
-  glut_print(20, view_height - 105, "Keys 0-9 - restart simulation in scenario n");
+    glut_print(20, view_height - 105, "Keys 0-9 - restart simulation in scenario n");
 
-  glut_print(20, view_height - 125, "Left mouse - rotate 3D views");
-  glut_print(20, view_height - 140, "Middle/shift mouse or up wheel - zoom in 3D views");
-  glut_print(20, view_height - 155, "Right mouse or down wheel - zoom out 3D views");
+    glut_print(20, view_height - 125, "Left mouse - rotate 3D views");
+    glut_print(20, view_height - 140, "Middle/shift mouse or up wheel - zoom in 3D views");
+    glut_print(20, view_height - 155, "Right mouse or down wheel - zoom out 3D views");
 
-  glut_print(20, view_height - 175, "s - toggle attitude stabilizer");
-  glut_print(20, view_height - 190, "p - deploy parachute");
-  glut_print(20, view_height - 205, "a - toggle autopilot");
+    glut_print(20, view_height - 175, "s - toggle attitude stabilizer");
+    glut_print(20, view_height - 190, "p - deploy parachute");
+    glut_print(20, view_height - 205, "a - toggle autopilot");
 
-  glut_print(20, view_height - 225, "l - toggle lighting model");
-  glut_print(20, view_height - 240, "t - toggle terrain texture");
-  glut_print(20, view_height - 255, "h - toggle help");
-  glut_print(20, view_height - 270, "Esc/q - quit");
+    glut_print(20, view_height - 225, "l - toggle lighting model");
+    glut_print(20, view_height - 240, "t - toggle terrain texture");
+    glut_print(20, view_height - 255, "h - toggle help");
+    glut_print(20, view_height - 270, "Esc/q - quit");
 
-  j = 0;
-  for (i = 0; i < 10; i++)
-  {
-    s.str("");
-    s << "Scenario " << i << ": " << scenario_description[i];
-    if (view_height > 448)
-      glut_print(20, (448 - view_height) + view_height - 300 - 15 * j, s.str());
-    else
-      glut_print(20, view_height - 300 - 15 * j, s.str());
-    j++;
+    j = 0;
+    for (i = 0; i < 10; i++)
+    {
+      s.str("");
+      s << "Scenario " << i << ": " << scenario_description[i];
+      if (view_height > 448)
+        glut_print(20, (448 - view_height) + view_height - 300 - 15 * j, s.str());
+      else
+        glut_print(20, view_height - 300 - 15 * j, s.str());
+      j++;
+    }
   }
 
   glEnable(GL_LIGHTING);
@@ -1128,6 +1075,8 @@ void display_help_prompt(void)
 void draw_orbital_window(void)
 // Draws the orbital view
 {
+  static GLuint planet_lists = 0; // the filled planet, then its wireframe, both of unit radius
+  static GLint planet_slices = 0, planet_stacks = 0;
   unsigned short i, j;
   double m[16], sf;
   GLint slices, stacks;
@@ -1172,11 +1121,33 @@ void draw_orbital_window(void)
     slices = 16;
     stacks = 10;
   }
-  gluQuadricDrawStyle(quadObj, GLU_FILL);
-  gluSphere(quadObj, (1.0 - 0.01 / orbital_zoom) * MARS_RADIUS, slices, stacks);
+  // the tessellation follows the zoom, so the lists are recompiled when it changes
+  if (planet_lists && ((slices != planet_slices) || (stacks != planet_stacks)))
+  {
+    glDeleteLists(planet_lists, 2);
+    planet_lists = 0;
+  }
+  if (!planet_lists)
+  {
+    planet_slices = slices;
+    planet_stacks = stacks;
+    planet_lists = glGenLists(2);
+    glNewList(planet_lists, GL_COMPILE);
+    gluQuadricDrawStyle(quadObj, GLU_FILL);
+    gluSphere(quadObj, 1.0, slices, stacks);
+    glEndList();
+    glNewList(planet_lists + 1, GL_COMPILE);
+    gluQuadricDrawStyle(quadObj, GLU_LINE);
+    gluSphere(quadObj, 1.0, slices, stacks);
+    glEndList();
+  }
+  glPushMatrix();
+  glScaled((1.0 - 0.01 / orbital_zoom) * MARS_RADIUS, (1.0 - 0.01 / orbital_zoom) * MARS_RADIUS, (1.0 - 0.01 / orbital_zoom) * MARS_RADIUS);
+  glCallList(planet_lists);
+  glPopMatrix();
   glColor3f(0.31, 0.16, 0.11);
-  gluQuadricDrawStyle(quadObj, GLU_LINE);
-  gluSphere(quadObj, MARS_RADIUS, slices, stacks);
+  glScaled(MARS_RADIUS, MARS_RADIUS, MARS_RADIUS);
+  glCallList(planet_lists + 1);
   glPopMatrix();
 
   // Draw previous lander positions in cyan that fades with time
@@ -1230,9 +1201,20 @@ void draw_parachute_quad(double d)
 void draw_parachute(double d)
 // OpenGL quads and lines to draw a simple parachute, distance d behind the lander
 {
+  // the parachute is only ever drawn half or fully open, so there are only a few lists
+  static std::map<double, GLuint> lists;
+
   glLineWidth(1.0);
   glColor3f(1.0, 0.75, 0.0);
   glDisable(GL_CULL_FACE);
+  call_cached_list(lists[d], [d]()
+                   { draw_parachute_quads(d); });
+  glEnable(GL_CULL_FACE);
+}
+
+void draw_parachute_quads(double d)
+// The five quads of the parachute, distance d behind the lander
+{
   draw_parachute_quad(d);
   glPushMatrix();
   glRotated((360.0 / M_PI) * atan2(LANDER_SIZE, d), 0.0, 0.0, 1.0);
@@ -1250,34 +1232,121 @@ void draw_parachute(double d)
   glRotated(-(360.0 / M_PI) * atan2(LANDER_SIZE, d), 0.0, 1.0, 0.0);
   draw_parachute_quad(d);
   glPopMatrix();
-  glEnable(GL_CULL_FACE);
+}
+
+string terrain_texture_cache_path(void)
+// Where the terrain texture is kept between runs: $LANDER_TEXTURE_CACHE if set, otherwise in the user's cache directory
+{
+  const char *path = getenv("LANDER_TEXTURE_CACHE");
+  const char *directory;
+
+  if (path != NULL)
+    return path;
+#ifdef _WIN32
+  directory = getenv("LOCALAPPDATA");
+  if (directory == NULL)
+    return "";
+  return string(directory) + "\\mars_lander_terrain.tex";
+#else
+  directory = getenv("XDG_CACHE_HOME");
+  if (directory != NULL)
+    return string(directory) + "/mars_lander_terrain.tex";
+  directory = getenv("HOME");
+  if (directory == NULL)
+    return "";
+  mkdir((string(directory) + "/.cache").c_str(), 0755); // fails harmlessly if it is already there
+  return string(directory) + "/.cache/mars_lander_terrain.tex";
+#endif
+}
+
+bool load_terrain_texture(const string &path)
+// Uploads every mipmap level of a texture saved by save_terrain_texture into the bound texture. Returns false,
+// having uploaded nothing usable, if the file is missing, is for another TERRAIN_TEXTURE_SIZE or is too big for the GL
+{
+  FILE *file;
+  char magic[8];
+  int size;
+  bool ok;
+
+  file = fopen(path.c_str(), "rb");
+  if (file == NULL)
+    return false;
+  ok = (fread(magic, 1, 8, file) == 8) && !memcmp(magic, TERRAIN_TEXTURE_MAGIC, 8) && (fread(&size, sizeof(int), 1, file) == 1) &&
+       (size >= 256) && (size <= TERRAIN_TEXTURE_SIZE) && !(size & (size - 1));
+  if (ok)
+  {
+    vector<unsigned char> level((size_t)size * size);
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1);
+    glGetError(); // clear error
+    for (int l = 0; ok && (size >> l) >= 1; l++)
+    {
+      ok = (fread(level.data(), 1, (size_t)(size >> l) * (size >> l), file) == (size_t)(size >> l) * (size >> l));
+      if (ok)
+        glTexImage2D(GL_TEXTURE_2D, l, GL_LUMINANCE, size >> l, size >> l, 0, GL_LUMINANCE, GL_UNSIGNED_BYTE, level.data());
+    }
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4);
+    ok = ok && (glGetError() == GL_NO_ERROR);
+  }
+  fclose(file);
+  return ok;
+}
+
+void save_terrain_texture(const string &path, int size)
+// Saves every mipmap level of the bound texture, size by size at the top. Nothing is saved if the file cannot be written
+{
+  FILE *file;
+  vector<unsigned char> level((size_t)size * size);
+
+  file = fopen(path.c_str(), "wb");
+  if (file == NULL)
+    return;
+  fwrite(TERRAIN_TEXTURE_MAGIC, 1, 8, file);
+  fwrite(&size, sizeof(int), 1, file);
+  glPixelStorei(GL_PACK_ALIGNMENT, 1);
+  for (int l = 0; (size >> l) >= 1; l++)
+  {
+    glGetTexImage(GL_TEXTURE_2D, l, GL_LUMINANCE, GL_UNSIGNED_BYTE, level.data());
+    fwrite(level.data(), 1, (size_t)(size >> l) * (size >> l), file);
+  }
+  glPixelStorei(GL_PACK_ALIGNMENT, 4);
+  fclose(file);
 }
 
 // interesting function
 bool generate_terrain_texture(void)
-// Generates random texture map for surface terrain, with mipmap to avoid aliasing at the horizon
+// Generates random texture map for surface terrain, with mipmap to avoid aliasing at the horizon. The mipmaps are
+// cached on disk (see terrain_texture_cache_path), and later runs load them instead of building them again
 {
   unsigned char *tex_image;
   unsigned long x;
   GLsizei ts;
   bool texture_ok;
+  string cache_path;
 
   ts = TERRAIN_TEXTURE_SIZE;
   texture_ok = false;
-  tex_image = (unsigned char *)calloc(sizeof(unsigned char), TERRAIN_TEXTURE_SIZE * TERRAIN_TEXTURE_SIZE);
-  for (x = 0; x < TERRAIN_TEXTURE_SIZE * TERRAIN_TEXTURE_SIZE; x++)
-    tex_image[x] = 192 + (unsigned char)(63.0 * rand() / RAND_MAX);
   glGenTextures(1, &terrain_texture);
   glBindTexture(GL_TEXTURE_2D, terrain_texture);
-  while (!texture_ok && (ts >= 256))
-  {               // try progressively smaller texture maps, give up below 256x256
-    glGetError(); // clear error
-    if (!gluBuild2DMipmaps(GL_TEXTURE_2D, GL_LUMINANCE, ts, ts, GL_LUMINANCE, GL_UNSIGNED_BYTE, tex_image) && (glGetError() == GL_NO_ERROR))
-      texture_ok = true;
-    else
-      ts /= 2;
+  cache_path = terrain_texture_cache_path();
+  if (!cache_path.empty() && load_terrain_texture(cache_path))
+    texture_ok = true;
+  else
+  {
+    tex_image = (unsigned char *)calloc(sizeof(unsigned char), TERRAIN_TEXTURE_SIZE * TERRAIN_TEXTURE_SIZE);
+    for (x = 0; x < TERRAIN_TEXTURE_SIZE * TERRAIN_TEXTURE_SIZE; x++)
+      tex_image[x] = 192 + (unsigned char)(63.0 * rand() / RAND_MAX);
+    while (!texture_ok && (ts >= 256))
+    {               // try progressively smaller texture maps, give up below 256x256
+      glGetError(); // clear error
+      if (!gluBuild2DMipmaps(GL_TEXTURE_2D, GL_LUMINANCE, ts, ts, GL_LUMINANCE, GL_UNSIGNED_BYTE, tex_image) && (glGetError() == GL_NO_ERROR))
+        texture_ok = true;
+      else
+        ts /= 2;
+    }
+    free(tex_image);
+    if (texture_ok && !cache_path.empty())
+      save_terrain_texture(cache_path, ts);
   }
-  free(tex_image);
   if (texture_ok)
   {
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT);
@@ -1291,93 +1360,67 @@ bool generate_terrain_texture(void)
     return false;
 }
 
-void update_closeup_coords(void)
-// Updates the close-up view's coordinate frame, based on the lander's current position and velocity.
-// This needs to be called every time step, even if the view is not being rendered, since any-angle
-// attitude stabilizers reference closeup_coords.right
+void draw_ground_plane(void)
+// The ground plane, in quarters, with unit size at the origin. The texture coordinates are those of the
+// texture at rest, draw_closeup_window slides it with the texture matrix
 {
-  vector3d s, tv, t;
-  double tmp;
-
-  // Direction from surface to lander (radial) - this must map to the world y-axis
-  s = position.norm();
-
-  // Direction of tangential velocity - this must map to the world x-axis
-  tv = velocity_from_positions - (velocity_from_positions * s) * s;
-  if (tv.abs() < SMALL_NUM) // vertical motion only, use last recorded tangential velocity
-    tv = closeup_coords.backwards ? (closeup_coords.right * s) * s - closeup_coords.right : closeup_coords.right - (closeup_coords.right * s) * s;
-  if (tv.abs() > SMALL_NUM)
-    t = tv.norm();
-
-  // Check these two vectors are non-zero and perpendicular (they should be, unless s and closeup_coords.right happen to be parallel)
-  if ((tv.abs() <= SMALL_NUM) || (fabs(s * t) > SMALL_NUM))
-  {
-    // Set t to something perpendicular to s
-    t.x = -s.y;
-    t.y = s.x;
-    t.z = 0.0;
-    if (t.abs() < SMALL_NUM)
-    {
-      t.x = -s.z;
-      t.y = 0.0;
-      t.z = s.x;
-    }
-    t = t.norm();
-  }
+  glBegin(GL_QUADS);
+  glTexCoord2f(1.0, 1.0);
+  glVertex3d(1.0, 0.0, 1.0);
+  glTexCoord2f(1.0, 0.5);
+  glVertex3d(1.0, 0.0, 0.0);
+  glTexCoord2f(0.5, 0.5);
+  glVertex3d(0.0, 0.0, 0.0);
+  glTexCoord2f(0.5, 1.0);
+  glVertex3d(0.0, 0.0, 1.0);
+  glTexCoord2f(0.5, 0.5);
+  glVertex3d(0.0, 0.0, 0.0);
+  glTexCoord2f(1.0, 0.5);
+  glVertex3d(1.0, 0.0, 0.0);
+  glTexCoord2f(1.0, 0.0);
+  glVertex3d(1.0, 0.0, -1.0);
+  glTexCoord2f(0.5, 0.0);
+  glVertex3d(0.0, 0.0, -1.0);
+  glTexCoord2f(0.5, 0.5);
+  glVertex3d(0.0, 0.0, 0.0);
+  glTexCoord2f(0.5, 0.0);
+  glVertex3d(0.0, 0.0, -1.0);
+  glTexCoord2f(0.0, 0.0);
+  glVertex3d(-1.0, 0.0, -1.0);
+  glTexCoord2f(0.0, 0.5);
+  glVertex3d(-1.0, 0.0, 0.0);
+  glTexCoord2f(0.5, 1.0);
+  glVertex3d(0.0, 0.0, 1.0);
+  glTexCoord2f(0.5, 0.5);
+  glVertex3d(0.0, 0.0, 0.0);
+  glTexCoord2f(0.0, 0.5);
+  glVertex3d(-1.0, 0.0, 0.0);
+  glTexCoord2f(0.0, 1.0);
+  glVertex3d(-1.0, 0.0, 1.0);
+  glEnd();
+}
 
-  // Adjust the terrain texture angle if the lander has changed direction. The motion will still be along
-  // the x-axis, so we need to rotate the texture to compensate.
-  if (closeup_coords.initialized)
-  {
-    if (closeup_coords.backwards)
-    {
-      tmp = -closeup_coords.right * t;
-      if (tmp > 1.0)
-        tmp = 1.0;
-      if (tmp < -1.0)
-        tmp = -1.0;
-      if ((-closeup_coords.right ^ t) * position.norm() < 0.0)
-        terrain_angle += (180.0 / M_PI) * acos(tmp);
-      else
-        terrain_angle -= (180.0 / M_PI) * acos(tmp);
-    }
-    else
-    {
-      tmp = closeup_coords.right * t;
-      if (tmp > 1.0)
-        tmp = 1.0;
-      if (tmp < -1.0)
-        tmp = -1.0;
-      if ((closeup_coords.right ^ t) * position.norm() < 0.0)
-        terrain_angle += (180.0 / M_PI) * acos(tmp);
-      else
-        terrain_angle -= (180.0 / M_PI) * acos(tmp);
-    }
-    while (terrain_angle < 0.0)
-      terrain_angle += 360.0;
-    while (terrain_angle >= 360.0)
-      terrain_angle -= 360.0;
-  }
+void draw_lander_shadow(void)
+// A circular shadow, flat on the ground under the lander at the origin
+{
+  int i;
 
-  // Normally we maintain motion to the right, the one exception being when the ground speed passes
-  // through zero and changes sign. A sudden 180 degree change of viewpoint would be confusing, so
-  // in this instance we allow the lander to fly to the left.
-  if (closeup_coords.initialized && (closeup_coords.right * t < 0.0))
-  {
-    closeup_coords.backwards = true;
-    closeup_coords.right = -1.0 * t;
-  }
-  else
+  glBegin(GL_TRIANGLES);
+  for (i = 0; i < 360; i += 10)
   {
-    closeup_coords.backwards = false;
-    closeup_coords.right = t;
-    closeup_coords.initialized = true;
+    glVertex3d(0.0, 0.0, 0.0);
+    glVertex3d(LANDER_SIZE * cos(M_PI * (i + 10) / 180.0), 0.0, LANDER_SIZE * sin(M_PI * (i + 10) / 180.0));
+    glVertex3d(LANDER_SIZE * cos(M_PI * i / 180.0), 0.0, LANDER_SIZE * sin(M_PI * i / 180.0));
   }
+  glEnd();
 }
 
 void draw_closeup_window(void)
 // Draws the close-up view of the lander
 {
+  // the static geometry, see call_cached_list. the planet and shapes are of unit size, and scaled into place
+  static GLuint ground_list = 0, shadow_list = 0, planet_list = 0, lander_list = 0, flare_list = 0, glow_list = 0;
+  static GLuint hemisphere_list = 0;
   static double terrain_offset_x = 0.0;
   static double terrain_offset_y = 0.0;
   static double ground_line_offset = 0.0;
@@ -1551,43 +1594,20 @@ void draw_closeup_window(void)
     if (do_texture)
       glEnable(GL_TEXTURE_2D);
     glNormal3d(0.0, 1.0, 0.0);
+    // the plane is stored with unit size at the origin, and the texture coordinates slide with the offsets
+    glMatrixMode(GL_TEXTURE);
+    glPushMatrix();
+    glTranslated(terrain_offset_x, terrain_offset_y, 0.0);
+    glMatrixMode(GL_MODELVIEW);
     glPushMatrix();
     glRotated(terrain_angle, 0.0, 1.0, 0.0);
-    glBegin(GL_QUADS);
-    glTexCoord2f(1.0 + terrain_offset_x, 1.0 + terrain_offset_y);
-    glVertex3d(ground_plane_size, -altitude, ground_plane_size);
-    glTexCoord2f(1.0 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(ground_plane_size, -altitude, 0.0);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, 0.0);
-    glTexCoord2f(0.5 + terrain_offset_x, 1.0 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, ground_plane_size);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, 0.0);
-    glTexCoord2f(1.0 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(ground_plane_size, -altitude, 0.0);
-    glTexCoord2f(1.0 + terrain_offset_x, 0.0 + terrain_offset_y);
-    glVertex3d(ground_plane_size, -altitude, -ground_plane_size);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.0 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, -ground_plane_size);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, 0.0);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.0 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, -ground_plane_size);
-    glTexCoord2f(0.0 + terrain_offset_x, 0.0 + terrain_offset_y);
-    glVertex3d(-ground_plane_size, -altitude, -ground_plane_size);
-    glTexCoord2f(0.0 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(-ground_plane_size, -altitude, 0.0);
-    glTexCoord2f(0.5 + terrain_offset_x, 1.0 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, ground_plane_size);
-    glTexCoord2f(0.5 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(0.0, -altitude, 0.0);
-    glTexCoord2f(0.0 + terrain_offset_x, 0.5 + terrain_offset_y);
-    glVertex3d(-ground_plane_size, -altitude, 0.0);
-    glTexCoord2f(0.0 + terrain_offset_x, 1.0 + terrain_offset_y);
-    glVertex3d(-ground_plane_size, -altitude, ground_plane_size);
-    glEnd();
+    glTranslated(0.0, -altitude, 0.0);
+    glScaled(ground_plane_size, 1.0, ground_plane_size);
+    call_cached_list(ground_list, draw_ground_plane);
     glPopMatrix();
+    glMatrixMode(GL_TEXTURE);
+    glPopMatrix();
+    glMatrixMode(GL_MODELVIEW);
     glDisable(GL_TEXTURE_2D);
     glDisable(GL_DEPTH_TEST);
 
@@ -1625,14 +1645,10 @@ void draw_closeup_window(void)
     if (!crashed)
     { // draw a circular shadow below the lander
       glColor3f(0.32, 0.17, 0.11);
-      glBegin(GL_TRIANGLES);
-      for (i = 0; i < 360; i += 10)
-      {
-        glVertex3d(0.0, -altitude, 0.0);
-        glVertex3d(LANDER_SIZE * cos(M_PI * (i + 10) / 180.0), -altitude, LANDER_SIZE * sin(M_PI * (i + 10) / 180.0));
-        glVertex3d(LANDER_SIZE * cos(M_PI * i / 180.0), -altitude, LANDER_SIZE * sin(M_PI * i / 180.0));
-      }
-      glEnd();
+      glPushMatrix();
+      glTranslated(0.0, -altitude, 0.0);
+      call_cached_list(shadow_list, draw_lander_shadow);
+      glPopMatrix();
     }
     else
     {
@@ -1691,7 +1707,7 @@ void draw_closeup_window(void)
       glTranslated(0.0, -MARS_RADIUS, 0.0);
       glMultMatrixd(m2);                                            // now in the planetary coordinate system
       glRotated(360.0 * simulation_time / MARS_DAY, 0.0, 0.0, 1.0); // to make the planet spin
-      glutMottledSphere(MARS_RADIUS * (MARS_RADIUS / (altitude + MARS_RADIUS)), 160, 100);
+      glScaled(MARS_RADIUS * (MARS_RADIUS / (altitude + MARS_RADIUS)), MARS_RADIUS * (MARS_RADIUS / (altitude + MARS_RADIUS)), MARS_RADIUS * (MARS_RADIUS / (altitude + MARS_RADIUS)));
     }
     else
     {
@@ -1700,8 +1716,10 @@ void draw_closeup_window(void)
       glTranslated(0.0, -(MARS_RADIUS + altitude), 0.0);
       glMultMatrixd(m2);                                            // now in the planetary coordinate system
       glRotated(360.0 * simulation_time / MARS_DAY, 0.0, 0.0, 1.0); // to make the planet spin
-      glutMottledSphere(MARS_RADIUS, 160, 100);
+      glScaled(MARS_RADIUS, MARS_RADIUS, MARS_RADIUS);
     }
+    call_cached_list(planet_list, []()
+                     { glutMottledSphere(1.0, 160, 100); });
 
     glPopMatrix(); // back to the view's world coordinate system
     glEnable(GL_DEPTH_TEST);
@@ -1769,7 +1787,8 @@ void draw_closeup_window(void)
   if (!crashed)
   {
     glColor3f(1.0, 1.0, 1.0);
-    glutCone(LANDER_SIZE, LANDER_SIZE, 50, 50, true);
+    call_cached_list(lander_list, []()
+                     { glutCone(LANDER_SIZE, LANDER_SIZE, 50, 50, true); });
   }
 
   if (dark_side)
@@ -1786,7 +1805,9 @@ void draw_closeup_window(void)
     glColor3f(1.0, 0.5, 0.0);
     glRotated(180.0, 1.0, 0.0, 0.0);
     glDisable(GL_LIGHTING);
-    glutCone(LANDER_SIZE / 2, 2 * LANDER_SIZE * thrust_wrt_world().abs() / MAX_THRUST, 50, 50, false);
+    glScaled(1.0, 1.0, 2 * LANDER_SIZE * thrust_wrt_world().abs() / MAX_THRUST);
+    call_cached_list(flare_list, []()
+                     { glutCone(LANDER_SIZE / 2, 1.0, 50, 50, false); });
     glEnable(GL_LIGHTING);
   }
 
@@ -1806,8 +1827,14 @@ void draw_closeup_window(void)
     glDisable(GL_LIGHTING);
     glEnable(GL_BLEND);
     glColor4f(1.0, glow_factor, 0.0, 0.8 * glow_factor);
-    glutCone(1.25 * LANDER_SIZE, (2.0 + 10.0 * glow_factor) * LANDER_SIZE, 50, 50 + (int)(250 * glow_factor), false);
-    glutOpenHemisphere(1.25 * LANDER_SIZE, 50, 50);
+    // the hemisphere is in the list, under the cone stretched to the length of the glow
+    glPushMatrix();
+    glScaled(1.0, 1.0, (2.0 + 10.0 * glow_factor) * LANDER_SIZE);
+    call_cached_list(glow_list, []()
+                     { glutCone(1.25 * LANDER_SIZE, 1.0, 50, 50, false); });
+    glPopMatrix();
+    call_cached_list(hemisphere_list, []()
+                     { glutOpenHemisphere(1.25 * LANDER_SIZE, 50, 50); });
     glDisable(GL_BLEND);
     glEnable(GL_LIGHTING);
   }
@@ -2056,6 +2083,11 @@ void closeup_mouse_motion(int x, int y)
 void glut_special(int key, int x, int y)
 // Callback for special key presses in all windows
 {
+  if (replaying)
+  {
+    replay_special(key);
+    return;
+  }
   switch (key)
   {
   case GLUT_KEY_UP: // throttle up
@@ -2107,6 +2139,8 @@ void glut_special(int key, int x, int y)
 void glut_key(unsigned char k, int x, int y)
 // Callback for key presses in all windows
 {
+  if (replaying && replay_key(k))
+    return;
   switch (k)
   {
 
@@ -2258,3 +2292,60 @@ void glut_key(unsigned char k, int x, int y)
     break;
   }
 }
+
+/**
+ *
+ * WRAPPERS FOR THE GRAPHICS ENGINE. GLUT callbacks take no arguments, so these act on the global simulation.
+ * The core functions in lander_mechanics.cpp know nothing about GLUT; the delay, idle function and redrawing
+ * that used to be switched on by the render flag inside them are done here instead
+ *
+ */
+
+bool safe_to_deploy_parachute(void)
+{
+  return safe_to_deploy_parachute(simulation);
+}
+
+vector3d thrust_wrt_world(void)
+{
+  return thrust_wrt_world(simulation);
+}
+
+void update_lander_state(void)
+// The GLUT idle function, called every time round the event loop
+{
+  unsigned long delay;
+
+  // User-controlled delay
+  if ((simulation_speed > 0) && (simulation_speed < 5))
+  {
+    delay = (5 - simulation_speed) * MAX_DELAY / 4;
+#ifdef _WIN32
+    Sleep(delay / 1000); // milliseconds
+#else
+    usleep((useconds_t)delay); // microseconds
+#endif
+  }
+
+  update_lander_state(simulation);
+
+  // Stop the idle function once the lander is down
+  if (landed)
+    glutIdleFunc(NULL);
+
+  // Redraw everything
+  refresh_all_subwindows();
+}
+
+void reset_simulation(void)
+{
+  reset_simulation(simulation);
+
+  // Reset GLUT state, the lander may have started underground
+  if (landed)
+    glutIdleFunc(NULL);
+  if (paused || landed)
+    refresh_all_subwindows();
+  else
+    glutIdleFunc(update_lander_state);
+}
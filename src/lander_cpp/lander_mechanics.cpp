@@ -1,123 +1,326 @@
-// include this in the lander.h
-#include "lander.h"
+// only the core header, this file is built without any graphics
+#include "lander_core.h"
+#include <cstring>
+#include <stdexcept>
+#include <algorithm>
 
 /**
  *
- * CORE FUNCTIONALITY. For the stuff involving OpenGL, I've added a flag to use GLUT
+ * UTILITY FUNCTIONS used by the dynamics. They used to live in lander_graphics.cpp
  *
  *
  */
 
-bool safe_to_deploy_parachute(void)
+void xyz_euler_to_matrix(vector3d ang, double m[])
+// Constructs a 4x4 OpenGL rotation matrix from xyz Euler angles
+{
+  double sin_a, sin_b, sin_g, cos_a, cos_b, cos_g;
+  double ra, rb, rg;
+
+  // Pre-calculate radian angles
+  ra = ang.x * M_PI / (double)180;
+  rb = ang.y * M_PI / (double)180;
+  rg = ang.z * M_PI / (double)180;
+
+  // Pre-calculate sines and cosines
+  cos_a = cos(ra);
+  cos_b = cos(rb);
+  cos_g = cos(rg);
+  sin_a = sin(ra);
+  sin_b = sin(rb);
+  sin_g = sin(rg);
+
+  // Create the correct matrix coefficients
+  m[0] = cos_a * cos_b;
+  m[1] = sin_a * cos_b;
+  m[2] = -sin_b;
+  m[3] = 0.0;
+  m[4] = cos_a * sin_b * sin_g - sin_a * cos_g;
+  m[5] = sin_a * sin_b * sin_g + cos_a * cos_g;
+  m[6] = cos_b * sin_g;
+  m[7] = 0.0;
+  m[8] = cos_a * sin_b * cos_g + sin_a * sin_g;
+  m[9] = sin_a * sin_b * cos_g - cos_a * sin_g;
+  m[10] = cos_b * cos_g;
+  m[11] = 0.0;
+  m[12] = 0.0;
+  m[13] = 0.0;
+  m[14] = 0.0;
+  m[15] = 1.0;
+}
+
+vector3d matrix_to_xyz_euler(double m[])
+// Decomposes a 4x4 OpenGL rotation matrix into xyz Euler angles
+{
+  double tmp;
+  vector3d ang;
+
+  // Catch degenerate elevation cases
+  if (m[2] < -0.99999999)
+  {
+    ang.y = 90.0;
+    ang.x = 0.0;
+    ang.z = acos(m[8]);
+    if ((sin(ang.z) > 0.0) ^ (m[4] > 0.0))
+      ang.z = -ang.z;
+    ang.z *= 180.0 / M_PI;
+    return ang;
+  }
+  if (m[2] > 0.99999999)
+  {
+    ang.y = -90.0;
+    ang.x = 0.0;
+    ang.z = acos(m[5]);
+    if ((sin(ang.z) < 0.0) ^ (m[4] > 0.0))
+      ang.z = -ang.z;
+    ang.z *= 180.0 / M_PI;
+    return ang;
+  }
+
+  // Non-degenerate elevation - between -90 and +90
+  ang.y = asin(-m[2]);
+
+  // Now work out azimuth - between -180 and +180
+  tmp = m[0] / cos(ang.y); // the denominator will not be zero
+  if (tmp <= -1.0)
+    ang.x = M_PI;
+  else if (tmp >= 1.0)
+    ang.x = 0.0;
+  else
+    ang.x = acos(tmp);
+  if (((sin(ang.x) * cos(ang.y)) > 0.0) ^ ((m[1]) > 0.0))
+    ang.x = -ang.x;
+
+  // Now work out roll - between -180 and +180
+  tmp = m[10] / cos(ang.y); // the denominator will not be zero
+  if (tmp <= -1.0)
+    ang.z = M_PI;
+  else if (tmp >= 1.0)
+    ang.z = 0.0;
+  else
+    ang.z = acos(tmp);
+  if (((sin(ang.z) * cos(ang.y)) > 0.0) ^ ((m[6]) > 0.0))
+    ang.z = -ang.z;
+
+  // Convert to degrees
+  ang.y *= 180.0 / M_PI;
+  ang.x *= 180.0 / M_PI;
+  ang.z *= 180.0 / M_PI;
+
+  return ang;
+}
+
+double atmospheric_density(vector3d pos)
+// Simple exponential model between surface and exosphere (around 200km), surface density is approximately 0.017 kg/m^3,
+// scale height is approximately 11km
+{
+  double alt;
+
+  alt = pos.abs() - MARS_RADIUS;
+  if ((alt > EXOSPHERE) || (alt < 0.0))
+    return 0.0;
+  else
+    return (0.017 * exp(-alt / 11000.0));
+}
+
+void update_closeup_coords(simulation_state_t &sim)
+// Updates the close-up view's coordinate frame, based on the lander's current position and velocity.
+// This needs to be called every time step, even if the view is not being rendered, since any-angle
+// attitude stabilizers reference closeup_coords.right
+{
+  vector3d s, tv, t;
+  double tmp;
+
+  // Direction from surface to lander (radial) - this must map to the world y-axis
+  s = sim.position.norm();
+
+  // Direction of tangential velocity - this must map to the world x-axis
+  tv = sim.velocity_from_positions - (sim.velocity_from_positions * s) * s;
+  if (tv.abs() < SMALL_NUM) // vertical motion only, use last recorded tangential velocity
+    tv = sim.closeup_coords.backwards ? (sim.closeup_coords.right * s) * s - sim.closeup_coords.right : sim.closeup_coords.right - (sim.closeup_coords.right * s) * s;
+  if (tv.abs() > SMALL_NUM)
+    t = tv.norm();
+
+  // Check these two vectors are non-zero and perpendicular (they should be, unless s and closeup_coords.right happen to be parallel)
+  if ((tv.abs() <= SMALL_NUM) || (fabs(s * t) > SMALL_NUM))
+  {
+    // Set t to something perpendicular to s
+    t.x = -s.y;
+    t.y = s.x;
+    t.z = 0.0;
+    if (t.abs() < SMALL_NUM)
+    {
+      t.x = -s.z;
+      t.y = 0.0;
+      t.z = s.x;
+    }
+    t = t.norm();
+  }
+
+  // Adjust the terrain texture angle if the lander has changed direction. The motion will still be along
+  // the x-axis, so we need to rotate the texture to compensate.
+  if (sim.closeup_coords.initialized)
+  {
+    if (sim.closeup_coords.backwards)
+    {
+      tmp = -sim.closeup_coords.right * t;
+      if (tmp > 1.0)
+        tmp = 1.0;
+      if (tmp < -1.0)
+        tmp = -1.0;
+      if ((-sim.closeup_coords.right ^ t) * sim.position.norm() < 0.0)
+        sim.terrain_angle += (180.0 / M_PI) * acos(tmp);
+      else
+        sim.terrain_angle -= (180.0 / M_PI) * acos(tmp);
+    }
+    else
+    {
+      tmp = sim.closeup_coords.right * t;
+      if (tmp > 1.0)
+        tmp = 1.0;
+      if (tmp < -1.0)
+        tmp = -1.0;
+      if ((sim.closeup_coords.right ^ t) * sim.position.norm() < 0.0)
+        sim.terrain_angle += (180.0 / M_PI) * acos(tmp);
+      else
+        sim.terrain_angle -= (180.0 / M_PI) * acos(tmp);
+    }
+    while (sim.terrain_angle < 0.0)
+      sim.terrain_angle += 360.0;
+    while (sim.terrain_angle >= 360.0)
+      sim.terrain_angle -= 360.0;
+  }
+
+  // Normally we maintain motion to the right, the one exception being when the ground speed passes
+  // through zero and changes sign. A sudden 180 degree change of viewpoint would be confusing, so
+  // in this instance we allow the lander to fly to the left.
+  if (sim.closeup_coords.initialized && (sim.closeup_coords.right * t < 0.0))
+  {
+    sim.closeup_coords.backwards = true;
+    sim.closeup_coords.right = -1.0 * t;
+  }
+  else
+  {
+    sim.closeup_coords.backwards = false;
+    sim.closeup_coords.right = t;
+    sim.closeup_coords.initialized = true;
+  }
+}
+
+/**
+ *
+ * CORE FUNCTIONALITY. None of it touches GLUT; the graphics engine's wrappers in lander_graphics.cpp
+ * do the redrawing and the idle function bookkeeping
+ *
+ *
+ */
+
+bool safe_to_deploy_parachute(const simulation_state_t &sim)
 // Checks whether the parachute is safe to deploy at the current position and velocity
 {
     double drag;
 
     // Assume high Reynolds number, quadratic drag = -0.5 * rho * v^2 * A * C_d
-    drag = 0.5 * DRAG_COEF_CHUTE * atmospheric_density(position) * 5.0 * 2.0 * LANDER_SIZE * 2.0 * LANDER_SIZE * velocity_from_positions.abs2();
+    drag = 0.5 * DRAG_COEF_CHUTE * atmospheric_density(sim.position) * 5.0 * 2.0 * LANDER_SIZE * 2.0 * LANDER_SIZE * sim.velocity_from_positions.abs2();
     // Do not use the global variable "altitude" here, in case this function is called from within the
     // numerical_dynamics function, before altitude is updated in the update_visualization function
-    if ((drag > MAX_PARACHUTE_DRAG) || ((velocity_from_positions.abs() > MAX_PARACHUTE_SPEED) && ((position.abs() - MARS_RADIUS) < EXOSPHERE)))
+    if ((drag > MAX_PARACHUTE_DRAG) || ((sim.velocity_from_positions.abs() > MAX_PARACHUTE_SPEED) && ((sim.position.abs() - MARS_RADIUS) < EXOSPHERE)))
         return false;
     else
         return true;
 }
 
-void update_visualization(void)
+void update_visualization(simulation_state_t &sim)
 // The visualization part of the idle function. Re-estimates altitude, velocity, climb speed and ground
 // speed from current and previous positions. Updates throttle and fuel levels, then redraws all subwindows.
 {
-    static vector3d last_track_position;
     vector3d av_p, d;
     double a, b, c, mu;
 
-    simulation_time += delta_t;
-    altitude = position.abs() - MARS_RADIUS;
+    sim.simulation_time += sim.delta_t;
+    sim.altitude = sim.position.abs() - MARS_RADIUS;
 
     // Use average of current and previous positions when calculating climb and ground speeds
-    av_p = (position + last_position).norm();
-    if (delta_t != 0.0)
-        velocity_from_positions = (position - last_position) / delta_t;
+    av_p = (sim.position + sim.last_position).norm();
+    if (sim.delta_t != 0.0)
+        sim.velocity_from_positions = (sim.position - sim.last_position) / sim.delta_t;
     else
-        velocity_from_positions = vector3d(0.0, 0.0, 0.0);
-    climb_speed = velocity_from_positions * av_p;
-    ground_speed = (velocity_from_positions - climb_speed * av_p).abs();
+        sim.velocity_from_positions = vector3d(0.0, 0.0, 0.0);
+    sim.climb_speed = sim.velocity_from_positions * av_p;
+    sim.ground_speed = (sim.velocity_from_positions - sim.climb_speed * av_p).abs();
 
     // Check to see whether the lander has landed
-    if (altitude < LANDER_SIZE / 2.0)
+    if (sim.altitude < LANDER_SIZE / 2.0)
     {
-        // RENDERING HERE
-        if (render)
-        {
-            glutIdleFunc(NULL);
-        }
-
         // Estimate position and time of impact
-        d = position - last_position;
+        d = sim.position - sim.last_position;
         a = d.abs2();
-        b = 2.0 * last_position * d;
-        c = last_position.abs2() - (MARS_RADIUS + LANDER_SIZE / 2.0) * (MARS_RADIUS + LANDER_SIZE / 2.0);
+        b = 2.0 * sim.last_position * d;
+        c = sim.last_position.abs2() - (MARS_RADIUS + LANDER_SIZE / 2.0) * (MARS_RADIUS + LANDER_SIZE / 2.0);
         mu = (-b - sqrt(b * b - 4.0 * a * c)) / (2.0 * a);
-        position = last_position + mu * d;
-        simulation_time -= (1.0 - mu) * delta_t;
-        altitude = LANDER_SIZE / 2.0;
-        landed = true;
-        if ((fabs(climb_speed) > MAX_IMPACT_DESCENT_RATE) || (fabs(ground_speed) > MAX_IMPACT_GROUND_SPEED))
-            crashed = true;
-        velocity_from_positions = vector3d(0.0, 0.0, 0.0);
+        sim.position = sim.last_position + mu * d;
+        sim.simulation_time -= (1.0 - mu) * sim.delta_t;
+        sim.altitude = LANDER_SIZE / 2.0;
+        sim.landed = true;
+        if ((fabs(sim.climb_speed) > MAX_IMPACT_DESCENT_RATE) || (fabs(sim.ground_speed) > MAX_IMPACT_GROUND_SPEED))
+            sim.crashed = true;
+        sim.velocity_from_positions = vector3d(0.0, 0.0, 0.0);
     }
 
     // Update throttle and fuel (throttle might have been adjusted by the autopilot)
-    if (throttle < 0.0)
-        throttle = 0.0;
-    if (throttle > 1.0)
-        throttle = 1.0;
-    fuel -= delta_t * (FUEL_RATE_AT_MAX_THRUST * throttle) / FUEL_CAPACITY;
-    if (fuel <= 0.0)
-        fuel = 0.0;
-    if (landed || (fuel == 0.0))
-        throttle = 0.0;
-    throttle_control = (short)(throttle * THROTTLE_GRANULARITY + 0.5);
+    if (sim.throttle < 0.0)
+        sim.throttle = 0.0;
+    if (sim.throttle > 1.0)
+        sim.throttle = 1.0;
+    sim.fuel -= sim.delta_t * (FUEL_RATE_AT_MAX_THRUST * sim.throttle) / FUEL_CAPACITY;
+    if (sim.fuel <= 0.0)
+        sim.fuel = 0.0;
+    if (sim.landed || (sim.fuel == 0.0))
+        sim.throttle = 0.0;
+    if (!sim.headless)
+        sim.throttle_control = (short)(sim.throttle * THROTTLE_GRANULARITY + 0.5);
 
     // Check to see whether the parachute has vaporized or the tethers have snapped
-    if (parachute_status == DEPLOYED)
+    if (sim.parachute_status == DEPLOYED)
     {
-        if (!safe_to_deploy_parachute() || parachute_lost)
+        if (!safe_to_deploy_parachute(sim) || sim.parachute_lost)
         {
-            parachute_lost = true; // to guard against the autopilot reinstating the parachute!
-            parachute_status = LOST;
+            sim.parachute_lost = true; // to guard against the autopilot reinstating the parachute!
+            sim.parachute_status = LOST;
         }
     }
 
+    // Nothing else is needed to simulate, only to draw the lander's track
+    if (!sim.headless)
+        update_track(sim);
+}
+
+void update_track(simulation_state_t &sim)
+// Appends the current position to the track drawn in the orbital view
+{
     // Update record of lander's previous positions, but only if the position or the velocity has
     // changed significantly since the last update
-    if (!track.n || (position - last_track_position).norm() * velocity_from_positions.norm() < TRACK_ANGLE_DELTA || (position - last_track_position).abs() > TRACK_DISTANCE_DELTA)
+    if (!sim.track.n || (sim.position - sim.last_track_position).norm() * sim.velocity_from_positions.norm() < TRACK_ANGLE_DELTA || (sim.position - sim.last_track_position).abs() > TRACK_DISTANCE_DELTA)
     {
-        track.pos[track.p] = position;
-        track.n++;
-        if (track.n > N_TRACK)
-            track.n = N_TRACK;
-        track.p++;
-        if (track.p == N_TRACK)
-            track.p = 0;
-        last_track_position = position;
-    }
-
-    if (render)
-    {
-        // Redraw everything
-        refresh_all_subwindows();
+        sim.track.pos[sim.track.p] = sim.position;
+        sim.track.n++;
+        if (sim.track.n > N_TRACK)
+            sim.track.n = N_TRACK;
+        sim.track.p++;
+        if (sim.track.p == N_TRACK)
+            sim.track.p = 0;
+        sim.last_track_position = sim.position;
     }
 }
 
-void attitude_stabilization(void)
+void attitude_stabilization(simulation_state_t &sim)
 // Three-axis stabilization to ensure the lander's base is always pointing downwards
 // calculate desired orientation
 {
     vector3d up, left, out;
     double m[16];
 
-    up = position.norm(); // this is the direction we want the lander's nose to point in
+    up = sim.position.norm(); // this is the direction we want the lander's nose to point in
 
     // !!!!!!!!!!!!! HINT TO STUDENTS ATTEMPTING THE EXTENSION EXERCISES !!!!!!!!!!!!!!
     // For any-angle attitude control, we just need to set "up" to something different,
@@ -158,63 +361,74 @@ void attitude_stabilization(void)
     m[14] = 0.0;
     m[15] = 1.0;
     // Decomponse into xyz Euler angles
-    orientation = matrix_to_xyz_euler(m);
+    sim.orientation = matrix_to_xyz_euler(m);
 }
 
-vector3d thrust_wrt_world(void)
+vector3d thrust_wrt_world(simulation_state_t &sim)
 // Works out thrust vector in the world reference frame, given the lander's orientation
 {
-    double m[16], k, delayed_throttle, lag = ENGINE_LAG;
-    vector3d a, b;
+    update_engine(sim);
+    return thrust_force(sim);
+}
 
-    // these static variables maintain the state
-    static double lagged_throttle = 0.0;
-    static double last_time_lag_updated = -1.0;
+void update_engine(simulation_state_t &sim)
+// Clamps the throttle, and moves the engine's delay and lag on to the current simulation time.
+// Only the first call at any one simulation time changes the engine
+{
+    double k, delayed_throttle, lag = ENGINE_LAG;
 
-    if (simulation_time < last_time_lag_updated)
-        lagged_throttle = 0.0; // simulation restarted
+    if (sim.simulation_time < sim.last_time_lag_updated)
+        sim.lagged_throttle = 0.0; // simulation restarted
 
     // clamps throttle and also sets it to be a sensible value
-    if (throttle < 0.0)
-        throttle = 0.0;
-    if (throttle > 1.0)
-        throttle = 1.0;
-    if (landed || (fuel == 0.0))
-        throttle = 0.0;
-
-    if (simulation_time != last_time_lag_updated)
+    if (sim.throttle < 0.0)
+        sim.throttle = 0.0;
+    if (sim.throttle > 1.0)
+        sim.throttle = 1.0;
+    if (sim.landed || (sim.fuel == 0.0))
+        sim.throttle = 0.0;
+
+    if (sim.simulation_time != sim.last_time_lag_updated)
     {
 
         // Delayed throttle value from the throttle history buffer
-        if (throttle_buffer_length > 0)
+        if (sim.throttle_buffer.size() > 0)
         {
-            delayed_throttle = throttle_buffer[throttle_buffer_pointer];
-            throttle_buffer[throttle_buffer_pointer] = throttle;
-            throttle_buffer_pointer = (throttle_buffer_pointer + 1) % throttle_buffer_length;
+            delayed_throttle = sim.throttle_buffer[sim.throttle_buffer_pointer];
+            sim.throttle_buffer[sim.throttle_buffer_pointer] = sim.throttle;
+            sim.throttle_buffer_pointer = (sim.throttle_buffer_pointer + 1) % sim.throttle_buffer.size();
         }
         else
-            delayed_throttle = throttle;
+            delayed_throttle = sim.throttle;
 
         // Lag, with time constant ENGINE_LAG
         if (lag <= 0.0)
             k = 0.0;
         else
-            k = pow(exp(-1.0), delta_t / lag);
-        lagged_throttle = k * lagged_throttle + (1.0 - k) * delayed_throttle;
+            k = pow(exp(-1.0), sim.delta_t / lag);
+        sim.lagged_throttle = k * sim.lagged_throttle + (1.0 - k) * delayed_throttle;
 
         // last_time_lag is simulation time lagged by one step
-        last_time_lag_updated = simulation_time;
+        sim.last_time_lag_updated = sim.simulation_time;
     }
+}
+
+vector3d thrust_force(const simulation_state_t &sim)
+// The thrust vector in the world reference frame from the engine's current (lagged) throttle.
+// Changes nothing, so it can be called as often as needed
+{
+    double m[16];
+    vector3d a, b;
 
-    if (stabilized_attitude && (stabilized_attitude_angle == 0))
+    if (sim.stabilized_attitude && (sim.stabilized_attitude_angle == 0))
     { // specific solution, avoids rounding errors in the more general calculation below
-        b = lagged_throttle * MAX_THRUST * position.norm();
+        b = sim.lagged_throttle * MAX_THRUST * sim.position.norm();
     }
     else
     {
         a.x = 0.0;
         a.y = 0.0;
-        a.z = lagged_throttle * MAX_THRUST;
+        a.z = sim.lagged_throttle * MAX_THRUST;
         // this updates m
         // so is orientation is used in calculating thrust direction!
         /**
@@ -239,7 +453,7 @@ The resulting vector (b) represents the thrust in the world coordinate system.
          *
          *
          */
-        xyz_euler_to_matrix(orientation, m);
+        xyz_euler_to_matrix(sim.orientation, m);
         b.x = m[0] * a.x + m[4] * a.y + m[8] * a.z;
         b.y = m[1] * a.x + m[5] * a.y + m[9] * a.z;
         b.z = m[2] * a.x + m[6] * a.y + m[10] * a.z;
@@ -248,109 +462,172 @@ The resulting vector (b) represents the thrust in the world coordinate system.
     return b;
 }
 
-void update_lander_state(void)
-// The GLUT idle function, called every time round the event loop
+void update_lander_state(simulation_state_t &sim)
+// Advances the given simulation by one time step
 {
-    if (render)
+    // This needs to be called every time step, even if the close-up view is not being rendered,
+    // since any-angle attitude stabilizers reference closeup_coords.right. attitude_stabilization only
+    // stabilizes to the vertical, so a simulation nobody watches can leave it out
+    if (!sim.headless)
     {
-        unsigned long delay;
-
-        // User-controlled delay
-        if ((simulation_speed > 0) && (simulation_speed < 5))
-        {
-            delay = (5 - simulation_speed) * MAX_DELAY / 4;
-#ifdef _WIN32
-            Sleep(delay / 1000); // milliseconds
-#else
-            usleep((useconds_t)delay); // microseconds
-#endif
-        }
+        PROFILE_SCOPE(PROFILE_VISUALIZATION);
+        update_closeup_coords(sim);
     }
 
-    // This needs to be called every time step, even if the close-up view is not being rendered,
-    // since any-angle attitude stabilizers reference closeup_coords.right
-    update_closeup_coords();
-
     // Update historical record
-    last_position = position;
+    sim.last_position = sim.position;
 
     // Mechanical dynamics, update the position and velocity
-    numerical_dynamics();
+    numerical_dynamics(sim);
 
     // Refresh the visualization
-    update_visualization();
+    PROFILE_SCOPE(PROFILE_VISUALIZATION);
+    update_visualization(sim);
 }
 
-void reset_simulation(void)
+void reset_simulation(simulation_state_t &sim)
 // Resets the simulation to the initial state
 {
     vector3d p, tv;
-    unsigned long i;
+    unsigned long throttle_buffer_length;
 
     // Reset these three lander parameters here, so they can be overwritten in initialize_simulation() if so desired
-    stabilized_attitude_angle = 0;
-    throttle = 0.0;
-    fuel = 1.0;
+    sim.stabilized_attitude_angle = 0;
+    sim.throttle = 0.0;
+    sim.fuel = 1.0;
 
     // Restore initial lander state
-    initialize_simulation();
+    initialize_simulation(sim);
 
     // Check whether the lander is underground - if so, make sure it doesn't move anywhere
-    landed = false;
-    crashed = false;
-    altitude = position.abs() - MARS_RADIUS;
-    if (altitude < LANDER_SIZE / 2.0)
+    sim.landed = false;
+    sim.crashed = false;
+    sim.altitude = sim.position.abs() - MARS_RADIUS;
+    if (sim.altitude < LANDER_SIZE / 2.0)
     {
-        if (render)
-        {
-            glutIdleFunc(NULL);
-        }
-        landed = true;
-        velocity = vector3d(0.0, 0.0, 0.0);
+        sim.landed = true;
+        sim.velocity = vector3d(0.0, 0.0, 0.0);
     }
 
     // Visualisation routine's record of various speeds and velocities
-    velocity_from_positions = velocity;
-    last_position = position - delta_t * velocity_from_positions;
-    p = position.norm();
-    climb_speed = velocity_from_positions * p;
-    tv = velocity_from_positions - climb_speed * p;
-    ground_speed = tv.abs();
+    sim.velocity_from_positions = sim.velocity;
+    sim.last_position = sim.position - sim.delta_t * sim.velocity_from_positions;
+    p = sim.position.norm();
+    sim.climb_speed = sim.velocity_from_positions * p;
+    tv = sim.velocity_from_positions - sim.climb_speed * p;
+    sim.ground_speed = tv.abs();
 
     // Miscellaneous state variables
-    throttle_control = (short)(throttle * THROTTLE_GRANULARITY + 0.5);
-    simulation_time = 0.0;
-    track.n = 0;
-    track.p = 0;
-    parachute_lost = false;
-    closeup_coords.initialized = false;
-    closeup_coords.backwards = false;
-    closeup_coords.right = vector3d(1.0, 0.0, 0.0);
-    update_closeup_coords();
+    sim.throttle_control = (short)(sim.throttle * THROTTLE_GRANULARITY + 0.5);
+    sim.simulation_time = 0.0;
+    sim.track.n = 0;
+    sim.track.p = 0;
+    sim.parachute_lost = false;
+    sim.closeup_coords.initialized = false;
+    sim.closeup_coords.backwards = false;
+    sim.closeup_coords.right = vector3d(1.0, 0.0, 0.0);
+    update_closeup_coords(sim);
 
     // Initialize the throttle history buffer
-    if (delta_t > 0.0)
-        throttle_buffer_length = (unsigned long)(ENGINE_DELAY / delta_t + 0.5);
+    if (sim.delta_t > 0.0)
+        throttle_buffer_length = (unsigned long)(ENGINE_DELAY / sim.delta_t + 0.5);
     else
         throttle_buffer_length = 0;
-    if (throttle_buffer_length > 0)
-    {
-        if (throttle_buffer != NULL)
-            delete[] throttle_buffer;
-        throttle_buffer = new double[throttle_buffer_length];
-        for (i = 0; i < throttle_buffer_length; i++)
-            throttle_buffer[i] = throttle;
-        throttle_buffer_pointer = 0;
-    }
+    sim.throttle_buffer.assign(throttle_buffer_length, sim.throttle);
+    sim.throttle_buffer_pointer = 0;
+}
 
-    if (render)
-    {
-        // Reset GLUT state
-        if (paused || landed)
-            refresh_all_subwindows();
-        else
-        {
-            glutIdleFunc(update_lander_state);
-        }
-    }
-}
\ No newline at end of file
+void snapshot_simulation(const simulation_state_t &sim, simulation_snapshot_t &snapshot)
+// Copies the dynamic state of the simulation into snapshot
+{
+    if (sim.throttle_buffer.size() > SNAPSHOT_MAX_THROTTLE_BUFFER)
+        throw std::length_error("the throttle history is longer than SNAPSHOT_MAX_THROTTLE_BUFFER");
+
+    // zero everything first, so two snapshots of the same state are the same bytes, padding included
+    memset(&snapshot, 0, sizeof(snapshot));
+    snapshot.version = SNAPSHOT_VERSION;
+    snapshot.position = sim.position;
+    snapshot.orientation = sim.orientation;
+    snapshot.velocity = sim.velocity;
+    snapshot.velocity_from_positions = sim.velocity_from_positions;
+    snapshot.last_position = sim.last_position;
+    snapshot.position_prev = sim.position_prev;
+    snapshot.climb_speed = sim.climb_speed;
+    snapshot.ground_speed = sim.ground_speed;
+    snapshot.altitude = sim.altitude;
+    snapshot.throttle = sim.throttle;
+    snapshot.fuel = sim.fuel;
+    snapshot.stabilized_attitude = sim.stabilized_attitude;
+    snapshot.autopilot_enabled = sim.autopilot_enabled;
+    snapshot.parachute_lost = sim.parachute_lost;
+    snapshot.landed = sim.landed;
+    snapshot.crashed = sim.crashed;
+    snapshot.headless = sim.headless;
+    snapshot.parachute_status = sim.parachute_status;
+    snapshot.stabilized_attitude_angle = sim.stabilized_attitude_angle;
+    snapshot.integrator = sim.integrator;
+    snapshot.n_substeps = sim.n_substeps;
+    snapshot.delta_t = sim.delta_t;
+    snapshot.simulation_time = sim.simulation_time;
+    snapshot.throttle_control = sim.throttle_control;
+    snapshot.lagged_throttle = sim.lagged_throttle;
+    snapshot.last_time_lag_updated = sim.last_time_lag_updated;
+    snapshot.throttle_buffer_length = (unsigned int)sim.throttle_buffer.size();
+    snapshot.throttle_buffer_pointer = (unsigned int)sim.throttle_buffer_pointer;
+    std::copy(sim.throttle_buffer.begin(), sim.throttle_buffer.end(), snapshot.throttle_buffer);
+    snapshot.closeup_coords = sim.closeup_coords;
+    snapshot.terrain_angle = sim.terrain_angle;
+}
+
+void restore_simulation(simulation_state_t &sim, const simulation_snapshot_t &snapshot)
+// Puts the simulation back into the state it was in when snapshot was taken. The track is cleared, and the
+// simulation keeps its own headless setting, so a viewer still draws a state saved by a headless agent
+{
+    if (snapshot.version != SNAPSHOT_VERSION)
+        throw std::invalid_argument("the snapshot comes from a different version of the simulation");
+    // a snapshot can come from Python as any bytes, so everything the steps rely on is checked, as configure does
+    if (snapshot.throttle_buffer_length > SNAPSHOT_MAX_THROTTLE_BUFFER)
+        throw std::invalid_argument("the snapshot is corrupt, its throttle history is too long");
+    if (snapshot.throttle_buffer_length > 0 && snapshot.throttle_buffer_pointer >= snapshot.throttle_buffer_length)
+        throw std::invalid_argument("the snapshot is corrupt, its throttle history pointer is out of range");
+    if (snapshot.integrator < VERLET || snapshot.integrator > YOSHIDA)
+        throw std::invalid_argument("the snapshot is corrupt, its integrator is unknown");
+    if (snapshot.n_substeps < 1)
+        throw std::invalid_argument("the snapshot is corrupt, n_substeps must be at least 1");
+    if (!(snapshot.delta_t > 0.0))
+        throw std::invalid_argument("the snapshot is corrupt, delta_t must be positive");
+    if (snapshot.parachute_status < NOT_DEPLOYED || snapshot.parachute_status > LOST)
+        throw std::invalid_argument("the snapshot is corrupt, its parachute status is unknown");
+
+    sim.position = snapshot.position;
+    sim.orientation = snapshot.orientation;
+    sim.velocity = snapshot.velocity;
+    sim.velocity_from_positions = snapshot.velocity_from_positions;
+    sim.last_position = snapshot.last_position;
+    sim.position_prev = snapshot.position_prev;
+    sim.climb_speed = snapshot.climb_speed;
+    sim.ground_speed = snapshot.ground_speed;
+    sim.altitude = snapshot.altitude;
+    sim.throttle = snapshot.throttle;
+    sim.fuel = snapshot.fuel;
+    sim.stabilized_attitude = snapshot.stabilized_attitude;
+    sim.autopilot_enabled = snapshot.autopilot_enabled;
+    sim.parachute_lost = snapshot.parachute_lost;
+    sim.landed = snapshot.landed;
+    sim.crashed = snapshot.crashed;
+    sim.parachute_status = (parachute_status_t)snapshot.parachute_status;
+    sim.stabilized_attitude_angle = snapshot.stabilized_attitude_angle;
+    sim.integrator = (integrator_t)snapshot.integrator;
+    sim.n_substeps = snapshot.n_substeps;
+    sim.delta_t = snapshot.delta_t;
+    sim.simulation_time = snapshot.simulation_time;
+    sim.throttle_control = snapshot.throttle_control;
+    sim.lagged_throttle = snapshot.lagged_throttle;
+    sim.last_time_lag_updated = snapshot.last_time_lag_updated;
+    sim.throttle_buffer.assign(snapshot.throttle_buffer, snapshot.throttle_buffer + snapshot.throttle_buffer_length);
+    sim.throttle_buffer_pointer = snapshot.throttle_buffer_pointer;
+    sim.closeup_coords = snapshot.closeup_coords;
+    sim.terrain_angle = snapshot.terrain_angle;
+    sim.track.n = 0;
+    sim.track.p = 0;
+}
@@ -1,4 +1,9 @@
+// the graphics engine is optional, see LANDER_GRAPHICS in CMakeLists.txt
+#ifdef LANDER_GRAPHICS
 #include "lander.h"
+#else
+#include "lander_core.h"
+#endif
 
 /**
  * MAIN FUNCTION
@@ -9,21 +14,61 @@
 // declare core variables, that I change regularly
 // IVE ADDED THIS: whether or not to use GLUT to simulate or no picture
 bool render = false;
-bool agent_flag = true;
+// agent_flag, whether to use the RL agent or the proportional autopilot, is in autopilot.cpp with the core
 
 int main(int argc, char *argv[])
-// Initializes GLUT windows and lander state, then enters GLUT main loop
+// Initializes GLUT windows and lander state, then enters GLUT main loop.
+// lander policy.bin flies a policy exported by export_policy.py, instead of the test throttle.
+// lander --replay <directory> [episode] shows a TrajectoryRecorder's recording instead of simulating
 {
+    if (argc > 1 && string(argv[1]) == "--replay")
+    {
+#ifdef LANDER_GRAPHICS
+        if (argc < 3)
+        {
+            cout << "usage: lander --replay <recording directory> [episode]" << endl;
+            return 1;
+        }
+        if (!start_replay(argv[2], argc > 3 ? atoi(argv[3]) : 0))
+            return 1;
+        run_graphics(argc, argv);
+        return 0;
+#else
+        cout << "this lander was built without graphics (LANDER_GRAPHICS=OFF)" << endl;
+        return 1;
+#endif
+    }
+
+    if (argc > 1)
+    {
+        try
+        {
+            agent.policy = std::make_shared<MlpPolicy>(argv[1]);
+        }
+        catch (const std::runtime_error &error)
+        {
+            cout << error.what() << endl;
+            return 1;
+        }
+    }
+
     if (render)
     {
-        if (agent_flag)
+        if (agent_flag && !agent.policy)
         {
-            cout << "issues with global variables. Not implemented yet!" << endl;
+            cout << "the agent needs a policy to fly with graphics: lander <policy file>" << endl;
             return 1;
         }
+#ifdef LANDER_GRAPHICS
+        // autopilot_agent flies the policy whenever the autopilot is engaged
+        simulation.policy = agent.policy.get();
         // TODO: the referencing & here MAY CAUSE ISSUES
         run_graphics(argc, argv);
         return 0;
+#else
+        cout << "this lander was built without graphics (LANDER_GRAPHICS=OFF)" << endl;
+        return 1;
+#endif
     }
     // DONT USE GLUT RENDERING
     else
@@ -34,6 +79,7 @@ int main(int argc, char *argv[])
     }
 }
 
+#ifdef LANDER_GRAPHICS
 void run_graphics(int argc, char *argv[])
 {
     {
@@ -126,14 +172,19 @@ void run_graphics(int argc, char *argv[])
         for (i = 0; i < N_RAND; i++)
             randtab[i] = (float)rand() / RAND_MAX;
 
-        // Initialize the simulation state
-        reset_simulation();
+        // Initialize the simulation state, or the replay
+        if (replaying)
+            begin_replay();
+        else
+            reset_simulation();
         microsecond_time(time_program_started);
 
         glutMainLoop();
     }
 }
 
+#endif
+
 void run_one_episode()
 {
     if (agent_flag)
@@ -156,26 +207,32 @@ void run_one_episode()
 
         float test_throttle = 0.0;
 
-        // Main simulation loop
-        while (!landed && !crashed)
+        if (agent.policy)
+        {
+            int n_steps = agent.runPolicy(1000000);
+            std::cout << "Policy flew " << n_steps << " steps" << std::endl;
+        }
+
+        // Main simulation loop, ramping the throttle up, if there is no policy
+        while (!agent.isLanded() && !agent.isCrashed())
         // for (int i = 0; i < 10; i++)
         {
-            // acess global variable
+            // access the agent's own simulation state
             vector<double> states = agent.getState();
             // at this point, we have position and velocity
             // have just gotten an action
             // Optional: Print current state or other relevant information
             std::cout << " PRESTEP - Time: " << states[0]
                       // state
-                      << " Rx: " << states[1] << " Global Pos X: " << position.x
-                      << " Ry: " << states[2] << " Global Pos Y: " << position.y
-                      << " Vx: " << states[4] << " Global V X: " << velocity.x
-                      << " Vy: " << states[5] << " Global V Y: " << position.x
+                      << " Rx: " << states[1] << " Sim Pos X: " << agent.simulation.position.x
+                      << " Ry: " << states[2] << " Sim Pos Y: " << agent.simulation.position.y
+                      << " Vx: " << states[4] << " Sim V X: " << agent.simulation.velocity.x
+                      << " Vy: " << states[5] << " Sim V Y: " << agent.simulation.position.x
 
                       << " Fuel Left (Proportion): " << states[10]
-                      << " Altitude: " << states[11] << " Global Altitude: " << altitude
+                      << " Altitude: " << states[11] << " Sim Altitude: " << agent.simulation.altitude
                       // action made
-                      << " Throttle Action: " << throttle
+                      << " Throttle Action: " << agent.simulation.throttle
                       << endl;
 
             // step with increasing throttle to test
@@ -189,20 +246,20 @@ void run_one_episode()
             states = agent.getState();
             std::cout << " POSTSTEP - Time: " << states[0]
                       // state
-                      << " Rx: " << states[1] << " Global Pos X: " << position.x
-                      << " Ry: " << states[2] << " Global Pos Y: " << position.y
-                      << " Vx: " << states[4] << " Global V X: " << velocity.x
-                      << " Vy: " << states[5] << " Global V Y: " << position.x
+                      << " Rx: " << states[1] << " Sim Pos X: " << agent.simulation.position.x
+                      << " Ry: " << states[2] << " Sim Pos Y: " << agent.simulation.position.y
+                      << " Vx: " << states[4] << " Sim V X: " << agent.simulation.velocity.x
+                      << " Vy: " << states[5] << " Sim V Y: " << agent.simulation.position.x
 
                       << " Fuel Left (Proportion): " << states[10]
-                      << " Altitude: " << states[11] << " Global Altitude: " << altitude
+                      << " Altitude: " << states[11] << " Sim Altitude: " << agent.simulation.altitude
                       // action made
-                      << " Throttle Action: " << throttle
+                      << " Throttle Action: " << agent.simulation.throttle
                       << endl;
         }
 
         // Simulation ended
-        if (crashed)
+        if (agent.isCrashed())
         {
             std::cout << "Lander crashed!" << std::endl;
         }
@@ -212,11 +269,11 @@ void run_one_episode()
         }
 
         // Print final stats
-        std::cout << "Crashed status " << crashed << std::endl;
-        std::cout << "Final altitude: " << altitude << std::endl;
-        std::cout << "Ground speed at landing: " << ground_speed << std::endl;
-        std::cout << "Descent rate at landing: " << -climb_speed << std::endl;
-        std::cout << "Remaining fuel " << fuel * FUEL_CAPACITY << " litres" << std::endl;
+        std::cout << "Crashed status " << agent.simulation.crashed << std::endl;
+        std::cout << "Final altitude: " << agent.simulation.altitude << std::endl;
+        std::cout << "Ground speed at landing: " << agent.simulation.ground_speed << std::endl;
+        std::cout << "Descent rate at landing: " << -agent.simulation.climb_speed << std::endl;
+        std::cout << "Remaining fuel " << agent.simulation.fuel * FUEL_CAPACITY << " litres" << std::endl;
     }
 
     // choose not to render, but no agent
@@ -0,0 +1,61 @@
+#include <algorithm>
+#include <stdexcept>
+// Implementation (normalizer.cpp), running statistics for observation and reward normalization
+#include "lander_core.h"
+
+RunningMeanStd::RunningMeanStd(int size, double initial_count)
+    : mean(size, 0.0), var(size, 1.0), count(initial_count)
+{
+    if (size < 1)
+        throw std::invalid_argument("a RunningMeanStd needs at least one value per row");
+}
+
+void RunningMeanStd::update(const double *batch, long n_rows)
+{
+    if (n_rows < 1)
+        return;
+    int size = this->size();
+    double batch_count = (double)n_rows;
+    double tot_count = this->count + batch_count;
+    for (int j = 0; j < size; j++)
+    {
+        // the batch's own mean and (population) variance, in two passes for accuracy
+        double batch_mean = 0.0, batch_var = 0.0;
+        for (long i = 0; i < n_rows; i++)
+            batch_mean += batch[i * size + j];
+        batch_mean /= batch_count;
+        for (long i = 0; i < n_rows; i++)
+        {
+            double d = batch[i * size + j] - batch_mean;
+            batch_var += d * d;
+        }
+        batch_var /= batch_count;
+
+        // update_mean_var_count_from_moments, term for term
+        double delta = batch_mean - this->mean[j];
+        double m_a = this->var[j] * this->count;
+        double m_b = batch_var * batch_count;
+        double M2 = m_a + m_b + delta * delta * this->count * batch_count / tot_count;
+        this->mean[j] = this->mean[j] + delta * batch_count / tot_count;
+        this->var[j] = M2 / tot_count;
+    }
+    this->count = tot_count;
+}
+
+void RunningMeanStd::normalize(const double *in, double *out, long n_rows, double epsilon, double clip) const
+{
+    int size = this->size();
+    for (long i = 0; i < n_rows; i++)
+    {
+        for (int j = 0; j < size; j++)
+        {
+            double x = (in[i * size + j] - this->mean[j]) / sqrt(this->var[j] + epsilon);
+            out[i * size + j] = std::min(std::max(x, -clip), clip);
+        }
+    }
+}
+
+int RunningMeanStd::size() const
+{
+    return (int)this->mean.size();
+}
@@ -0,0 +1,59 @@
+// Mars lander simulator
+// Free fall around Mars for many orbits at once
+
+// The orbit scenarios of assignment2.py, with nothing but the lander's gravity_force acting. Every orbit has its own
+// time step and length, and runs as one task of run_parallel_tasks. The loops are those of src/orbits.py, which
+// falls back on numpy when this module is not built: Euler, or Verlet started with one Euler step, its velocity the
+// central difference of the positions and the backward difference at the last step
+
+#include "lander_core.h"
+
+static void propagate_orbit(bool verlet, const double *r0, const double *v0, double dt, long long n_steps,
+                            long long every, double gm, double *r_out, double *v_out, double *a_out)
+{
+  vector3d r(r0[0], r0[1], r0[2]), v(v0[0], v0[1], v0[2]), r_prev, r_next, a;
+
+  for (long long j = 0; j < n_steps; j++)
+  {
+    a = gravity_force(r, gm);
+    if (verlet)
+    {
+      if (j == 0)
+        r_next = r + dt * v;
+      else
+      {
+        r_next = 2.0 * r - r_prev + (dt * dt) * a;
+        v = (j == n_steps - 1) ? (r - r_prev) / dt : (r_next - r_prev) / (2.0 * dt);
+      }
+    }
+
+    if (j % every == 0)
+    {
+      long long k = 3 * (j / every);
+      r_out[k] = r.x, r_out[k + 1] = r.y, r_out[k + 2] = r.z;
+      v_out[k] = v.x, v_out[k + 1] = v.y, v_out[k + 2] = v.z;
+      a_out[k] = a.x, a_out[k + 1] = a.y, a_out[k + 2] = a.z;
+    }
+
+    if (verlet)
+    {
+      r_prev = r;
+      r = r_next;
+    }
+    else
+    {
+      r = r + dt * v;
+      v = v + dt * a;
+    }
+  }
+}
+
+void propagate_orbits(bool verlet, int n_orbits, const double *r0, const double *v0, const double *dt,
+                      const long long *n_steps, const long long *every, double gm, long long n_samples, int n_threads,
+                      double *r, double *v, double *a)
+{
+  run_parallel_tasks(n_orbits, n_threads, [&](int i)
+                     {
+                       long long row = 3 * n_samples * i;
+                       propagate_orbit(verlet, r0 + 3 * i, v0 + 3 * i, dt[i], n_steps[i], every[i], gm, r + row, v + row, a + row); });
+}
@@ -0,0 +1,189 @@
+#include <algorithm>
+#include <stdexcept>
+#include <cstring>
+// Implementation (policy.cpp), trained policies flown in C++, without Python or torch
+#include "lander_core.h"
+
+const int observation_state_indices[N_OBSERVATION] = {1, 2, 3, 4, 5, 6, 10, 11, 12};
+
+namespace
+{
+    const char POLICY_MAGIC[8] = {'L', 'N', 'D', 'R', 'M', 'L', 'P', '1'};
+
+    // the file is little-endian, as are the machines this builds on
+    template <typename T>
+    void read_values(std::ifstream &file, T *values, size_t n, const string &path)
+    {
+        file.read(reinterpret_cast<char *>(values), n * sizeof(T));
+        if (!file)
+            throw std::runtime_error(path + " ends early, it is not a complete policy file");
+    }
+}
+
+MlpPolicy::MlpPolicy(const string &path)
+{
+    std::ifstream file(path.c_str(), std::ios::binary);
+    if (!file)
+        throw std::runtime_error("cannot open policy file " + path);
+    char magic[8];
+    read_values(file, magic, 8, path);
+    if (memcmp(magic, POLICY_MAGIC, 8) != 0)
+        throw std::runtime_error(path + " is not a policy file written by export_policy.py");
+
+    int header[4];
+    read_values(file, header, 4, path);
+    int n_layers = header[1];
+    this->n_inputs = header[0];
+    if (this->n_inputs != N_OBSERVATION)
+        throw std::runtime_error(path + " is not a policy for LanderEnv's observation");
+    if (n_layers < 1 || n_layers > MLP_MAX_LAYERS || (header[2] != TANH_ACTIVATION && header[2] != RELU_ACTIVATION))
+        throw std::runtime_error(path + " has an unknown network layout");
+    this->activation = (activation_t)header[2];
+    this->normalize_observations = header[3] != 0;
+
+    this->layer_sizes.resize(n_layers);
+    read_values(file, this->layer_sizes.data(), n_layers, path);
+    if (this->layer_sizes.back() != 1)
+        throw std::runtime_error(path + " does not output one throttle action");
+
+    // every size is checked, and the rest of the file must hold what they add up to, before anything is allocated
+    // from them, so a corrupt header cannot ask for more memory than the file could fill
+    size_t n_bytes = 2 * this->n_inputs * sizeof(double) + 2 * sizeof(double);
+    int inputs = this->n_inputs;
+    for (int size : this->layer_sizes)
+    {
+        if (size < 1 || size > MLP_MAX_WIDTH)
+            throw std::runtime_error(path + " has a layer of " + std::to_string(size) + " units, MlpPolicy takes 1 to " +
+                                     std::to_string(MLP_MAX_WIDTH));
+        n_bytes += ((size_t)size * inputs + size) * sizeof(float);
+        inputs = size;
+    }
+    std::streampos start = file.tellg();
+    file.seekg(0, std::ios::end);
+    if (file.tellg() - start < (std::streamoff)n_bytes)
+        throw std::runtime_error(path + " ends early, it is not a complete policy file");
+    file.seekg(start);
+
+    this->obs_mean.resize(this->n_inputs);
+    this->obs_var.resize(this->n_inputs);
+    read_values(file, this->obs_mean.data(), this->n_inputs, path);
+    read_values(file, this->obs_var.data(), this->n_inputs, path);
+    read_values(file, &this->epsilon, 1, path);
+    read_values(file, &this->clip, 1, path);
+
+    inputs = this->n_inputs;
+    for (int size : this->layer_sizes)
+    {
+        this->weights.push_back(vector<float>((size_t)size * inputs));
+        this->biases.push_back(vector<float>(size));
+        read_values(file, this->weights.back().data(), this->weights.back().size(), path);
+        read_values(file, this->biases.back().data(), size, path);
+        inputs = size;
+    }
+}
+
+double MlpPolicy::act(const float *observation) const
+{
+    // on the stack, act runs once per step and on several threads at once
+    float in[MLP_MAX_WIDTH], out[MLP_MAX_WIDTH];
+
+    // normalized in double and rounded back to float, as NormalizationStats.observations does
+    for (int j = 0; j < this->n_inputs; j++)
+    {
+        if (!this->normalize_observations)
+        {
+            in[j] = observation[j];
+            continue;
+        }
+        double x = (observation[j] - this->obs_mean[j]) / sqrt(this->obs_var[j] + this->epsilon);
+        in[j] = (float)std::min(std::max(x, -this->clip), this->clip);
+    }
+
+    int inputs = this->n_inputs;
+    int n_layers = (int)this->layer_sizes.size();
+    for (int layer = 0; layer < n_layers; layer++)
+    {
+        int outputs = this->layer_sizes[layer];
+        const float *w = this->weights[layer].data();
+        for (int i = 0; i < outputs; i++)
+        {
+            float sum = this->biases[layer][i];
+            for (int j = 0; j < inputs; j++)
+                sum += w[i * inputs + j] * in[j];
+            // no activation after the action layer
+            if (layer < n_layers - 1)
+                sum = this->activation == TANH_ACTIVATION ? std::tanh(sum) : std::max(sum, 0.0f);
+            out[i] = sum;
+        }
+        std::copy(out, out + outputs, in);
+        inputs = outputs;
+    }
+    return std::min(std::max((double)in[0], -1.0), 1.0);
+}
+
+double MlpPolicy::throttle(const double *state) const
+{
+    float observation[N_OBSERVATION];
+    for (int j = 0; j < N_OBSERVATION; j++)
+        observation[j] = (float)state[observation_state_indices[j]];
+    // LanderEnv.action_space_model_to_real
+    return 0.5 * this->act(observation) + 0.5;
+}
+
+int Agent::runPolicy(int n_steps, int frame_skip)
+{
+    if (!this->policy)
+        throw std::logic_error("the agent has no policy to fly");
+    if (frame_skip < 1)
+        throw std::invalid_argument("frame_skip must be at least 1");
+    int i;
+    double throttle = 0.0, total_reward = 0.0;
+    for (i = 0; i < n_steps && !this->simulation.landed; i++)
+    {
+        if (i % frame_skip == 0)
+            throttle = this->policy->throttle(this->state_buffer);
+        this->step(throttle);
+        total_reward += this->reward;
+    }
+    this->reward = total_reward;
+    return i;
+}
+
+autopilot_score_t run_policy_episode(const MlpPolicy &policy, const double *init_conditions, int max_steps, int frame_skip)
+// one landing from init_conditions, scored as run_autopilot_episode scores the proportional controller
+{
+    Agent lander;
+    autopilot_score_t score;
+    simulation_state_t &sim = lander.simulation;
+
+    lander.reset(vector<double>(init_conditions, init_conditions + N_INIT_CONDITIONS));
+    double initial_fuel = sim.fuel;
+    double state[N_STATE], throttle = 0.0;
+
+    for (score.steps = 0; score.steps < max_steps && !sim.landed; score.steps++)
+    {
+        if (score.steps % frame_skip == 0)
+        {
+            write_state(sim, state);
+            throttle = policy.throttle(state);
+        }
+        sim.throttle = throttle;
+        update_lander_state(sim);
+    }
+
+    score.fuel_used = (initial_fuel - sim.fuel) * FUEL_CAPACITY;
+    score.descent_rate = -sim.climb_speed;
+    score.ground_speed = sim.ground_speed;
+    score.landed = sim.landed;
+    score.crashed = sim.crashed;
+    return score;
+}
+
+void evaluate_policy(const MlpPolicy &policy, const double *init_conditions, int n_episodes, int max_steps,
+                     int frame_skip, int n_threads, autopilot_score_t *scores)
+{
+    if (frame_skip < 1)
+        throw std::invalid_argument("frame_skip must be at least 1");
+    run_parallel_tasks(n_episodes, n_threads, [&](int j)
+                       { scores[j] = run_policy_episode(policy, init_conditions + j * N_INIT_CONDITIONS, max_steps, frame_skip); });
+}
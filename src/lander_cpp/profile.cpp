@@ -0,0 +1,40 @@
+// Implementation (profile.cpp), the per-phase counters of a LANDER_PROFILE build
+#include "lander_core.h"
+
+const char *profile_phase_names[N_PROFILE_PHASES] = {
+    "step",
+    "integrator",
+    "autopilot",
+    "attitude_stabilization",
+    "visualization",
+    "reward",
+    "state_readout"};
+
+#ifdef LANDER_PROFILE
+profile_counter_t profile_counters[N_PROFILE_PHASES];
+#endif
+
+void read_profile_counters(unsigned long long *calls, double *seconds)
+{
+    for (int i = 0; i < N_PROFILE_PHASES; i++)
+    {
+#ifdef LANDER_PROFILE
+        calls[i] = profile_counters[i].calls.load();
+        seconds[i] = profile_counters[i].nanoseconds.load() * 1e-9;
+#else
+        calls[i] = 0;
+        seconds[i] = 0.0;
+#endif
+    }
+}
+
+void reset_profile_counters()
+{
+#ifdef LANDER_PROFILE
+    for (int i = 0; i < N_PROFILE_PHASES; i++)
+    {
+        profile_counters[i].calls.store(0);
+        profile_counters[i].nanoseconds.store(0);
+    }
+#endif
+}
@@ -0,0 +1,220 @@
+#include <cstdio>
+#include <cstring>
+#include <stdexcept>
+// Implementation (recorder.cpp), the native trajectory recorder
+#include "lander_core.h"
+
+const char *record_column_names[N_RECORD_COLUMNS] = {
+    "simulation_time",
+    "position_x", "position_y", "position_z",
+    "velocity_x", "velocity_y", "velocity_z",
+    "orientation_x", "orientation_y", "orientation_z",
+    "fuel",
+    "altitude",
+    "climb_speed",
+    "ground_speed",
+    "throttle",
+    "parachute_status"};
+
+// every header is padded to this many bytes (a multiple of 64, as the format asks), so it can be
+// rewritten in place with a longer shape as rows are appended
+#define NPY_HEADER_SIZE 128
+
+static void write_npy_header(FILE *file, const char *descr, long long n_rows)
+// writes a version 1.0 .npy header for a 1D array of n_rows at the start of file
+{
+    char header[NPY_HEADER_SIZE];
+    int dict_length;
+
+    // the data is written in the machine's byte order, which the descr strings below assume is little endian
+    memset(header, ' ', NPY_HEADER_SIZE);
+    memcpy(header, "\x93NUMPY\x01\x00", 8);
+    header[8] = (char)((NPY_HEADER_SIZE - 10) & 0xff);
+    header[9] = (char)((NPY_HEADER_SIZE - 10) >> 8);
+    dict_length = snprintf(header + 10, NPY_HEADER_SIZE - 10, "{'descr': '%s', 'fortran_order': False, 'shape': (%lld,), }",
+                           descr, n_rows);
+    // snprintf leaves a terminating zero, which is part of the space padding
+    header[10 + dict_length] = ' ';
+    header[NPY_HEADER_SIZE - 1] = '\n';
+
+    fseek(file, 0, SEEK_SET);
+    fwrite(header, 1, NPY_HEADER_SIZE, file);
+}
+
+static FILE *open_or_throw(const string &path, const char *mode)
+{
+    FILE *file = fopen(path.c_str(), mode);
+    if (file == NULL)
+        throw std::runtime_error("cannot open " + path + " for writing");
+    return file;
+}
+
+template <typename T>
+static vector<T> read_npy(const string &path, const char *descr)
+// reads a 1D .npy array of descr, as written by write_npy_header or by numpy itself
+{
+    FILE *file = fopen(path.c_str(), "rb");
+    unsigned char preamble[12];
+    size_t header_length;
+    long long n_rows;
+    vector<T> values;
+
+    if (file == NULL)
+        throw std::runtime_error("cannot open " + path + " for reading");
+    // the header length is 2 bytes in version 1.0, and 4 bytes from 2.0 on
+    if (fread(preamble, 1, 10, file) != 10 || memcmp(preamble, "\x93NUMPY", 6) != 0)
+    {
+        fclose(file);
+        throw std::runtime_error(path + " is not a .npy file");
+    }
+    header_length = preamble[8] | (preamble[9] << 8);
+    if (preamble[6] > 1)
+    {
+        if (fread(preamble + 10, 1, 2, file) != 2)
+        {
+            fclose(file);
+            throw std::runtime_error(path + " is not a .npy file");
+        }
+        header_length |= ((size_t)preamble[10] << 16) | ((size_t)preamble[11] << 24);
+    }
+    string header(header_length, ' ');
+    if (fread(&header[0], 1, header_length, file) != header_length)
+    {
+        fclose(file);
+        throw std::runtime_error(path + " is not a .npy file");
+    }
+
+    size_t shape = header.find("'shape': (");
+    if (header.find(string("'descr': '") + descr + "'") == string::npos ||
+        header.find("'fortran_order': False") == string::npos || shape == string::npos ||
+        sscanf(header.c_str() + shape + 10, "%lld,)", &n_rows) != 1)
+    {
+        fclose(file);
+        throw std::runtime_error(path + " does not hold a 1D array of " + descr);
+    }
+
+    values.resize(n_rows);
+    size_t n_read = fread(values.data(), sizeof(T), n_rows, file);
+    fclose(file);
+    if ((long long)n_read != n_rows)
+        throw std::runtime_error(path + " is shorter than its header says");
+    return values;
+}
+
+TrajectoryRecorder::TrajectoryRecorder(const string &directory, long capacity)
+    : directory(directory), capacity(capacity), n_buffered(0), n_flushed(0)
+{
+    if (capacity < 1)
+        throw std::invalid_argument("capacity must be at least 1");
+    this->buffer.assign(N_RECORD_COLUMNS * capacity, 0.0);
+
+    // start every file empty, which also checks that they can be written
+    for (int c = 0; c < N_RECORD_COLUMNS; c++)
+    {
+        FILE *file = open_or_throw(this->columnPath(c), "wb");
+        write_npy_header(file, "<f8", 0);
+        fclose(file);
+    }
+    FILE *file = open_or_throw(this->directory + "/episode_starts.npy", "wb");
+    write_npy_header(file, "<i8", 0);
+    fclose(file);
+}
+
+TrajectoryRecorder::~TrajectoryRecorder()
+{
+    // a destructor must not throw, a failed last write is lost
+    try
+    {
+        this->flush();
+    }
+    catch (const std::exception &)
+    {
+    }
+}
+
+string TrajectoryRecorder::columnPath(int column) const
+{
+    return this->directory + "/" + record_column_names[column] + ".npy";
+}
+
+void TrajectoryRecorder::startEpisode()
+{
+    this->episode_starts.push_back(this->size());
+}
+
+void TrajectoryRecorder::record(const simulation_state_t &sim, double throttle)
+{
+    double row[N_RECORD_COLUMNS];
+
+    if (this->n_buffered == this->capacity)
+        this->flush();
+    write_state(sim, row);
+    row[N_STATE] = throttle;
+    row[N_STATE + 1] = (double)sim.parachute_status;
+    for (int c = 0; c < N_RECORD_COLUMNS; c++)
+        this->buffer[c * this->capacity + this->n_buffered] = row[c];
+    this->n_buffered++;
+}
+
+void TrajectoryRecorder::flush()
+{
+    long long n_rows = this->n_flushed + this->n_buffered;
+
+    for (int c = 0; c < N_RECORD_COLUMNS; c++)
+    {
+        FILE *file = open_or_throw(this->columnPath(c), "r+b");
+        fseek(file, 0, SEEK_END);
+        fwrite(this->buffer.data() + c * this->capacity, sizeof(double), this->n_buffered, file);
+        write_npy_header(file, "<f8", n_rows);
+        fclose(file);
+    }
+    this->n_flushed = n_rows;
+    this->n_buffered = 0;
+
+    // only a few numbers, so it is simply rewritten
+    FILE *file = open_or_throw(this->directory + "/episode_starts.npy", "wb");
+    write_npy_header(file, "<i8", (long long)this->episode_starts.size());
+    fwrite(this->episode_starts.data(), sizeof(long long), this->episode_starts.size(), file);
+    fclose(file);
+}
+
+long TrajectoryRecorder::size() const
+{
+    return this->n_flushed + this->n_buffered;
+}
+
+long TrajectoryRecorder::nEpisodes() const
+{
+    return (long)this->episode_starts.size();
+}
+
+recording_t load_recording(const string &directory)
+{
+    recording_t recording;
+
+    recording.columns.resize(N_RECORD_COLUMNS);
+    recording.episode_starts = read_npy<long long>(directory + "/episode_starts.npy", "<i8");
+    recording.n_rows = -1;
+    for (int c = 0; c < N_RECORD_COLUMNS; c++)
+    {
+        string path = directory + "/" + record_column_names[c] + ".npy";
+        // the parachute status was not recorded at first
+        if (c == N_STATE + 1 && recording.n_rows >= 0)
+        {
+            FILE *file = fopen(path.c_str(), "rb");
+            if (file == NULL)
+            {
+                recording.columns[c].assign(recording.n_rows, (double)NOT_DEPLOYED);
+                continue;
+            }
+            fclose(file);
+        }
+        recording.columns[c] = read_npy<double>(path, "<f8");
+        // a recording still being written can be read while one column has more rows flushed than another
+        if (recording.n_rows < 0 || (long)recording.columns[c].size() < recording.n_rows)
+            recording.n_rows = (long)recording.columns[c].size();
+    }
+    for (int c = 0; c < N_RECORD_COLUMNS; c++)
+        recording.columns[c].resize(recording.n_rows);
+    return recording;
+}
@@ -0,0 +1,315 @@
+// Mars lander simulator
+// Replay of recorded trajectories in the graphics engine
+
+// The rows a TrajectoryRecorder wrote (see recorder.cpp) are shown in the close-up, orbital and instrument
+// windows exactly as update_lander_state would have left the global simulation after every step, with no
+// physics run at all. Playback follows the wall clock at a variable speed: every idle call jumps to the row
+// due at that moment and draws it, so rows that cannot be drawn in time are skipped. The track and the
+// close-up frame still go through every row, skipped or not, so they look the same at any speed
+
+#include "lander.h"
+#include <algorithm>
+
+bool replaying = false;
+
+// the recording, and the rows of the episode on screen, last_row included
+static recording_t recording;
+static string recording_directory;
+static int episode = 0;
+static long first_row, last_row, shown_row;
+// where playback is, in simulated seconds, and how many simulated seconds pass per second of wall time
+static double replay_time;
+static double replay_speed = 1.0;
+// without frame skipping every row is drawn, and playback falls behind the clock when drawing is slow
+static bool skip_frames = true;
+static unsigned long long last_wall_time;
+
+// how far the arrow keys seek (s), and the limits of the playback speed
+#define SEEK_SECONDS 10.0
+#define MIN_REPLAY_SPEED (1.0 / 64.0)
+#define MAX_REPLAY_SPEED 4096.0
+
+static double column(int c, long row)
+{
+  return recording.columns[c][row];
+}
+
+static vector3d column_vector(int c, long row)
+// the three columns from c on, for position_x/y/z and the like
+{
+  return vector3d(column(c, row), column(c + 1, row), column(c + 2, row));
+}
+
+static void show_row(long row)
+// Sets the global simulation to the recorded state after row, and carries the track and close-up frame on to it
+{
+  // the column order of record_column_names: the state of write_state, then throttle and parachute status
+  simulation_time = column(0, row);
+  position = column_vector(1, row);
+  velocity = column_vector(4, row);
+  orientation = column_vector(7, row);
+  fuel = column(10, row);
+  altitude = column(11, row);
+  climb_speed = column(12, row);
+  ground_speed = column(13, row);
+  throttle = column(N_STATE, row);
+  throttle_control = (short)(throttle * THROTTLE_GRANULARITY + 0.5);
+  parachute_status = (parachute_status_t)(int)column(N_STATE + 1, row);
+  parachute_lost = (parachute_status == LOST);
+
+  if (row > first_row)
+  {
+    last_position = column_vector(1, row - 1);
+    delta_t = simulation_time - column(0, row - 1);
+  }
+  else
+    last_position = position - delta_t * velocity;
+
+  // the episode may also have ended at the step limit, or the recording in the middle of an episode
+  landed = (row == last_row) && (altitude < LANDER_SIZE / 2.0 + SMALL_NUM);
+  crashed = landed && ((fabs(climb_speed) > MAX_IMPACT_DESCENT_RATE) || (fabs(ground_speed) > MAX_IMPACT_GROUND_SPEED));
+  velocity_from_positions = landed ? vector3d(0.0, 0.0, 0.0) : velocity;
+
+  update_closeup_coords(simulation);
+  update_track(simulation);
+  shown_row = row;
+}
+
+static void seek_row(long row)
+// Shows row, going through every row since the one on screen, or since the start of the episode to go back
+{
+  if (row < first_row)
+    row = first_row;
+  if (row > last_row)
+    row = last_row;
+  if (row < shown_row)
+  {
+    track.n = 0;
+    track.p = 0;
+    closeup_coords.initialized = false;
+    closeup_coords.backwards = false;
+    closeup_coords.right = vector3d(1.0, 0.0, 0.0);
+    terrain_angle = 0.0;
+    shown_row = first_row - 1;
+  }
+  while (shown_row < row)
+    show_row(shown_row + 1);
+}
+
+static long row_at(double t)
+// The last row of the episode recorded at or before simulated time t. the recorded times are sums of time
+// steps, so they are allowed to be a little late
+{
+  const double *times = recording.columns[0].data();
+  long row = (long)(std::upper_bound(times + first_row, times + last_row + 1, t + SMALL_NUM) - times) - 1;
+  return row < first_row ? first_row : row;
+}
+
+static void redraw(void)
+{
+  glutPostWindowRedisplay(closeup_window);
+  glutPostWindowRedisplay(orbital_window);
+  glutPostWindowRedisplay(instrument_window);
+}
+
+static void pause_replay(void)
+{
+  paused = true;
+  glutIdleFunc(NULL);
+  redraw();
+}
+
+static void resume_replay(void)
+{
+  // from the start again once the end has been reached
+  if (shown_row == last_row)
+    seek_row(first_row);
+  replay_time = column(0, shown_row);
+  paused = false;
+  microsecond_time(last_wall_time);
+  glutIdleFunc(replay_idle);
+}
+
+static void show_episode(int e)
+// Rewinds to the first row of episode e, and plays it unless paused
+{
+  episode = e;
+  first_row = recording.episode_starts.empty() ? 0 : recording.episode_starts[e];
+  last_row = (e + 1 < (int)recording.episode_starts.size() ? recording.episode_starts[e + 1] : recording.n_rows) - 1;
+  shown_row = last_row + 1;
+  seek_row(first_row);
+  replay_time = simulation_time;
+  if (paused)
+    redraw();
+  else
+    resume_replay();
+}
+
+bool start_replay(const string &directory, int e)
+{
+  try
+  {
+    recording = load_recording(directory);
+  }
+  catch (const std::runtime_error &error)
+  {
+    cout << error.what() << endl;
+    return false;
+  }
+  // drop the episodes that ended before their first step was recorded
+  vector<long long> starts;
+  for (size_t i = 0; i < recording.episode_starts.size(); i++)
+    if (recording.episode_starts[i] < recording.n_rows &&
+        (i + 1 == recording.episode_starts.size() || recording.episode_starts[i + 1] > recording.episode_starts[i]))
+      starts.push_back(recording.episode_starts[i]);
+  recording.episode_starts = starts;
+  if (recording.n_rows == 0)
+  {
+    cout << "there is nothing recorded in " << directory << endl;
+    return false;
+  }
+  if (e < 0 || e >= replay_episodes())
+  {
+    cout << "there is no episode " << e << " in " << directory << ", it has " << replay_episodes() << endl;
+    return false;
+  }
+  recording_directory = directory;
+  episode = e;
+  replaying = true;
+  return true;
+}
+
+void begin_replay(void)
+{
+  // recordings come from agents, which fly with the attitude stabilizer on and their own throttle
+  reset_simulation(simulation);
+  stabilized_attitude = true;
+  autopilot_enabled = true;
+  paused = false;
+  show_episode(episode);
+}
+
+int replay_episodes(void)
+{
+  return recording.episode_starts.empty() ? 1 : (int)recording.episode_starts.size();
+}
+
+void replay_idle(void)
+{
+  unsigned long long now;
+  long row;
+
+  microsecond_time(now);
+  replay_time += replay_speed * (now - last_wall_time) / 1000000.0;
+  last_wall_time = now;
+  row = row_at(replay_time);
+  if (!skip_frames && row > shown_row + 1)
+  {
+    row = shown_row + 1;
+    replay_time = column(0, row);
+  }
+
+  if (row != shown_row)
+  {
+    seek_row(row);
+    redraw();
+  }
+  else
+  {
+    // nothing new to draw yet, so don't spin
+#ifdef _WIN32
+    Sleep(1);
+#else
+    usleep(1000);
+#endif
+  }
+  if (shown_row == last_row)
+    pause_replay();
+}
+
+string replay_status(void)
+{
+  ostringstream s;
+
+  s << "Replay of " << recording_directory << ", episode " << episode << " (of " << replay_episodes() << ")";
+  s << ", step " << shown_row - first_row + 1 << " of " << last_row - first_row + 1;
+  s << ", speed x" << replay_speed << (skip_frames ? "" : ", every frame");
+  return s.str();
+}
+
+bool replay_key(unsigned char k)
+// Takes the key presses glut_key would use to change the simulation. Returns false for the others
+{
+  switch (k)
+  {
+  case 32:
+    // space bar - pause or play
+    if (paused)
+      resume_replay();
+    else
+      pause_replay();
+    return true;
+
+  case '.':
+  case ',':
+    // . or , - a single step forwards or backwards
+    seek_row(k == '.' ? shown_row + 1 : shown_row - 1);
+    replay_time = simulation_time;
+    pause_replay();
+    return true;
+
+  case 'r':
+  case 'R':
+    // r or R - back to the start of the episode
+    show_episode(episode);
+    return true;
+
+  case '[':
+  case ']':
+    // [ or ] - previous or next episode
+    show_episode((episode + (k == ']' ? 1 : replay_episodes() - 1)) % replay_episodes());
+    return true;
+
+  case 'f':
+  case 'F':
+    // f or F - toggle frame skipping
+    skip_frames = !skip_frames;
+    redraw();
+    return true;
+
+  case 27:
+  case 'q':
+  case 'Q':
+  case 'h':
+  case 'H':
+  case 'l':
+  case 'L':
+  case 't':
+  case 'T':
+    // the views and quitting work as always
+    return false;
+  }
+  // the scenarios, autopilot, parachute and stabilizer keys mean nothing in a replay
+  return true;
+}
+
+void replay_special(int key)
+{
+  switch (key)
+  {
+  case GLUT_KEY_UP: // faster playback
+    replay_speed = std::min(2.0 * replay_speed, MAX_REPLAY_SPEED);
+    break;
+  case GLUT_KEY_DOWN: // slower playback
+    replay_speed = std::max(0.5 * replay_speed, MIN_REPLAY_SPEED);
+    break;
+  case GLUT_KEY_RIGHT: // seek forwards
+  case GLUT_KEY_LEFT:  // seek backwards
+    replay_time = simulation_time + (key == GLUT_KEY_RIGHT ? SEEK_SECONDS : -SEEK_SECONDS);
+    seek_row(row_at(replay_time));
+    if (shown_row == last_row && !paused)
+      pause_replay();
+    break;
+  }
+  redraw();
+}
@@ -0,0 +1,56 @@
+#include <stdexcept>
+// Implementation (reward.cpp), the reward functions LanderEnv trains with
+#include "lander_core.h"
+
+const char *reward_function_names[N_REWARD_FUNCTIONS] = {
+    "squared_altitude",
+    "kinetic",
+    "mechanical",
+    "sparse"};
+
+reward_function_t reward_function_from_name(const string &name)
+{
+    for (int i = 0; i < N_REWARD_FUNCTIONS; i++)
+    {
+        if (name == reward_function_names[i])
+            return (reward_function_t)i;
+    }
+    throw std::invalid_argument("unknown reward function " + name);
+}
+
+reward_config_t default_reward_config(reward_function_t function)
+{
+    reward_config_t config;
+    config.function = function;
+    // squared_altitude only reached near-landings with this weight, kinetic learned to hover with 1
+    config.kinetic_weight = function == SQUARED_ALTITUDE_REWARD ? 1.5 : 1.0;
+    config.landing_reward = 10000.0;
+    config.crash_penalty = 10000.0;
+    config.step_penalty = 1.0;
+    return config;
+}
+
+double step_reward(const simulation_state_t &sim, const reward_config_t &config)
+// the reward for the step that led to sim. the README's Results section describes each function
+{
+    double kinetic_energy = 0.5 * sim.velocity.abs2();
+    switch (config.function)
+    {
+    case SQUARED_ALTITUDE_REWARD:
+        return -(sim.altitude * sim.altitude + config.kinetic_weight * kinetic_energy);
+    case KINETIC_REWARD:
+        return -config.kinetic_weight * kinetic_energy;
+    case MECHANICAL_REWARD:
+        // minimal when landed and at rest. the potential energy is per unit mass, like the kinetic energy
+        return -(-GRAVITY * MARS_MASS / sim.position.abs() + kinetic_energy);
+    case SPARSE_REWARD:
+        // a crash also sets landed
+        if (sim.crashed)
+            return -config.crash_penalty;
+        if (sim.landed)
+            return config.landing_reward;
+        // a slight penalty on every step, so dragging the descent out does not pay
+        return -config.step_penalty;
+    }
+    return 0.0;
+}
@@ -0,0 +1,292 @@
+# %%
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from lander_env import MARS_RADIUS, REPO_ROOT, LanderEnv, lander_agent_cpp
+
+############################################################################################################################
+# a reproducible steps-per-second benchmark of every layer between the simulator and stable baselines. each layer lands
+# the lander from the same start with the same throttle, a few times, in a fresh process of its own, so peak memory is
+# that layer's alone. the results go to a json file, and a later run can be compared against it: any layer slower (or
+# bigger) than the tolerance allows is flagged, and the script exits with status 1
+###########################################################################################################
+
+# where results are written by default, and compared against with --compare
+BENCHMARKS_DIR = os.path.join(REPO_ROOT, "src", "lander_py", "benchmarks")
+INIT_CONDITIONS = [0.0, MARS_RADIUS + 10000, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+# the throttle held through every episode, 0.0 in the model action space. lands after about 5300 steps
+THROTTLE = 0.5
+BATCH_SIZE = 16
+
+
+# %%
+# every layer runs one episode and returns the number of simulation steps it took
+
+
+def _episode_length():
+    agent = lander_agent_cpp.FastAgent()
+    agent.reset(INIT_CONDITIONS)
+    n_steps, _, _, _ = agent.rollout(THROTTLE, 1000000)
+    return n_steps
+
+
+def _pyagent_update(n_steps):
+    """raw update calls, for as many steps as a landing takes"""
+    agent = lander_agent_cpp.PyAgent()
+    agent.reset(INIT_CONDITIONS)
+    for _ in range(n_steps):
+        agent.update((THROTTLE,))
+    return n_steps
+
+
+def _pyagent_update_get_state(n_steps):
+    """update, then the state and flags with separate calls, as LanderEnv used to"""
+    agent = lander_agent_cpp.PyAgent()
+    agent.reset(INIT_CONDITIONS)
+    for _ in range(n_steps):
+        agent.update((THROTTLE,))
+        agent.get_state()
+        agent.is_landed()
+        agent.is_crashed()
+    return n_steps
+
+
+def _agent_step(agent_class):
+    def run(n_steps):
+        agent = agent_class()
+        agent.reset(INIT_CONDITIONS)
+        steps = 0
+        landed = False
+        while not landed:
+            landed, _, _ = agent.step(THROTTLE)
+            steps += 1
+        return steps
+
+    return run
+
+
+def _fastagent_rollout(n_steps):
+    agent = lander_agent_cpp.FastAgent()
+    agent.reset(INIT_CONDITIONS)
+    steps, _, _, _ = agent.rollout(THROTTLE, 1000000)
+    return steps
+
+
+def _batch_agent_step(n_steps):
+    """BATCH_SIZE landers stepped together until all have landed. counts the steps of every lander"""
+    batch = lander_agent_cpp.PyBatchAgent(BATCH_SIZE)
+    batch.reset(np.tile(INIT_CONDITIONS, (BATCH_SIZE, 1)))
+    throttles = np.full(BATCH_SIZE, THROTTLE)
+    steps = 0
+    landed = np.zeros(BATCH_SIZE, dtype=bool)
+    while not landed.all():
+        steps += np.count_nonzero(~landed)
+        _, landed, _ = batch.step(throttles)
+    return steps
+
+
+def _gym_episode(make_env):
+    def run(n_steps):
+        env = make_env()
+        env.reset(seed=0)
+        action = np.array([2 * THROTTLE - 1], dtype=np.float32)
+        steps = 0
+        terminated = truncated = False
+        while not (terminated or truncated):
+            _, _, terminated, truncated, info = env.step(action)
+            steps += info.get("n_frames", 1)
+        return steps
+
+    return run
+
+
+def _gym_wrapper_stack():
+    """the wrappers train.py used on a single env: NormalizeReward, then Monitor"""
+    from gymnasium.wrappers.normalize import NormalizeReward
+    from stable_baselines3.common.monitor import Monitor
+
+    return Monitor(NormalizeReward(LanderEnv()))
+
+
+def _training_stack(n_steps):
+    """train.make_env(1): DummyVecEnv, NativeVecNormalize and VecMonitor, as PPO sees it"""
+    from train import make_env
+
+    env, _ = make_env(1)
+    env.reset()
+    actions = np.array([[2 * THROTTLE - 1]], dtype=np.float32)
+    steps = 0
+    done = False
+    while not done:
+        _, _, dones, _ = env.step(actions)
+        done = dones[0]
+        steps += 1
+    env.close()
+    return steps
+
+
+LAYERS = {
+    "pyagent_update": _pyagent_update,
+    "pyagent_update_get_state": _pyagent_update_get_state,
+    "pyagent_step": _agent_step(lander_agent_cpp.PyAgent),
+    "fastagent_step": _agent_step(lander_agent_cpp.FastAgent),
+    "fastagent_rollout": _fastagent_rollout,
+    "batch_agent_step": _batch_agent_step,
+    "lander_env_step": _gym_episode(LanderEnv),
+    "lander_env_frame_skip_10": _gym_episode(lambda: LanderEnv(frame_skip=10)),
+    "gym_wrapper_stack": _gym_episode(_gym_wrapper_stack),
+    "training_stack": _training_stack,
+}
+
+
+def _measure(layer, n_repeats, min_seconds):
+    """runs in a fresh worker process: a warm-up episode, then at least n_repeats timed ones, and more until
+    they add up to min_seconds, so the fast layers are not timed on a few milliseconds"""
+    run = LAYERS[layer]
+    n_steps = _episode_length()
+    run(n_steps)
+    times = []
+    while len(times) < n_repeats or sum(times) < min_seconds:
+        start = time.perf_counter()
+        steps = run(n_steps)
+        times.append(time.perf_counter() - start)
+    # kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    return {
+        "episodes": len(times),
+        "steps_per_episode": int(steps),
+        "steps_per_second": float(steps / min(times)),
+        "episode_wall_time": {
+            "best": min(times),
+            "median": float(np.median(times)),
+            "worst": max(times),
+        },
+        "peak_memory_mb": max_rss / 2**20,
+    }
+
+
+# %%
+def run_suite(layers=None, n_repeats=5, min_seconds=2.0):
+    """
+    Benchmark every layer, each in a new process.
+
+    Args:
+        layers (list of str, optional): Names from LAYERS, defaults to all of them.
+        n_repeats (int): Least number of timed episodes per layer. Throughput is taken from the best one.
+        min_seconds (float): Least time spent timing each layer.
+
+    Returns:
+        dict: "machine" (where and when it ran) and "layers", with steps per second, per-episode wall time
+            and peak memory of every layer.
+    """
+    results = {
+        "machine": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "profiling_build": bool(lander_agent_cpp.PROFILING),
+        },
+        "layers": {},
+    }
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    for layer in layers or LAYERS:
+        with ProcessPoolExecutor(1, mp_context=mp.get_context(start_method)) as executor:
+            result = executor.submit(_measure, layer, n_repeats, min_seconds).result()
+        results["layers"][layer] = result
+        print(
+            f"{layer:<28} {result['steps_per_second']:>14,.0f} steps/s "
+            f"{result['episode_wall_time']['median'] * 1000:>10.1f} ms/episode "
+            f"{result['peak_memory_mb']:>8.1f} MB"
+        )
+    return results
+
+
+def compare(results, baseline, tolerance=0.1, memory_tolerance=0.2):
+    """
+    Flags every layer that got slower, or bigger, than the tolerances allow.
+
+    Args:
+        results (dict), baseline (dict): From run_suite. Only layers in both are compared.
+        tolerance (float): Largest allowed drop in steps per second, as a fraction of the baseline.
+        memory_tolerance (float): Largest allowed growth of peak memory, as a fraction of the baseline.
+
+    Returns:
+        list of str: One message per regression, empty if there are none.
+    """
+    regressions = []
+    for layer, result in results["layers"].items():
+        if layer not in baseline["layers"]:
+            continue
+        before = baseline["layers"][layer]
+        speed = result["steps_per_second"] / before["steps_per_second"]
+        memory = result["peak_memory_mb"] / before["peak_memory_mb"]
+        flag = ""
+        if speed < 1 - tolerance:
+            regressions.append(f"{layer}: {speed:.2f}x the baseline's steps per second")
+            flag = "  <- slower"
+        if memory > 1 + memory_tolerance:
+            regressions.append(f"{layer}: {memory:.2f}x the baseline's peak memory")
+            flag += "  <- bigger"
+        print(f"{layer:<28} {speed:>6.2f}x speed {memory:>6.2f}x memory{flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Steps per second through every layer")
+    parser.add_argument("--layers", nargs="+", choices=list(LAYERS), default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--min-seconds", type=float, default=2.0, help="least time spent timing each layer"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(BENCHMARKS_DIR, "latest.json"),
+        help="json file for the results",
+    )
+    parser.add_argument(
+        "--compare", default=None, help="json results of an earlier run to check against"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="allowed drop in steps per second"
+    )
+    parser.add_argument(
+        "--memory-tolerance", type=float, default=0.2, help="allowed growth of peak memory"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_suite(args.layers, args.repeats, args.min_seconds)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+
+# the workers import this file again, so the benchmark must only start from here
+if __name__ == "__main__":
+    main()
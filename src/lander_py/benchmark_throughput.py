@@ -0,0 +1,171 @@
+# %%
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from lander_env import MARS_RADIUS, REPO_ROOT, LanderEnv, lander_agent_cpp
+from profiling import format_profile_report, profile_report, reset_profile
+
+############################################################################################################################
+# this script measures how many simulation steps per second we get through the different ways of calling the C++ agent
+###########################################################################################################
+
+INIT_CONDITIONS = [
+    0.0,  # x position
+    (MARS_RADIUS + 10000),  # y position
+    0.0,  # z position
+    0.0,  # x velocity
+    0.0,  # y velocity
+    0.0,  # z velocity
+    0.0,  # roll
+    0.0,  # pitch
+    0.0,  # yaw
+]
+
+
+class SubclassedAgent(lander_agent_cpp.PyAgent):
+    """A Python subclass, so every call goes through the PYBIND11_OVERRIDE lookup in PyAgent"""
+
+    pass
+
+
+# %%
+def step_with_update(agent, n_steps, throttle=0.5):
+    """the old way: update, then read state and flags with separate calls"""
+    for _ in range(n_steps):
+        agent.update((throttle,))
+        agent.get_state()
+        agent.is_landed()
+        agent.is_crashed()
+
+
+def step_fused(agent, n_steps, throttle=0.5):
+    """the fused step, state is read from agent.state_buffer"""
+    for _ in range(n_steps):
+        agent.step(throttle)
+
+
+def steps_per_second(agent_class, step_function, n_steps=5000, n_repeats=10):
+    """best of n_repeats, each running n_steps from a fresh reset.
+    a constant throttle of 0.5 keeps the lander in the air for about 5300 steps"""
+    best = 0.0
+    for _ in range(n_repeats):
+        agent = agent_class()
+        agent.reset(INIT_CONDITIONS)
+        start = time.perf_counter()
+        step_function(agent, n_steps)
+        best = max(best, n_steps / (time.perf_counter() - start))
+    return best
+
+
+def benchmark_agent_classes(n_steps=5000):
+    results = {}
+    for name, agent_class in [
+        ("PyAgent (subclassed in Python)", SubclassedAgent),
+        ("PyAgent", lander_agent_cpp.PyAgent),
+        ("FastAgent", lander_agent_cpp.FastAgent),
+    ]:
+        for call_name, step_function in [
+            ("update + get_state", step_with_update),
+            ("step", step_fused),
+        ]:
+            results[(name, call_name)] = steps_per_second(
+                agent_class, step_function, n_steps
+            )
+            print(
+                f"{name:<32} {call_name:<20} {results[(name, call_name)]:>12,.0f} steps/s"
+            )
+    return results
+
+
+def rollout_steps_per_second(headless, n_steps=5000, n_repeats=10):
+    """best of n_repeats, stepping entirely inside C++ with one rollout call, so this is the cost of the
+    simulation itself. returns the rate and the recorded states of the last repeat"""
+    best = 0.0
+    for _ in range(n_repeats):
+        agent = lander_agent_cpp.FastAgent()
+        agent.headless = headless
+        agent.reset(INIT_CONDITIONS)
+        start = time.perf_counter()
+        n_taken, _, _, _ = agent.rollout(0.5, n_steps)
+        best = max(best, n_taken / (time.perf_counter() - start))
+    agent.reset(INIT_CONDITIONS)
+    _, _, _, states = agent.rollout(0.5, n_steps, record=True)
+    return best, states
+
+
+def benchmark_headless(n_steps=5000):
+    """the headless step against one that also keeps the graphics engine's records up to date.
+    both must give exactly the same trajectory"""
+    results = {}
+    trajectories = {}
+    for name, headless in [("with visualization records", False), ("headless", True)]:
+        results[name], trajectories[name] = rollout_steps_per_second(headless, n_steps)
+        print(f"FastAgent.rollout {name:<28} {results[name]:>12,.0f} steps/s")
+    identical = np.array_equal(
+        trajectories["headless"], trajectories["with visualization records"]
+    )
+    print(f"identical trajectories: {identical}")
+    return results, identical
+
+
+def benchmark_phases(n_steps=20000):
+    """where the time of LanderEnv.step goes: its Python phases, and the phases of the C++ step when the
+    module is built with -DLANDER_PROFILE=ON. returns the profiling.profile_report dict"""
+    env = LanderEnv(profile=True)
+    env.reset(seed=0)
+    reset_profile([env])
+    action = np.array([0.0], dtype=np.float32)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        _, _, terminated, _, _ = env.step(action)
+        if terminated:
+            env.reset()
+    report = profile_report([env], time.perf_counter() - start)
+    print(format_profile_report(report))
+    return report
+
+
+# run in a fresh interpreter, so nothing is cached from this process
+IMPORT_SCRIPT = """
+import os, sys, time
+sys.path.append(os.getcwd())
+start = time.perf_counter()
+import build.lander_agent_cpp
+elapsed = time.perf_counter() - start
+# the shared libraries mapped into the process, to see whether the GL stack came in with the module
+gl_loaded = None
+if os.path.exists("/proc/self/maps"):
+    with open("/proc/self/maps") as f:
+        gl_loaded = any(name in f.read() for name in ("libGL", "libglut"))
+print(elapsed, gl_loaded)
+"""
+
+
+def import_time(n_repeats=10):
+    """best wall time to import lander_agent_cpp in a new Python process, and whether that
+    loaded libGL or libglut (None where /proc/self/maps is not available)"""
+    best = float("inf")
+    for _ in range(n_repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        best = min(best, float(output[0]))
+    gl_loaded = {"True": True, "False": False}.get(output[1])
+    print(f"import lander_agent_cpp: {best * 1000:.2f} ms, GL libraries loaded: {gl_loaded}")
+    return best, gl_loaded
+
+
+# %%
+if __name__ == "__main__":
+    import_time()
+    benchmark_headless()
+    benchmark_agent_classes()
+    benchmark_phases()
@@ -0,0 +1,317 @@
+# %%
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lander_env import DEFAULT_GAINS, MARS_RADIUS, LanderEnv, MODELS_DIR, lander_agent_cpp
+
+############################################################################################################################
+# evaluates a policy on many landings at once. the episodes are split into fixed size tasks and spread over a process
+# pool; every worker loads the policy (a PPO model, or the classic controller) once, then lands all the episodes of a
+# task in lockstep, so the model is called once per step for the whole task rather than once per lander. PPO models
+# run in numpy, see inference.py.
+# the initial conditions come from a seed, so a results table can be reproduced exactly, whatever the number of workers
+###########################################################################################################
+
+# the columns of a results table, one row per episode
+RESULT_COLUMNS = (
+    "policy",
+    "episode",
+    "initial_altitude",
+    "return",
+    "steps",
+    "landed",
+    "crashed",
+    "descent_rate",
+    "ground_speed",
+    "fuel_used",
+    "simulation_time",
+)
+
+
+# %%
+def sample_initial_conditions(n_episodes, seed=0):
+    """a reproducible set of starts around the LanderEnv one: 5-15km up, with some sideways and vertical
+    velocity. the first rows of a larger set are the same as a smaller set with the same seed"""
+    rng = np.random.default_rng(seed)
+    draws = rng.uniform(size=(n_episodes, 3))
+    init_conditions = np.zeros((n_episodes, 9))
+    init_conditions[:, 1] = MARS_RADIUS + 5000 + 10000 * draws[:, 0]
+    # x velocity is sideways (ground speed), y velocity is vertical
+    init_conditions[:, 3] = -50 + 100 * draws[:, 1]
+    init_conditions[:, 4] = -100 * draws[:, 2]
+    return init_conditions
+
+
+def classic_policy_spec(gains=DEFAULT_GAINS):
+    """the proportional controller of LanderEnv.landing_control_policy, with these (K_h, K_p, delta)"""
+    return ("classic", tuple(gains))
+
+
+def ppo_policy_spec(model_path, normalize_observations=True):
+    """a saved PPO model. the observations are normalized with the statistics saved with it in training (see
+    normalization.py). like benchmark_agents, for a model without them they are normalized as by a
+    NormalizeObservation wrapper which starts afresh every episode"""
+    return ("ppo", model_path, normalize_observations)
+
+
+# %%
+# set up in every worker by _init_worker
+_policy = None
+_normalize_observations = False
+# the model's saved statistics, if it has them
+_stats = None
+_envs: List[LanderEnv] = []
+
+
+def _classic_actions(observations, gains):
+    """landing_control_policy for a batch of raw observations, returned in the model action space"""
+    K_h, K_p, delta = gains
+    e_r = observations[:, 0:3] / np.linalg.norm(observations[:, 0:3], axis=1, keepdims=True)
+    e = -(0.5 + K_h * observations[:, 7] + np.sum(observations[:, 3:6] * e_r, axis=1))
+    throttle = np.clip(delta + K_p * e, 0.0, 1.0)
+    return (2 * throttle - 1)[:, None].astype(np.float32)
+
+
+def _init_worker(policy_spec):
+    """loads the policy once, every task this worker runs uses it"""
+    global _policy, _normalize_observations, _stats
+    _stats = None
+    if policy_spec[0] == "classic":
+        gains = policy_spec[1]
+        _policy = lambda observations: _classic_actions(observations, gains)
+        _normalize_observations = False
+    elif policy_spec[0] == "ppo":
+        # the actor runs in numpy, so the workers never import torch
+        from inference import NumpyPolicy
+
+        policy = NumpyPolicy.from_checkpoint(policy_spec[1])
+        _policy = policy.forward
+        _normalize_observations = policy_spec[2]
+        if _normalize_observations:
+            _stats = policy.stats
+    else:
+        raise ValueError(f"unknown policy {policy_spec[0]!r}")
+
+
+class _RunningNormalizer:
+    """NormalizeObservation for a batch of landers, each with its own lander_agent_cpp.RunningMeanStd. the arithmetic
+    is the same as gymnasium's RunningMeanStd, so the model sees exactly what the wrapper would give it, without a
+    wrapper and a handful of small numpy calls per lander per step"""
+
+    def __init__(self, n, size, epsilon=1e-8):
+        self.stats = [lander_agent_cpp.RunningMeanStd(size) for _ in range(n)]
+        self.epsilon = epsilon
+
+    def __call__(self, observations, rows):
+        """adds one observation for each of rows, and returns them normalized"""
+        normalized = np.empty(observations.shape)
+        for i, (observation, row) in enumerate(zip(observations, rows)):
+            self.stats[row].update(observation)
+            normalized[i] = self.stats[row].normalize(observation, self.epsilon)
+        return normalized
+
+
+def _run_task(task):
+    """lands every episode of the task together. returns the episode indices and a dict of per-episode metrics"""
+    episode_indices, init_conditions, max_steps = task
+    n = len(episode_indices)
+    # the landers are kept between tasks
+    while len(_envs) < n:
+        _envs.append(LanderEnv())
+    envs = _envs[:n]
+
+    observations = np.stack(
+        [
+            env.reset(options={"init_conditions": init})[0]
+            for env, init in zip(envs, init_conditions)
+        ]
+    )
+    all_rows = np.arange(n)
+    if _stats is not None:
+        # the statistics from training, the same for every lander and never updated
+        normalize = lambda observations, rows: _stats.observations(observations)
+    elif _normalize_observations:
+        # fresh statistics every episode, as a new NormalizeObservation wrapper would have
+        normalize = _RunningNormalizer(n, observations.shape[1])
+    else:
+        normalize = None
+    policy_inputs = normalize(observations, all_rows) if normalize else observations.copy()
+
+    metrics = {
+        "return": np.zeros(n),
+        "steps": np.zeros(n, dtype=np.int64),
+        "landed": np.zeros(n, dtype=bool),
+        "crashed": np.zeros(n, dtype=bool),
+        "descent_rate": np.zeros(n),
+        "ground_speed": np.zeros(n),
+        "fuel_used": np.zeros(n),
+        "simulation_time": np.zeros(n),
+    }
+    active = np.ones(n, dtype=bool)
+
+    while active.any():
+        running = np.flatnonzero(active)
+        # one policy call for every lander still in the air
+        actions = _policy(policy_inputs[running])
+        for action, i in zip(actions, running):
+            observation, reward, terminated, truncated, info = envs[i].step(action)
+            observations[i] = observation
+            metrics["return"][i] += reward
+            metrics["steps"][i] += 1
+            if terminated or truncated or metrics["steps"][i] >= max_steps:
+                active[i] = False
+                metrics["landed"][i] = envs[i].lander.is_landed()
+                metrics["crashed"][i] = envs[i].lander.is_crashed()
+                metrics["descent_rate"][i] = -info["climb_speed"]
+                metrics["ground_speed"][i] = info["ground_speed"]
+                # fuel is the fraction of a full tank left, every landing starts full
+                metrics["fuel_used"][i] = (1.0 - info["fuel"]) * 100.0
+                metrics["simulation_time"][i] = info["simulation_time"]
+        if normalize:
+            policy_inputs[running] = normalize(observations[running], running)
+        else:
+            policy_inputs[running] = observations[running]
+    return episode_indices, metrics
+
+
+# %%
+def evaluate(
+    policy_spec: Tuple,
+    n_episodes: int = 1000,
+    seed: int = 0,
+    n_workers: Optional[int] = None,
+    episodes_per_task: int = 32,
+    max_steps: int = 20000,
+    policy_name: Optional[str] = None,
+    start_method: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Land a policy on n_episodes seeded initial conditions, spread over a process pool.
+
+    Args:
+        policy_spec (tuple): From classic_policy_spec or ppo_policy_spec.
+        n_episodes (int): Number of landings.
+        seed (int): Seed of the initial conditions, see sample_initial_conditions.
+        n_workers (int, optional): Number of worker processes, defaults to the number of cores.
+            With 0, everything runs in this process.
+        episodes_per_task (int): Episodes landed together by one worker. The tasks do not depend on
+            n_workers, so neither do the results.
+        max_steps (int): Episodes still in the air after this many steps are cut short (landed is False).
+        policy_name (str, optional): Goes in the "policy" column, defaults to the kind of policy.
+        start_method (str, optional): The multiprocessing start method. Defaults to 'forkserver' where it is
+            available, and 'spawn' otherwise, so the calling script needs an ``if __name__ == "__main__":`` block.
+
+    Returns:
+        dict: The results table, an array of n_episodes for every name in RESULT_COLUMNS, in episode order.
+    """
+    init_conditions = sample_initial_conditions(n_episodes, seed)
+    tasks = []
+    for start in range(0, n_episodes, episodes_per_task):
+        indices = np.arange(start, min(start + episodes_per_task, n_episodes))
+        tasks.append((indices, init_conditions[indices], max_steps))
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(tasks))
+    if n_workers == 0:
+        _init_worker(policy_spec)
+        outputs = map(_run_task, tasks)
+    else:
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        executor = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=mp.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(policy_spec,),
+        )
+        outputs = executor.map(_run_task, tasks)
+
+    results = {
+        "policy": np.full(n_episodes, policy_name or policy_spec[0]),
+        "episode": np.arange(n_episodes),
+        "initial_altitude": np.linalg.norm(init_conditions[:, 0:3], axis=1) - MARS_RADIUS,
+    }
+    for episode_indices, metrics in outputs:
+        for name, values in metrics.items():
+            if name not in results:
+                results[name] = np.zeros(n_episodes, dtype=values.dtype)
+            results[name][episode_indices] = values
+    if n_workers > 0:
+        executor.shutdown()
+    return {name: results[name] for name in RESULT_COLUMNS}
+
+
+def merge_results(tables: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """one table with the rows of all of them, e.g. the same episodes for several policies"""
+    return {name: np.concatenate([table[name] for table in tables]) for name in RESULT_COLUMNS}
+
+
+def save_results(results: Dict[str, np.ndarray], path: str) -> None:
+    """writes a results table as csv, one row per episode"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_COLUMNS)
+        writer.writerows(zip(*(results[name].tolist() for name in RESULT_COLUMNS)))
+
+
+def summarize(results: Dict[str, np.ndarray]) -> None:
+    """mean and spread of the metrics for every policy in a results table"""
+    for policy in dict.fromkeys(results["policy"].tolist()):
+        rows = results["policy"] == policy
+        print(f"\n{policy}: {rows.sum()} episodes")
+        print(f"Landed safely: {np.mean(results['landed'][rows] & ~results['crashed'][rows]):.1%}")
+        for name in ("return", "steps", "descent_rate", "ground_speed", "fuel_used"):
+            values = results[name][rows]
+            print(f"Average {name}: {np.mean(values):.4f} (±{np.std(values):.4f})")
+
+
+# %%
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Evaluate a PPO model against the classic controller"
+    )
+    parser.add_argument("--model-name", default="ppo_sparse_16")
+    parser.add_argument("--n-episodes", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--n-workers", type=int, default=None, help="defaults to the number of cores"
+    )
+    parser.add_argument(
+        "--output", default=None, help="csv file for the results table"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tables = []
+    for name, spec in [
+        ("rl", ppo_policy_spec(os.path.join(MODELS_DIR, args.model_name))),
+        ("classic", classic_policy_spec()),
+    ]:
+        start = time.perf_counter()
+        tables.append(
+            evaluate(spec, args.n_episodes, args.seed, args.n_workers, policy_name=name)
+        )
+        print(
+            f"{name}: {args.n_episodes} episodes, {tables[-1]['steps'].sum():,} steps "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+    results = merge_results(tables)
+    summarize(results)
+    if args.output is not None:
+        save_results(results, args.output)
+
+
+# the workers import this file again, so evaluation must only start from here
+if __name__ == "__main__":
+    main()
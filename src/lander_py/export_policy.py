@@ -0,0 +1,110 @@
+import argparse
+import os
+from typing import Optional
+
+import numpy as np
+from stable_baselines3 import PPO
+from stable_baselines3.common.torch_layers import FlattenExtractor
+from torch import nn
+
+from inference import ACTIVATION_CODES, POLICY_MAGIC
+from normalization import load_stats
+
+############################################################################################################################
+# exports a trained PPO actor, with the observation normalization saved next to it, to one small binary file that
+# lander_agent_cpp.MlpPolicy (and the lander executable) load. the trained policy then flies whole episodes in C++,
+# with no Python or torch in the loop. the layout is documented with MlpPolicy in lander_core.h
+###########################################################################################################
+
+# the activations MlpPolicy knows, by their code in the file
+ACTIVATIONS = {nn.Tanh: ACTIVATION_CODES["tanh"], nn.ReLU: ACTIVATION_CODES["relu"]}
+
+
+def policy_path(model_path: str) -> str:
+    """where the exported policy of a model is kept: models/name.zip -> models/name_policy.bin"""
+    if model_path.endswith(".zip"):
+        model_path = model_path[: -len(".zip")]
+    return model_path + "_policy.bin"
+
+
+def actor_layers(model: PPO):
+    """the dense layers of the actor, as (weight, bias) float32 arrays, and the code of the activation between them.
+    raises ValueError for policies MlpPolicy cannot run"""
+    policy = model.policy
+    if model.observation_space.shape != (9,) or model.action_space.shape != (1,):
+        raise ValueError("only policies for LanderEnv's observation and action can be exported")
+    if policy.squash_output or not isinstance(policy.features_extractor, FlattenExtractor):
+        raise ValueError("only plain MlpPolicy actors can be exported")
+    if policy.activation_fn not in ACTIVATIONS:
+        raise ValueError(f"MlpPolicy has no {policy.activation_fn.__name__} activation")
+
+    linears = [m for m in policy.mlp_extractor.policy_net if isinstance(m, nn.Linear)]
+    linears.append(policy.action_net)
+    layers = [
+        (
+            m.weight.detach().cpu().numpy().astype(np.float32),
+            m.bias.detach().cpu().numpy().astype(np.float32),
+        )
+        for m in linears
+    ]
+    return layers, ACTIVATIONS[policy.activation_fn]
+
+
+def export_policy(model_path: str, output_path: Optional[str] = None) -> str:
+    """
+    Write a PPO model's actor and observation normalization to one file.
+
+    Args:
+        model_path (str): The saved model. Its normalization statistics are read from next to it, see
+            normalization.stats_path. Without them, or if they do not normalize the observations, the
+            observations go into the network as they are.
+        output_path (str, optional): Defaults to policy_path(model_path).
+
+    Returns:
+        str: The path written.
+    """
+    model = PPO.load(model_path, device="cpu")
+    layers, activation = actor_layers(model)
+    stats = load_stats(model_path)
+    n_inputs = layers[0][0].shape[1]
+
+    if stats is not None and stats.normalize_observations:
+        normalize = 1
+        mean, var = stats.obs_rms.mean, stats.obs_rms.var
+        epsilon, clip = stats.epsilon, stats.clip_observations
+    else:
+        normalize = 0
+        mean, var = np.zeros(n_inputs), np.ones(n_inputs)
+        epsilon, clip = 0.0, np.inf
+
+    output_path = output_path or policy_path(model_path)
+    with open(output_path, "wb") as f:
+        f.write(POLICY_MAGIC)
+        np.array([n_inputs, len(layers), activation, normalize], dtype="<i4").tofile(f)
+        np.array([weight.shape[0] for weight, _ in layers], dtype="<i4").tofile(f)
+        np.asarray(mean, dtype="<f8").tofile(f)
+        np.asarray(var, dtype="<f8").tofile(f)
+        np.array([epsilon, clip], dtype="<f8").tofile(f)
+        for weight, bias in layers:
+            weight.astype("<f4").tofile(f)
+            bias.astype("<f4").tofile(f)
+    return output_path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export a PPO model for C++ inference")
+    parser.add_argument("model", help="the saved model, e.g. models/ppo_potentialonly.zip")
+    parser.add_argument(
+        "--output", default=None, help="defaults to the model's name with _policy.bin"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    path = export_policy(args.model, args.output)
+    print(f"policy exported to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
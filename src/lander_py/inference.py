@@ -0,0 +1,217 @@
+import collections
+import io
+import json
+import os
+import pickle
+import zipfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from normalization import NormalizationStats, load_stats
+
+############################################################################################################################
+# deterministic PPO inference in plain numpy. the actor's weights are read straight out of a stable baselines checkpoint
+# (or a file from export_policy.py), without importing torch or stable baselines, and a whole batch of observations goes
+# through the network in one forward pass. evaluation workers and controllers load in a fraction of the time, and
+# skip the tensor creation and device handling that model.predict pays for on every call
+###########################################################################################################
+
+# the start of every export_policy.py file, see MlpPolicy in lander_core.h for the rest of the layout
+POLICY_MAGIC = b"LNDRMLP1"
+# the activations the exported files know, by their code in the file
+ACTIVATION_CODES = {"tanh": 0, "relu": 1}
+ACTIVATIONS = {"tanh": np.tanh, "relu": lambda x: np.maximum(x, np.float32(0.0))}
+# the torch storages a state dict may hold, as numpy dtypes. checkpoints are written little-endian
+_STORAGE_DTYPES = {
+    "FloatStorage": "<f4",
+    "DoubleStorage": "<f8",
+    "HalfStorage": "<f2",
+    "LongStorage": "<i8",
+    "IntStorage": "<i4",
+    "BoolStorage": "?",
+}
+
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args):
+    """torch._utils._rebuild_tensor_v2, for a numpy storage"""
+    itemsize = storage.itemsize
+    view = np.lib.stride_tricks.as_strided(
+        storage[storage_offset:], shape=tuple(size), strides=[s * itemsize for s in stride]
+    )
+    return view.copy()
+
+
+class _StateDictUnpickler(pickle.Unpickler):
+    """unpickles a torch state dict as numpy arrays. anything but tensors in an OrderedDict is refused"""
+
+    def __init__(self, file, archive: zipfile.ZipFile, prefix: str):
+        super().__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module, name):
+        if (module, name) == ("collections", "OrderedDict"):
+            return collections.OrderedDict
+        if (module, name) == ("torch._utils", "_rebuild_tensor_v2"):
+            return _rebuild_tensor
+        if module == "torch" and name in _STORAGE_DTYPES:
+            return name
+        raise pickle.UnpicklingError(f"{module}.{name} has no place in a policy's state dict")
+
+    def persistent_load(self, pid):
+        # ("storage", storage type, key, location, number of elements)
+        _, storage_type, key, _, numel = pid
+        data = self.archive.read(f"{self.prefix}/data/{key}")
+        return np.frombuffer(data, dtype=_STORAGE_DTYPES[storage_type], count=numel)
+
+
+def _read_state_dict(data: bytes) -> "collections.OrderedDict[str, np.ndarray]":
+    """the tensors of a torch.save'd state dict (the zip format of torch 1.6 on), as numpy arrays"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        pickle_name = next(n for n in archive.namelist() if n.endswith("/data.pkl"))
+        prefix = pickle_name[: -len("/data.pkl")]
+        if f"{prefix}/byteorder" in archive.namelist():
+            if archive.read(f"{prefix}/byteorder").decode() != "little":
+                raise ValueError("only little-endian checkpoints can be read without torch")
+        with archive.open(pickle_name) as f:
+            return _StateDictUnpickler(f, archive, prefix).load()
+
+
+def _checkpoint_path(model_path: str) -> str:
+    """stable baselines' load takes the path with or without .zip"""
+    if not os.path.exists(model_path) and os.path.exists(model_path + ".zip"):
+        return model_path + ".zip"
+    return model_path
+
+
+class NumpyPolicy:
+    """
+    A PPO actor's deterministic forward pass in numpy, in float32 like torch.
+
+    The action is the mean of the policy's Gaussian, clipped to the model's [-1, 1] action space, as
+    model.predict(observations, deterministic=True) gives it.
+
+    Attributes:
+        layers (list of (np.ndarray, np.ndarray)): Weight (outputs x inputs) and bias of every dense layer.
+            The last one is the action layer.
+        activation (str): "tanh" or "relu", between the layers.
+        stats (NormalizationStats, optional): The statistics saved with the model, which predict normalizes
+            the observations with. None for raw observations.
+    """
+
+    def __init__(
+        self,
+        layers: List[Tuple[np.ndarray, np.ndarray]],
+        activation: str = "tanh",
+        stats: Optional[NormalizationStats] = None,
+    ):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"activation must be one of {tuple(ACTIVATIONS)}, got {activation!r}")
+        self.layers = [
+            (np.ascontiguousarray(weight.T, dtype=np.float32), bias.astype(np.float32))
+            for weight, bias in layers
+        ]
+        self.activation = activation
+        self.stats = stats
+
+    @classmethod
+    def from_checkpoint(cls, model_path: str, load_normalization: bool = True) -> "NumpyPolicy":
+        """
+        The actor of a saved PPO MlpPolicy, read without torch.
+
+        Args:
+            model_path (str): The model zip, with or without .zip.
+            load_normalization (bool): Whether to load the statistics saved next to the model, if there are any.
+        """
+        model_path = _checkpoint_path(model_path)
+        with zipfile.ZipFile(model_path) as checkpoint:
+            data = json.loads(checkpoint.read("data"))
+            state_dict = _read_state_dict(checkpoint.read("policy.pth"))
+        if data.get("use_sde"):
+            raise ValueError("policies with state dependent exploration cannot be run in numpy")
+
+        # the activation class is pickled with torch, its name is also kept as text
+        activation_fn = data.get("policy_kwargs", {}).get("activation_fn", "Tanh")
+        if "Tanh" in activation_fn:
+            activation = "tanh"
+        elif "ReLU" in activation_fn:
+            activation = "relu"
+        else:
+            raise ValueError(f"unsupported activation {activation_fn}")
+
+        # mlp_extractor.policy_net.0, .2, ... with the activations in between, then the action layer
+        hidden = sorted(
+            int(key.split(".")[2])
+            for key in state_dict
+            if key.startswith("mlp_extractor.policy_net.") and key.endswith(".weight")
+        )
+        names = [f"mlp_extractor.policy_net.{i}" for i in hidden] + ["action_net"]
+        layers = [(state_dict[f"{n}.weight"], state_dict[f"{n}.bias"]) for n in names]
+        stats = load_stats(model_path) if load_normalization else None
+        return cls(layers, activation, stats)
+
+    @classmethod
+    def from_export(cls, path: str) -> "NumpyPolicy":
+        """a policy written by export_policy.py, with the normalization statistics in it"""
+        with open(path, "rb") as f:
+            if f.read(len(POLICY_MAGIC)) != POLICY_MAGIC:
+                raise ValueError(f"{path} is not a policy file written by export_policy.py")
+            n_inputs, n_layers, activation, normalize = np.fromfile(f, "<i4", 4)
+            sizes = np.fromfile(f, "<i4", n_layers)
+            mean = np.fromfile(f, "<f8", n_inputs)
+            var = np.fromfile(f, "<f8", n_inputs)
+            epsilon, clip = np.fromfile(f, "<f8", 2)
+            layers = []
+            inputs = n_inputs
+            for size in sizes:
+                weight = np.fromfile(f, "<f4", size * inputs).reshape(size, inputs)
+                layers.append((weight, np.fromfile(f, "<f4", size)))
+                inputs = size
+
+        stats = None
+        if normalize:
+            stats = NormalizationStats(
+                int(n_inputs), normalize_rewards=False, epsilon=float(epsilon), clip_observations=float(clip)
+            )
+            stats.obs_rms.mean = mean
+            stats.obs_rms.var = var
+        names = {code: name for name, code in ACTIVATION_CODES.items()}
+        return cls(layers, names[int(activation)], stats)
+
+    def forward(self, inputs: np.ndarray) -> np.ndarray:
+        """the actions for a batch of network inputs (already normalized), clipped to [-1, 1]"""
+        x = np.asarray(inputs, dtype=np.float32)
+        activation = ACTIVATIONS[self.activation]
+        for weight, bias in self.layers[:-1]:
+            x = activation(x @ weight + bias)
+        weight, bias = self.layers[-1]
+        return np.clip(x @ weight + bias, -1.0, 1.0)
+
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        """
+        Deterministic actions for raw LanderEnv observations.
+
+        Args:
+            observations (np.ndarray): One observation (9,) or a batch of them (n, 9).
+
+        Returns:
+            np.ndarray: float32 actions, (1,) or (n, 1).
+        """
+        observations = np.asarray(observations, dtype=np.float32)
+        if self.stats is not None:
+            observations = self.stats.observations(observations)
+        if observations.ndim == 1:
+            return self.forward(observations[None])[0]
+        return self.forward(observations)
+
+    __call__ = predict
+
+
+def load_policy(path: str) -> NumpyPolicy:
+    """a NumpyPolicy from a stable baselines checkpoint, or from an export_policy.py file"""
+    with open(_checkpoint_path(path), "rb") as f:
+        exported = f.read(len(POLICY_MAGIC)) == POLICY_MAGIC
+    if exported:
+        return NumpyPolicy.from_export(path)
+    return NumpyPolicy.from_checkpoint(path)
@@ -0,0 +1,111 @@
+# %%
+import numpy as np
+
+from lander_env import MARS_RADIUS, lander_agent_cpp
+
+############################################################################################################################
+# this script measures how far each integrator drifts at larger time steps, to choose delta_t for training
+# every run is compared against a reference at the SAME delta_t: RK4 with enough sub-steps that it is exact to
+# well below a millimetre. so the errors below are integration error only, not the effect of the controller
+# acting less often, which is measured separately (control_rate_effect)
+###########################################################################################################
+
+INTEGRATORS = {
+    "verlet": lander_agent_cpp.Integrator.VERLET,
+    "rk4": lander_agent_cpp.Integrator.RK4,
+    "yoshida": lander_agent_cpp.Integrator.YOSHIDA,
+}
+# reference sub-step length (s)
+REFERENCE_STEP = 0.005
+
+# a circular orbit at 1.2 Mars radii, above the atmosphere: gravity only
+ORBIT = [1.2 * MARS_RADIUS, 0.0, 0.0, 0.0, -3247.087385863725, 0.0, 0.0, 90.0, 0.0]
+# the descent benchmark_agents uses, but starting with some sideways and downward speed
+DESCENT = [0.0, MARS_RADIUS + 10000, 0.0, 50.0, -50.0, 0.0, 0.0, 0.0, 0.0]
+
+
+# %%
+def run(init_conditions, integrator, delta_t, n_substeps=1, duration=None):
+    """states after every step. with duration, coasts with the engine off for that many seconds,
+    otherwise lands with the proportional controller"""
+    agent = lander_agent_cpp.FastAgent()
+    agent.reset(
+        init_conditions, integrator=integrator, n_substeps=n_substeps, delta_t=delta_t
+    )
+    if duration is not None:
+        _, _, _, states = agent.rollout(0.0, int(round(duration / delta_t)), record=True)
+        return states
+
+    states = []
+    landed = False
+    while not landed and agent.state_buffer[0] < 2000:
+        landed, _, _ = agent.step(lander_agent_cpp.proportional_throttle(agent.state_buffer))
+        states.append(agent.state_buffer.copy())
+    return np.array(states)
+
+
+def reference(init_conditions, delta_t, duration=None):
+    n_substeps = max(1, int(round(delta_t / REFERENCE_STEP)))
+    return run(init_conditions, INTEGRATORS["rk4"], delta_t, n_substeps, duration)
+
+
+def position_error(states, reference_states):
+    """largest distance (m) between the two trajectories, over the steps both have"""
+    n = min(len(states), len(reference_states))
+    return np.max(np.linalg.norm(states[:n, 1:4] - reference_states[:n, 1:4], axis=1))
+
+
+def touchdown(states):
+    """descent rate (m/s), fuel used (l) and time (s) at the end of a landing"""
+    return -states[-1, 12], (1.0 - states[-1, 10]) * 100.0, states[-1, 0]
+
+
+def accuracy_table(
+    delta_ts=(0.1, 0.2, 0.5, 1.0), orbit_duration=3600.0, verlet_substeps=(1, 5)
+):
+    rows = []
+    for delta_t in delta_ts:
+        orbit_reference = reference(ORBIT, delta_t, orbit_duration)
+        descent_reference = reference(DESCENT, delta_t)
+        ref_descent_rate, ref_fuel, _ = touchdown(descent_reference)
+        for name, integrator in INTEGRATORS.items():
+            for n_substeps in verlet_substeps if name == "verlet" else (1,):
+                orbit = run(ORBIT, integrator, delta_t, n_substeps, orbit_duration)
+                descent = run(DESCENT, integrator, delta_t, n_substeps)
+                descent_rate, fuel, _ = touchdown(descent)
+                rows.append(
+                    {
+                        "integrator": name,
+                        "n_substeps": n_substeps,
+                        "delta_t": delta_t,
+                        "orbit_error": position_error(orbit, orbit_reference),
+                        "descent_error": position_error(descent, descent_reference),
+                        "descent_rate_error": descent_rate - ref_descent_rate,
+                        "fuel_error": fuel - ref_fuel,
+                    }
+                )
+                print(
+                    f"{name:<8} x{n_substeps}  delta_t={delta_t:<4}  "
+                    f"orbit {rows[-1]['orbit_error']:>10.3f} m  "
+                    f"descent {rows[-1]['descent_error']:>8.3f} m  "
+                    f"touchdown speed {rows[-1]['descent_rate_error']:+.4f} m/s  "
+                    f"fuel {rows[-1]['fuel_error']:+.3f} l"
+                )
+    return rows
+
+
+def control_rate_effect(delta_ts=(0.1, 0.2, 0.5, 1.0)):
+    """the landing with exact integration, at each delta_t: what changes only because
+    the controller acts (and the parachute is decided) once per step"""
+    for delta_t in delta_ts:
+        descent_rate, fuel, time = touchdown(reference(DESCENT, delta_t))
+        print(
+            f"delta_t={delta_t:<4}  touchdown speed {descent_rate:.3f} m/s  "
+            f"fuel used {fuel:.2f} l  landed at {time:.1f} s"
+        )
+
+
+# %%
+if __name__ == "__main__":
+    accuracy_table()
+    control_rate_effect()
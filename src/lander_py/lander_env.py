@@ -2,16 +2,49 @@ import gymnasium as gym
 
 # import torch as t
 import numpy as np
-from typing import Any, Dict, Tuple, List
+from typing import Any, Dict, Tuple, List, Optional
 import os
 import sys
-
-# Move up two directory levels to root
-os.chdir("../..")
-# Add the current directory to the Python path, so we can search here later
-sys.path.append(os.getcwd())
+import time
+
+# the repository root is two directory levels up from this file, the extension is built into root/build
+# we add it to the Python path instead of changing the working directory, so importing this module
+# has no side effects, and worker processes (which import it again) find the extension too
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# where train.py saves, and benchmark_agents.py loads, the model weights
+MODELS_DIR = os.path.join(REPO_ROOT, "src", "lander_py", "models")
+# the radius of Mars (m), as lander_core.h has it
+MARS_RADIUS = 3386000.0
+# the hand-picked (K_h, K_p, delta) gains of the proportional autopilot, as autopilot.cpp has them
+DEFAULT_GAINS = (2e-2, 2.0, 0.5)
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
 # Now we can import the module
-import build.lander_agent_cpp as lander_agent_cpp
+import build.lander_agent_cpp as lander_agent_cpp  # noqa: E402
+
+
+class StepTimings:
+    """wall time of the Python side of LanderEnv.step, split into phases. simulator_call includes the C++ step
+    itself, so with a profiling build, simulator_call minus lander_agent_cpp's "step" is the binding overhead"""
+
+    PHASES = ("action", "simulator_call", "observation_and_info")
+
+    def __init__(self):
+        self.calls = 0
+        self.nanoseconds = [0, 0, 0]
+
+    def add(self, start, action_done, simulator_done, end):
+        """the time.perf_counter_ns() readings between the phases of one step"""
+        self.calls += 1
+        self.nanoseconds[0] += action_done - start
+        self.nanoseconds[1] += simulator_done - action_done
+        self.nanoseconds[2] += end - simulator_done
+
+    def as_dict(self):
+        return {
+            phase: {"calls": self.calls, "seconds": nanoseconds * 1e-9}
+            for phase, nanoseconds in zip(self.PHASES, self.nanoseconds)
+        }
 
 
 class LanderEnv(gym.Env):
@@ -28,13 +61,74 @@ class LanderEnv(gym.Env):
         lander (lander_agent_cpp.Agent): The C++ agent that handles the core simulation.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        frame_skip: int = 1,
+        delta_t: float = 0.1,
+        integrator: str = "verlet",
+        n_substeps: int = 1,
+        recorder=None,
+        start_cache=None,
+        start_cache_probability: float = 1.0,
+        reward: str = "squared_altitude",
+        reward_params: Optional[dict] = None,
+        profile: bool = False,
+    ):
         """
         Initialize the LanderEnv.
+
+        Args:
+            frame_skip (int): Number of simulation steps each action is held for. The steps all run
+                inside one C++ call, and the reward is summed over them.
+            delta_t (float): Simulation time step (s). Larger steps mean shorter episodes, see
+                integrator_accuracy.py for how much accuracy each integrator keeps.
+            integrator (str): "verlet" (the original), "rk4" or "yoshida".
+            n_substeps (int): Integrator steps taken inside every simulation step.
+            recorder (lander_agent_cpp.TrajectoryRecorder, optional): Records the state and throttle of every
+                simulation step in C++, see recording.py to read it back. Every reset starts a new episode in it.
+            start_cache (start_states.StartStateCache or str, optional): Mid-descent start states, or the path of
+                a saved cache. With a cache, resets start from a random cached state with start_cache_probability,
+                and from the usual 10km start otherwise.
+            start_cache_probability (float): See start_cache.
+            reward (str): The reward function, one of lander_agent_cpp.REWARD_FUNCTIONS. It is computed in C++
+                along with the step, see reward.cpp.
+            reward_params (dict, optional): Parameters of the reward function, e.g. {"kinetic_weight": 1.5}.
+            profile (bool): Time the phases of every step into step_timings (a StepTimings), see profiling.py.
+                Otherwise step_timings is None and step reads no clocks.
         """
         super(LanderEnv, self).__init__()
 
+        if frame_skip < 1:
+            raise ValueError(f"frame_skip must be at least 1, got {frame_skip}")
+        if integrator.upper() not in lander_agent_cpp.Integrator.__members__:
+            raise ValueError(f"unknown integrator {integrator!r}")
+        self.frame_skip = frame_skip
+        self.step_timings = StepTimings() if profile else None
+
         self.lander = lander_agent_cpp.PyAgent()
+        # kept by the agent and used from the next reset on. the agent checks delta_t and n_substeps
+        self.lander.integrator = lander_agent_cpp.Integrator.__members__[integrator.upper()]
+        self.lander.n_substeps = n_substeps
+        self.lander.delta_t = delta_t
+        self.lander.recorder = recorder
+        self.lander.set_reward(reward, **(reward_params or {}))
+        if isinstance(start_cache, str):
+            from start_states import StartStateCache
+
+            start_cache = StartStateCache.load(start_cache)
+        if start_cache is not None and (
+            start_cache.delta_t != delta_t
+            or start_cache.integrator != integrator.lower()
+            or start_cache.n_substeps != n_substeps
+        ):
+            # a restored state carries on with the settings it was taken with
+            raise ValueError(
+                "the start cache was built with a different delta_t, integrator or n_substeps"
+            )
+        self.start_cache = start_cache
+        self.start_cache_probability = start_cache_probability
+        # view onto the agent's state, refreshed in place by every lander.step call
+        self.lander_state = self.lander.state_buffer
 
         # Define action and observation space
         self.action_space = gym.spaces.Box(
@@ -45,10 +139,7 @@ class LanderEnv(gym.Env):
             low=-np.inf, high=np.inf, shape=(9,), dtype=np.float32
         )
 
-        self.MARS_RADIUS = 3386000.0
-        # gravitational constant of mars
-        self.GRAVITY_CONSTANT = 6.673e-11
-        self.MARS_MASS = 6.42e23
+        self.MARS_RADIUS = MARS_RADIUS
 
         # # this contains the mean of observations for each variable, empirically determinde!
         # self.obs_means = np.array(
@@ -86,6 +177,10 @@ class LanderEnv(gym.Env):
             truncated (bool): Whether the episode was truncated.
             info (dict): Additional information about the environment.
         """
+        timings = self.step_timings
+        if timings is not None:
+            start = time.perf_counter_ns()
+
         # # current state
         # obs_raw_cur = self.lander.get_state()
         # print(
@@ -107,12 +202,26 @@ class LanderEnv(gym.Env):
         # for better learning, we use the range -1 to 1, that is normalized, symmetric, and has a range of 2!
         # throttle is in the range 0 to 1
         real_action = self.action_space_model_to_real(action)
-        throttle_action = tuple(real_action.flatten())
+        throttle_action = float(np.asarray(real_action).flatten()[0])
         # print("throttle action is", throttle_action)
-        self.lander.update(throttle_action)
-
-        # Get state from C++ Agent and convert to PyTorch tensor
-        complete_state = np.array(self.lander.get_state(), dtype=np.float32)
+        if timings is not None:
+            action_done = time.perf_counter_ns()
+        if self.frame_skip == 1:
+            # one call does the update, computes the reward and refreshes self.lander_state
+            landed, crashed, reward = self.lander.step(throttle_action)
+            n_frames = 1
+        else:
+            # hold the throttle for frame_skip steps in C++, stopping early on touchdown. the reward is summed
+            # over the skipped frames, so the return matches frame_skip=1
+            n_frames, landed, crashed, _ = self.lander.rollout(
+                throttle_action, self.frame_skip
+            )
+            reward = self.lander.reward
+        if timings is not None:
+            simulator_done = time.perf_counter_ns()
+
+        # copy out of the C++ buffer, it is overwritten on the next step
+        complete_state = self.lander_state.astype(np.float32)
 
         # POSITION AND VELOCITY, fuel, altitude, and climb speed
         observation = complete_state[[1, 2, 3, 4, 5, 6, 10, 11, 12]]
@@ -123,20 +232,7 @@ class LanderEnv(gym.Env):
         ################
         # model_observation = self.obs_space_real_to_model(real_observation)
 
-        # define the reward
-        reward = self.energy_reward_function(
-            position_array=complete_state[1:4],
-            velocity_array=complete_state[4:7],
-            altitude=complete_state[11],
-        )
-
-        # reward = self.sparse_reward_function(
-        #     landed=self.lander.is_landed(), crashed=self.lander.is_crashed()
-        # )
-
-        # print("reward is ", reward, " altitude ", complete_state[11])
-
-        terminated = self.lander.is_landed() or self.lander.is_crashed()
+        terminated = landed or crashed
         truncated = False
         # Include all 14 state variables in the info dictionary
         info = {
@@ -156,8 +252,13 @@ class LanderEnv(gym.Env):
             # we may want to negative this to get descent rate!
             "climb_speed": complete_state[12],
             "ground_speed": complete_state[13],
+            # number of simulation steps this action was held for
+            "n_frames": n_frames,
         }
 
+        if timings is not None:
+            timings.add(start, action_done, simulator_done, time.perf_counter_ns())
+
         # observation here is a tensor
         return observation, reward, terminated, truncated, info
 
@@ -168,6 +269,12 @@ class LanderEnv(gym.Env):
         Args:
             seed (int, optional): A seed for resetting the environment.
             options (dict, optional): Additional options for resetting the environment.
+                "init_conditions" replaces the default start (10km up, at rest) with 9 values: position,
+                velocity and orientation, as lander.reset takes them.
+                "start_state" starts from a snapshot (see lander.snapshot) instead.
+                "cached_start" starts from a random state of the start cache. True for any state, or a dict
+                with "altitude" and/or "descent_rate" to sample from the bands of those values; False for the
+                usual start. Without it, the start cache is used with start_cache_probability.
 
         Returns:
             observation (torch.Tensor): The initial observation of the environment.
@@ -188,6 +295,12 @@ class LanderEnv(gym.Env):
             0.0,  # pitch
             0.0,  # yaw
         ]
+        if options is not None and "init_conditions" in options:
+            init_conditions = [float(x) for x in options["init_conditions"]]
+            if len(init_conditions) != 9:
+                raise ValueError(
+                    f"init_conditions must have 9 values, got {len(init_conditions)}"
+                )
 
         # Get initial state from C++ Agent and convert to PyTorch tensor
 
@@ -195,6 +308,12 @@ class LanderEnv(gym.Env):
         # Get state from C++ Agent and convert to PyTorch tensor
         complete_state = np.array(self.lander.reset(init_conditions), dtype=np.float32)
 
+        # or carry on from a saved state. the reset above still starts a new episode for the recorder
+        start_state = self.choose_start_state(options)
+        if start_state is not None:
+            self.lander.restore(start_state)
+            complete_state = self.lander_state.astype(np.float32)
+
         # position, velocity, altitude, and fuel remaining, and climb speed
         observation = complete_state[[1, 2, 3, 4, 5, 6, 10, 11, 12]]
         info = {}
@@ -203,12 +322,34 @@ class LanderEnv(gym.Env):
 
         return observation, info
 
+    def choose_start_state(self, options):
+        """the snapshot reset should start from, or None for init_conditions"""
+        options = options or {}
+        if "start_state" in options:
+            return options["start_state"]
+        cached_start = options.get("cached_start")
+        if cached_start is None:
+            # a plain reset, e.g. from a vectorized env during training
+            cached_start = (
+                self.start_cache is not None
+                and self.np_random.random() < self.start_cache_probability
+            )
+        if cached_start is False:
+            return None
+        if self.start_cache is None:
+            raise ValueError("cached_start needs a start_cache")
+        band = cached_start if isinstance(cached_start, dict) else {}
+        return self.start_cache.sample(self.np_random, **band)
+
     # be careful of this obs part
-    def landing_control_policy(self, position_array, velocity_array, altitude):
+    def landing_control_policy(
+        self, position_array, velocity_array, altitude, gains=DEFAULT_GAINS
+    ):
         # this observation is from our step method! not the complete 14-length state
         # already a numpy array
+        # gains is (K_h, K_p, delta), tune_autopilot.py searches for better ones
         # note that delta must be between 0 and 1!
-        Kh, Kp, delta = 2e-2, 2.0, 0.5
+        Kh, Kp, delta = gains
 
         e_r = position_array / np.linalg.norm(position_array)
         e = -(0.5 + Kh * altitude + np.dot(velocity_array, e_r))
@@ -231,40 +372,6 @@ class LanderEnv(gym.Env):
     #         num = 0
     #     return np.array([num], dtype=np.float32)
 
-    # custom reward function to try to get better learning!
-    def energy_reward_function(
-        self,
-        position_array: np.ndarray,
-        velocity_array: np.ndarray,
-        altitude: np.ndarray,
-    ):
-        """landed and crashed are bools, indicating whether the episode has termianted or not
-        Note that if throttle is randomly generated
-        uniform generation of throttling will end after 6850 steps
-        normal generation will end after 5750 steps
-
-        we want to minimize the total energy; thats what our system is doing!
-        we can maximize the energy of the total energy
-        but also making sure the mean reward in each episode is positive
-
-        currently, we dont have a constant that makes total energy at the surface zero"""
-        potential_energy = -(self.GRAVITY_CONSTANT * self.MARS_MASS) / np.linalg.norm(
-            position_array
-        )
-        # print("potential energy", potential_energy)
-        kinetic_energy = 0.5 * np.sum(velocity_array**2)
-        # print("kinetic energy", kinetic_energy)
-        reward = -(altitude**2 + 1.5 * kinetic_energy)
-        # return reward - constant
-        return reward
-
-    # def sparse_reward_function(self, landed, crashed):
-    #     if landed:
-    #         return 10000
-    #     elif crashed:
-    #         return -10000
-    #     return -1
-
     def action_space_model_to_real(self, model):
         """transform on model action space to real action space
         model action space is symmetric and normalized for easier learning
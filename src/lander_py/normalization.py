@@ -0,0 +1,112 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from lander_env import lander_agent_cpp
+
+############################################################################################################################
+# observation and reward normalization on lander_agent_cpp.RunningMeanStd: the running statistics are updated in C++,
+# once per step for the whole batch of landers (a merge of the batch's moments, not one Welford update per lander).
+# the statistics are saved next to the model, so evaluation and inference normalize exactly as training last did,
+# from the first step, instead of warming fresh statistics up on every episode. vec_env.NativeVecNormalize applies
+# them in training. this module does not import torch or stable baselines, so inference can load statistics without them
+###########################################################################################################
+
+
+def stats_path(model_path: str) -> str:
+    """where the normalization statistics of a model are kept: models/name.zip -> models/name_normalization.npz"""
+    if model_path.endswith(".zip"):
+        model_path = model_path[: -len(".zip")]
+    return model_path + "_normalization.npz"
+
+
+class NormalizationStats:
+    """
+    Running statistics of the observations and of the discounted returns, and how they are applied.
+
+    Observations are centred and scaled, rewards only scaled by the spread of the discounted return, both
+    clipped, as stable baselines' VecNormalize does.
+
+    Attributes:
+        obs_rms (lander_agent_cpp.RunningMeanStd): Statistics of the observations.
+        return_rms (lander_agent_cpp.RunningMeanStd): Statistics of the discounted returns.
+        normalize_observations (bool), normalize_rewards (bool): Which of the two are normalized.
+    """
+
+    def __init__(
+        self,
+        observation_size: int = 9,
+        normalize_observations: bool = True,
+        normalize_rewards: bool = True,
+        gamma: float = 0.99,
+        epsilon: float = 1e-8,
+        clip_observations: float = 10.0,
+        clip_rewards: float = 10.0,
+    ):
+        self.obs_rms = lander_agent_cpp.RunningMeanStd(observation_size)
+        self.return_rms = lander_agent_cpp.RunningMeanStd(1)
+        self.normalize_observations = normalize_observations
+        self.normalize_rewards = normalize_rewards
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.clip_observations = clip_observations
+        self.clip_rewards = clip_rewards
+
+    def observations(self, observations: np.ndarray) -> np.ndarray:
+        """one observation or a batch of them, normalized with the current statistics (which are not updated)"""
+        if not self.normalize_observations:
+            return observations
+        normalized = self.obs_rms.normalize(observations, self.epsilon, self.clip_observations)
+        return normalized.astype(np.float32)
+
+    def rewards(self, rewards: np.ndarray) -> np.ndarray:
+        """rewards scaled with the current statistics of the returns (which are not updated)"""
+        if not self.normalize_rewards:
+            return rewards
+        scaled = rewards / np.sqrt(self.return_rms.var[0] + self.epsilon)
+        return np.clip(scaled, -self.clip_rewards, self.clip_rewards).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            obs_mean=self.obs_rms.mean,
+            obs_var=self.obs_rms.var,
+            obs_count=self.obs_rms.count,
+            return_mean=self.return_rms.mean,
+            return_var=self.return_rms.var,
+            return_count=self.return_rms.count,
+            normalize=np.array([self.normalize_observations, self.normalize_rewards]),
+            settings=np.array(
+                [self.gamma, self.epsilon, self.clip_observations, self.clip_rewards]
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NormalizationStats":
+        with np.load(path) as data:
+            gamma, epsilon, clip_observations, clip_rewards = data["settings"]
+            stats = cls(
+                len(data["obs_mean"]),
+                bool(data["normalize"][0]),
+                bool(data["normalize"][1]),
+                float(gamma),
+                float(epsilon),
+                float(clip_observations),
+                float(clip_rewards),
+            )
+            stats.obs_rms.mean = data["obs_mean"]
+            stats.obs_rms.var = data["obs_var"]
+            stats.obs_rms.count = float(data["obs_count"])
+            stats.return_rms.mean = data["return_mean"]
+            stats.return_rms.var = data["return_var"]
+            stats.return_rms.count = float(data["return_count"])
+        return stats
+
+
+def load_stats(model_path: str) -> Optional[NormalizationStats]:
+    """the statistics saved with a model, or None for models trained before they were saved"""
+    path = stats_path(model_path)
+    if not os.path.exists(path):
+        return None
+    return NormalizationStats.load(path)
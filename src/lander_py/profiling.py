@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, Optional
+
+from lander_env import LanderEnv, StepTimings, lander_agent_cpp
+
+############################################################################################################################
+# where the time of a training or benchmark run goes: the phases of the C++ step (counted when the module is built with
+# -DLANDER_PROFILE=ON), the Python side of LanderEnv.step (timed by LanderEnv(profile=True)), and what is left of the
+# wall time, which is spent in the wrappers, stable baselines and torch. without either, everything reads as zero
+###########################################################################################################
+
+
+def reset_profile(envs: Iterable[LanderEnv] = ()) -> None:
+    """zeroes the C++ counters, and the step timings of envs"""
+    lander_agent_cpp.reset_profile_counters()
+    for env in envs:
+        if env.step_timings is not None:
+            env.step_timings = StepTimings()
+
+
+def profile_report(
+    envs: Iterable[LanderEnv] = (), wall_seconds: Optional[float] = None
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    The counters so far, as a dict.
+
+    Args:
+        envs (iterable of LanderEnv): Envs in this process made with profile=True. Envs in worker processes
+            (vec_env's backends) cannot be read from here.
+        wall_seconds (float, optional): Wall time of the whole run, to work out the time spent outside the envs.
+
+    Returns:
+        dict: "cpp" and "python", each with {"calls", "seconds"} for every phase, and "overhead" with the
+            seconds of "binding" (the Python call around the C++ step) and "outside_env".
+    """
+    python = {phase: {"calls": 0, "seconds": 0.0} for phase in StepTimings.PHASES}
+    for env in envs:
+        if env.step_timings is None:
+            continue
+        for phase, counter in env.step_timings.as_dict().items():
+            python[phase]["calls"] += counter["calls"]
+            python[phase]["seconds"] += counter["seconds"]
+    cpp = lander_agent_cpp.profile_counters()
+
+    overhead = {}
+    if lander_agent_cpp.PROFILING and python["simulator_call"]["calls"] > 0:
+        overhead["binding"] = python["simulator_call"]["seconds"] - cpp["step"]["seconds"]
+    if wall_seconds is not None:
+        overhead["outside_env"] = wall_seconds - sum(c["seconds"] for c in python.values())
+    return {"cpp": cpp, "python": python, "overhead": overhead}
+
+
+def format_profile_report(report: Dict[str, Dict[str, Dict[str, float]]]) -> str:
+    """the report as a table, with the time per call of every phase"""
+    lines = []
+    for side in ("cpp", "python"):
+        for phase, counter in report[side].items():
+            if counter["calls"] == 0:
+                continue
+            per_call = counter["seconds"] / counter["calls"] * 1e9
+            lines.append(
+                f"{side:<6} {phase:<24} {counter['calls']:>12,} calls "
+                f"{counter['seconds']:>10.3f} s {per_call:>10.1f} ns/call"
+            )
+    for name, seconds in report["overhead"].items():
+        lines.append(f"{'':<6} {name:<24} {'':>18} {seconds:>10.3f} s")
+    if not lines:
+        return "nothing was profiled: build with -DLANDER_PROFILE=ON, or make the envs with profile=True"
+    return "\n".join(lines)
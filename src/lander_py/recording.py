@@ -0,0 +1,58 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from lander_env import REPO_ROOT, lander_agent_cpp
+
+############################################################################################################################
+# reading back what a lander_agent_cpp.TrajectoryRecorder wrote. the recorder keeps one .npy file per column, so every
+# column opens as a np.memmap: nothing is copied or parsed until it is used, however many steps were recorded
+###########################################################################################################
+
+# where benchmark_agents.py keeps its recordings
+RECORDINGS_DIR = os.path.join(REPO_ROOT, "src", "lander_py", "recordings")
+
+
+def new_recorder(name: str, capacity: int = 65536) -> "lander_agent_cpp.TrajectoryRecorder":
+    """a recorder writing into RECORDINGS_DIR/name, which is created if needed. an older recording there is overwritten"""
+    directory = os.path.join(RECORDINGS_DIR, name)
+    os.makedirs(directory, exist_ok=True)
+    return lander_agent_cpp.TrajectoryRecorder(directory, capacity)
+
+
+def open_recording(directory: str) -> Dict[str, np.ndarray]:
+    """
+    Open a recording without reading it into memory.
+
+    Call flush() on the recorder first, rows still in its buffer are not in the files yet.
+
+    Args:
+        directory (str): The directory the recorder wrote to.
+
+    Returns:
+        dict: A read-only np.memmap for every column in TrajectoryRecorder.columns, and "episode_starts",
+            the row at which every episode begins.
+    """
+    recording = {
+        column: np.load(os.path.join(directory, column + ".npy"), mmap_mode="r")
+        for column in lander_agent_cpp.TrajectoryRecorder.columns
+    }
+    # small, and needed whole
+    recording["episode_starts"] = np.load(os.path.join(directory, "episode_starts.npy"))
+    return recording
+
+
+def episode_slices(recording: Dict[str, np.ndarray]) -> List[slice]:
+    """the rows of every episode, so recording[column][episode_slices(recording)[i]] is episode i"""
+    starts = recording["episode_starts"]
+    ends = np.append(starts[1:], len(recording["simulation_time"]))
+    return [slice(int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def episode_ends(recording: Dict[str, np.ndarray], column: str) -> np.ndarray:
+    """the value of column at the last step of every episode (NaN for an episode with no steps)"""
+    values = recording[column]
+    return np.array(
+        [values[s.stop - 1] if s.stop > s.start else np.nan for s in episode_slices(recording)]
+    )
@@ -0,0 +1,252 @@
+# %%
+import argparse
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from lander_env import MODELS_DIR, lander_agent_cpp
+from evaluation import sample_initial_conditions
+
+############################################################################################################################
+# a cache of mid-descent start states, so training episodes can begin close to the ground instead of replaying the
+# whole 10km descent every time. the states are agent snapshots (fixed size byte blobs, see Agent.snapshot) taken along
+# reference landings, filed by altitude band and descent rate band. every band keeps a bounded, uniform sample of the
+# states offered to it (reservoir sampling), and the whole cache saves to, and loads from, one .npz file
+###########################################################################################################
+
+# the default bands. altitudes in m, descent rates in m/s (positive is downwards)
+ALTITUDE_EDGES = (0.0, 250.0, 500.0, 1000.0, 2000.0, 4000.0, 8000.0, 16000.0)
+DESCENT_RATE_EDGES = (-np.inf, 0.0, 2.0, 5.0, 10.0, 20.0, 50.0, np.inf)
+# how much more often a state of each default altitude band is sampled. every band holds about as many states, so
+# without these the 4 km and higher bands would give a third of the starts; with them it is under a tenth
+ALTITUDE_WEIGHTS = (1.0, 1.0, 1.0, 1.0, 0.5, 0.25, 0.125)
+# where train.py looks for a cache by default
+START_CACHE_PATH = os.path.join(MODELS_DIR, "start_states.npz")
+
+
+class StartStateCache:
+    """
+    Agent snapshots filed by altitude band and descent rate band.
+
+    Every band holds at most capacity snapshots. Once it is full, a new state replaces a random one with
+    probability capacity / (states offered so far), so the band is always a uniform sample of everything it
+    has been offered, however long the cache is fed. A state is sampled with the weight of its altitude band,
+    so the cache can favour starts near the ground, in O(1) in the number of states.
+
+    Attributes:
+        altitude_edges (np.ndarray): Edges of the altitude bands (m).
+        altitude_weights (np.ndarray): Relative sampling weight of a state in each altitude band. Defaults to
+            ALTITUDE_WEIGHTS with the default edges, and to equal weights otherwise.
+        descent_rate_edges (np.ndarray): Edges of the descent rate bands (m/s).
+        capacity (int): Most snapshots kept per band.
+        delta_t (float), integrator (str), n_substeps (int): The settings of the landers the snapshots were taken
+            from. A restored snapshot carries them on, so LanderEnv checks they match its own.
+    """
+
+    def __init__(
+        self,
+        altitude_edges: Sequence[float] = ALTITUDE_EDGES,
+        descent_rate_edges: Sequence[float] = DESCENT_RATE_EDGES,
+        altitude_weights: Optional[Sequence[float]] = None,
+        capacity: int = 256,
+        delta_t: float = 0.1,
+        integrator: str = "verlet",
+        n_substeps: int = 1,
+        seed: Optional[int] = None,
+    ):
+        self.altitude_edges = np.asarray(altitude_edges, dtype=np.float64)
+        self.descent_rate_edges = np.asarray(descent_rate_edges, dtype=np.float64)
+        if altitude_weights is None:
+            default_edges = np.array_equal(self.altitude_edges, ALTITUDE_EDGES)
+            altitude_weights = ALTITUDE_WEIGHTS if default_edges else np.ones(len(self.altitude_edges) - 1)
+        self.altitude_weights = np.asarray(altitude_weights, dtype=np.float64)
+        if self.altitude_weights.shape != (len(self.altitude_edges) - 1,):
+            raise ValueError("altitude_weights must have one weight per altitude band")
+        self.capacity = capacity
+        self.delta_t = delta_t
+        self.integrator = integrator
+        self.n_substeps = n_substeps
+        shape = (len(self.altitude_edges) - 1, len(self.descent_rate_edges) - 1)
+        self.snapshots = np.zeros(
+            shape + (capacity, lander_agent_cpp.SNAPSHOT_SIZE), dtype=np.uint8
+        )
+        # snapshots held, and offered so far, in every band
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.offered = np.zeros(shape, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def band(self, altitude: float, descent_rate: float):
+        """(altitude band, descent rate band) of a state, or None outside the edges"""
+        i = np.searchsorted(self.altitude_edges, altitude, side="right") - 1
+        j = np.searchsorted(self.descent_rate_edges, descent_rate, side="right") - 1
+        if not (0 <= i < self.counts.shape[0] and 0 <= j < self.counts.shape[1]):
+            return None
+        return int(i), int(j)
+
+    def add(self, snapshot: bytes, altitude: float, descent_rate: float) -> bool:
+        """offers a snapshot to its band. returns whether it was kept"""
+        band = self.band(altitude, descent_rate)
+        if band is None:
+            return False
+        self.offered[band] += 1
+        if self.counts[band] < self.capacity:
+            slot = self.counts[band]
+            self.counts[band] += 1
+        else:
+            # reservoir sampling: evict a random snapshot, keeping each offered state with equal probability
+            slot = self.rng.integers(self.offered[band])
+            if slot >= self.capacity:
+                return False
+        self.snapshots[band][slot] = np.frombuffer(snapshot, dtype=np.uint8)
+        return True
+
+    def sample(
+        self,
+        rng: np.random.Generator,
+        altitude: Optional[float] = None,
+        descent_rate: Optional[float] = None,
+    ) -> bytes:
+        """
+        A random cached snapshot.
+
+        Args:
+            rng (np.random.Generator): Source of randomness, e.g. the env's np_random.
+            altitude (float, optional): Only sample from the altitude band of this altitude.
+            descent_rate (float, optional): Only sample from the descent rate band of this rate.
+
+        Returns:
+            bytes: A snapshot for Agent.restore.
+        """
+        mask = self.counts > 0
+        if altitude is not None:
+            i = np.searchsorted(self.altitude_edges, altitude, side="right") - 1
+            mask &= np.arange(mask.shape[0])[:, None] == i
+        if descent_rate is not None:
+            j = np.searchsorted(self.descent_rate_edges, descent_rate, side="right") - 1
+            mask &= np.arange(mask.shape[1])[None, :] == j
+        # a band is chosen in proportion to what it holds, times the weight of its altitude
+        weights = np.where(mask, self.counts * self.altitude_weights[:, None], 0.0).ravel()
+        if weights.sum() == 0:
+            raise ValueError("no cached start states match")
+        band = np.unravel_index(
+            rng.choice(weights.size, p=weights / weights.sum()), self.counts.shape
+        )
+        return self.snapshots[band][rng.integers(self.counts[band])].tobytes()
+
+    def save(self, path: str) -> None:
+        """everything in one .npz file. only the filled part of every band is meaningful"""
+        np.savez_compressed(
+            path,
+            altitude_edges=self.altitude_edges,
+            descent_rate_edges=self.descent_rate_edges,
+            altitude_weights=self.altitude_weights,
+            snapshots=self.snapshots,
+            counts=self.counts,
+            offered=self.offered,
+            settings=np.array([self.delta_t, self.n_substeps]),
+            integrator=np.array(self.integrator),
+        )
+
+    @classmethod
+    def load(cls, path: str, seed: Optional[int] = None) -> "StartStateCache":
+        with np.load(path) as data:
+            if data["snapshots"].shape[-1] != lander_agent_cpp.SNAPSHOT_SIZE:
+                raise ValueError(
+                    f"{path} holds snapshots of {data['snapshots'].shape[-1]} bytes, this build's are "
+                    f"{lander_agent_cpp.SNAPSHOT_SIZE}. rebuild the cache"
+                )
+            delta_t, n_substeps = data["settings"]
+            cache = cls(
+                data["altitude_edges"],
+                data["descent_rate_edges"],
+                # caches saved before the weights sample every state equally
+                data["altitude_weights"] if "altitude_weights" in data else None,
+                capacity=data["snapshots"].shape[2],
+                delta_t=float(delta_t),
+                integrator=str(data["integrator"]),
+                n_substeps=int(n_substeps),
+                seed=seed,
+            )
+            cache.snapshots[...] = data["snapshots"]
+            cache.counts[...] = data["counts"]
+            cache.offered[...] = data["offered"]
+        return cache
+
+
+# %%
+def build_start_state_cache(
+    n_landings: int = 128,
+    throttle_noise: float = 0.2,
+    snapshot_every: int = 5,
+    seed: int = 0,
+    max_steps: int = 20000,
+    cache: Optional[StartStateCache] = None,
+    **cache_kwargs,
+) -> StartStateCache:
+    """
+    Fill a cache from reference landings with the proportional controller.
+
+    The landings start from seeded initial conditions (see evaluation.sample_initial_conditions). Every other
+    landing is a perturbed variant, with Gaussian noise of throttle_noise added to every throttle, so the cache
+    also holds states a little off the controller's path, like the ones a learning agent gets into.
+
+    Args:
+        n_landings (int): Number of reference landings.
+        throttle_noise (float): Standard deviation of the throttle noise of the perturbed landings.
+        snapshot_every (int): Steps between snapshots along a landing.
+        seed (int): Seed of the initial conditions and the noise.
+        max_steps (int): Landings still in the air after this many steps are abandoned.
+        cache (StartStateCache, optional): Cache to add to, otherwise a new one made with cache_kwargs.
+
+    Returns:
+        StartStateCache: The cache.
+    """
+    if cache is None:
+        cache = StartStateCache(seed=seed, **cache_kwargs)
+    rng = np.random.default_rng(seed)
+    agent = lander_agent_cpp.FastAgent()
+    agent.delta_t = cache.delta_t
+    agent.integrator = lander_agent_cpp.Integrator.__members__[cache.integrator.upper()]
+    agent.n_substeps = cache.n_substeps
+    state = agent.state_buffer
+
+    for landing, init_conditions in enumerate(sample_initial_conditions(n_landings, seed)):
+        agent.reset(init_conditions)
+        noise = throttle_noise if landing % 2 else 0.0
+        for step in range(max_steps):
+            throttle = lander_agent_cpp.proportional_throttle(state) + noise * rng.standard_normal()
+            landed, _, _ = agent.step(throttle)
+            if landed:
+                break
+            if step % snapshot_every == 0:
+                cache.add(agent.snapshot(), state[11], -state[12])
+    return cache
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser(description="Build the start state cache for training")
+    parser.add_argument("--n-landings", type=int, default=128)
+    parser.add_argument("--capacity", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=START_CACHE_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache = build_start_state_cache(args.n_landings, seed=args.seed, capacity=args.capacity)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    cache.save(args.output)
+    print(
+        f"{len(cache)} start states from {args.n_landings} landings in "
+        f"{time.perf_counter() - start:.1f} s, saved to {args.output}"
+    )
+    print("states per altitude band:", cache.counts.sum(axis=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ os.chdir("../..")
 sys.path.append(os.getcwd())
 # Now we can import the module
 import build.lander_agent_cpp as lander_agent_cpp  # noqa: E402
+from lander_env import MARS_RADIUS  # noqa: E402
+import numpy as np  # noqa: E402
 
 print("check")
 # Create an instance of the Agent
@@ -17,7 +19,6 @@ agent = lander_agent_cpp.PyAgent()
 print("check2")
 
 # init_conditions
-MARS_RADIUS = 3386000.0
 init_conditions = [
     0.0,  # x position
     -(MARS_RADIUS + 10000),  # y position
@@ -46,3 +47,62 @@ for i in range(10):
         break
 
 # %%
+# Fused step: one call per step, the state lands in a NumPy view owned by the agent
+agent.reset(init_conditions)
+state_view = agent.state_buffer
+for i in range(10):
+    landed, crashed, reward = agent.step(0.00014)
+print(f"State after fused steps: {state_view}")
+print(f"Landed: {landed}, crashed: {crashed}, reward of the last step: {reward}")
+
+# %%
+# Reward functions are chosen by name, with their parameters, and computed in C++ by step and rollout
+print(f"Reward functions: {lander_agent_cpp.REWARD_FUNCTIONS}")
+agent.set_reward("kinetic", kinetic_weight=2.0)
+print(f"{agent.reward_function}: {agent.reward_parameters}")
+_, _, reward = agent.step(0.5)
+kinetic_energy = 0.5 * np.sum(state_view[4:7] ** 2)
+print(f"Kinetic reward: {reward}, expected {-2.0 * kinetic_energy}")
+agent.set_reward("squared_altitude")
+
+# %%
+# Multi-step rollouts: hold one throttle, or follow a schedule, inside a single call
+agent.reset(init_conditions)
+n_steps, landed, crashed, _ = agent.rollout(0.5, 100)
+print(f"Held throttle for {n_steps} steps, altitude now {state_view[11]}")
+n_steps, landed, crashed, states = agent.rollout(np.linspace(0.0, 1.0, 50), record=True)
+print(f"Followed schedule for {n_steps} steps, recorded states shape {states.shape}")
+
+# %%
+# Snapshot the lander mid-descent, then try several throttle sequences from exactly that state
+agent.reset(init_conditions)
+agent.rollout(0.5, 1000)
+snapshot = agent.snapshot()
+print(f"Snapshot of {len(snapshot)} bytes (SNAPSHOT_SIZE = {lander_agent_cpp.SNAPSHOT_SIZE})")
+for candidate in [0.3, 0.5, 0.7]:
+    agent.restore(snapshot)
+    n_steps, landed, crashed, _ = agent.rollout(candidate, 20000)
+    print(f"Throttle {candidate}: landed after {n_steps} more steps, crashed: {crashed}")
+# the same snapshot restores into any other agent too
+other_agent = lander_agent_cpp.FastAgent()
+other_agent.restore(snapshot)
+print(f"Restored altitude {other_agent.state_buffer[11]}")
+
+# %%
+# Step a batch of landers together, every row is one lander
+
+n_agents = 4
+batch = lander_agent_cpp.PyBatchAgent(n_agents, n_threads=2)
+batch_init_conditions = np.tile(init_conditions, (n_agents, 1))
+# give each lander a different sideways velocity
+batch_init_conditions[:, 3] = np.linspace(0.0, 30.0, n_agents)
+states = batch.reset(batch_init_conditions)
+print(f"Batch states shape: {states.shape}")
+
+for i in range(10):
+    states, landed, crashed = batch.step(np.full(n_agents, 0.5))
+
+print(f"Batch altitudes: {states[:, 11]}")
+print(f"Batch landed: {landed}, crashed: {crashed}")
+
+# %%
@@ -5,6 +5,7 @@ import gymnasium as gym
 from gymnasium.wrappers.normalize import NormalizeReward, NormalizeObservation
 from lander_env import (
     LanderEnv,
+    lander_agent_cpp,
 )  # Assuming you've saved the LanderEnv class in a file named lander_env.py
 from stable_baselines3.common.env_checker import check_env
 
@@ -44,7 +45,11 @@ def test_lander_env(n_episodes=5, max_steps=10000):
     for episode in range(n_episodes):
         # each element here is the reward per step
         all_rewards_one_ep = []
-        all_obs_one_ep = []
+        # running mean and variance of every observation variable over this episode's steps. the same C++
+        # statistics normalization.py trains with, so no observation has to be kept. a count of 0 makes them exact
+        obs_stats_one_ep = lander_agent_cpp.RunningMeanStd(
+            env.observation_space.shape[0], initial_count=0.0
+        )
 
         observation, _ = env.reset()
         total_reward = 0
@@ -79,8 +84,8 @@ def test_lander_env(n_episodes=5, max_steps=10000):
 
             # append the reward after each step
             all_rewards_one_ep.append(reward)
-            # add relevant info to all_obs_one_ep, as a numpy array. will normalize later
-            all_obs_one_ep.append(model_observation)
+            # add the observation to this episode's running statistics
+            obs_stats_one_ep.update(model_observation)
             step += 1
 
         # append the mean reward after each episode
@@ -88,12 +93,10 @@ def test_lander_env(n_episodes=5, max_steps=10000):
         # append the return after each episode
         all_returns.append(total_reward)
 
-        # make this into an array
-        all_obs_one_ep = np.array(all_obs_one_ep)
         # mean over the steps
-        episode_means = np.mean(all_obs_one_ep, axis=0)
-        # stds ober the steps
-        episode_stds = np.std(all_obs_one_ep, axis=0)
+        episode_means = obs_stats_one_ep.mean
+        # stds over the steps
+        episode_stds = np.sqrt(obs_stats_one_ep.var)
         # add to all_obs
         all_obs_stats.append((episode_means, episode_stds))
 
@@ -124,6 +127,48 @@ def test_lander_env(n_episodes=5, max_steps=10000):
 
 test_lander_env(n_episodes=100, max_steps=10000)
 
+
+# %%
+def check_running_mean_std(max_steps=10000):
+    """
+    Check the C++ RunningMeanStd, which normalization.py trains with, against numpy on one random episode.
+
+    The statistics are updated once per observation, as the envs do, and once with the whole episode as a
+    batch. Starting from a count of 0, both should give the mean and variance of all the observations. Unlike
+    test_lander_env, this keeps the episode's observations, as numpy needs them all.
+
+    Args:
+        max_steps (int): Maximum number of steps in the episode.
+    """
+    env = LanderEnv()
+    observation, _ = env.reset()
+    observations = [observation]
+    for step in range(max_steps):
+        observation, _, terminated, truncated, _ = env.step(np.random.uniform(-1, 1, size=1))
+        if terminated or truncated:
+            break
+        observations.append(observation)
+    observations = np.array(observations, dtype=np.float64)
+
+    one_by_one = lander_agent_cpp.RunningMeanStd(observations.shape[1], initial_count=0.0)
+    for observation in observations:
+        one_by_one.update(observation)
+    batch = lander_agent_cpp.RunningMeanStd(observations.shape[1], initial_count=0.0)
+    batch.update(observations)
+
+    for name, stats in [("one by one", one_by_one), ("batch", batch)]:
+        mean_error = np.max(np.abs(stats.mean - observations.mean(axis=0)))
+        var_error = np.max(np.abs(stats.var - observations.var(axis=0)))
+        print(
+            f"RunningMeanStd {name}, over {len(observations)} observations: largest error of the mean "
+            f"{mean_error:.3g}, of the variance {var_error:.3g}"
+        )
+        assert np.allclose(stats.mean, observations.mean(axis=0))
+        assert np.allclose(stats.var, observations.var(axis=0))
+
+
+check_running_mean_std()
+
 # %%
 env = LanderEnv()
 # It will check your custom environment and output additional warnings if needed
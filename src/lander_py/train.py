@@ -1,69 +1,335 @@
+import argparse
 import os
 import sys
+import time
+from functools import partial
 import numpy as np
 from stable_baselines3 import PPO, DDPG, SAC
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.vec_env import DummyVecEnv, VecEnvWrapper, VecMonitor
 from stable_baselines3.common.evaluation import evaluate_policy
-from stable_baselines3.common.callbacks import EvalCallback
-from gymnasium.wrappers.normalize import NormalizeReward, NormalizeObservation
+from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
 import torch
 
 
-from lander_env import LanderEnv
+from lander_env import LanderEnv, MODELS_DIR, lander_agent_cpp
+from vec_env import VEC_ENV_BACKENDS, NativeVecNormalize, SharedMemoryVecEnv, make_lander_vec_env
+from profiling import format_profile_report, profile_report, reset_profile
 
 
 ####################
 ## THESE NORMALIZATION STEPS ARE KEY!!!!
 #####################
 
-# Create and wrap the environment using Monitor
-env = LanderEnv()
-# normalize observations
-# env = NormalizeObservation(env)
-# normalize rewards too
-env = NormalizeReward(env)
-# wrap in a stable baselines Monitor class
-env = Monitor(env)
-
-
-# make the model much smaller, default is 64 to 64 for both actor and critic
-policy_kwargs = dict(net_arch=[8, 8])
-
-# Set up the model
-model = PPO(
-    policy="MlpPolicy",
-    env=env,
-    n_steps=7000,  # number of timesteps per environment, before next update. a little more than the legnth of one episode
-    learning_rate=4e-4,  # increase lr for smaller models
-    batch_size=1000,
-    n_epochs=10,
-    # clip_range=0.3,  # allow bigger policy updates
-    ent_coef=0.01,  # more randomness, default is zero? highest for this is 0.05!
-    policy_kwargs=policy_kwargs,
-    verbose=2,
-    device="cuda" if torch.cuda.is_available() else "cpu",
-)
-
-
-# # Load the saved model
-# model = PPO.load("current_model")
-
-# Train the model
-
-# Set up saving parameters
-save_freq = 64000  # Save every now and then
-all_timesteps = 128000
-steps = 0
-for i in range(0, all_timesteps, save_freq):
-    model.learn(total_timesteps=save_freq, reset_num_timesteps=False)
-    model.save("./src/lander_py/models/ppo_potentialonly")
-    steps += save_freq
-    print(f"Model saved at step {steps}")
-
-
-# # Evaluate the model
-# mean_reward, std_reward = evaluate_policy(model, env, n_eval_episodes=20)
-# print(f"Mean return: {mean_reward:.2f} +/- {std_reward:.2f}")
-
-print("Training is done!")
+
+class TimedVecEnv(VecEnvWrapper):
+    """the wall time spent stepping the landers, through the backend and its workers, in step_seconds"""
+
+    def __init__(self, venv):
+        super().__init__(venv)
+        self.step_seconds = 0.0
+
+    def step_async(self, actions):
+        start = time.perf_counter()
+        self.venv.step_async(actions)
+        self.step_seconds += time.perf_counter() - start
+
+    def step_wait(self):
+        start = time.perf_counter()
+        result = self.venv.step_wait()
+        self.step_seconds += time.perf_counter() - start
+        return result
+
+    def reset(self):
+        return self.venv.reset()
+
+
+def make_env(
+    n_envs=1,
+    backend="shared_memory",
+    env_kwargs=None,
+    normalize_observations=False,
+    frame_skip=1,
+    n_workers=None,
+):
+    """one LanderEnv, or n_envs of them in parallel, with the rewards (and optionally observations) normalized.
+    returns the env and its NativeVecNormalize, whose statistics are saved with the model"""
+    env_kwargs = env_kwargs or {}
+    if n_envs == 1:
+        env = DummyVecEnv([partial(LanderEnv, frame_skip=frame_skip, **env_kwargs)])
+    else:
+        env = make_lander_vec_env(
+            n_envs,
+            backend=backend,
+            frame_skip=frame_skip,
+            n_workers=n_workers,
+            env_kwargs=env_kwargs,
+        )
+    # normalize in C++, for all the landers at once, then monitor
+    normalizer = NativeVecNormalize(
+        TimedVecEnv(env),
+        normalize_observations=normalize_observations,
+        normalize_rewards=True,
+    )
+    env = VecMonitor(normalizer)
+    return env, normalizer
+
+
+class ThroughputCallback(BaseCallback):
+    """
+    Logs where the wall time of training goes, once per rollout and policy update.
+
+    Every rollout logs the environment steps per second it collected at, the time spent stepping the landers
+    (the rest of a rollout is policy inference and the wrappers) and the simulation share: the time inside
+    the C++ step calls, as a share of the time the stepping processes had. The simulation share is only
+    logged with profile, and needs envs made with profile=True. The update after each rollout is logged at
+    the start of the next one.
+
+    Args:
+        timed_env (TimedVecEnv): The landers, below the normalization.
+        profile (bool): Whether the landers time their steps, and the simulation share is logged.
+    """
+
+    def __init__(self, timed_env, profile=False, verbose=0):
+        super().__init__(verbose)
+        self.timed_env = timed_env
+        self.profile = profile
+        venv = timed_env.venv
+        # the landers of a worker process are stepped one after the other, the workers side by side
+        if isinstance(venv, SharedMemoryVecEnv):
+            self.n_step_processes = venv.n_workers
+        elif isinstance(venv, DummyVecEnv):
+            self.n_step_processes = 1
+        else:
+            self.n_step_processes = venv.num_envs
+        self.rollout_end = None
+        self.totals = {"rollout": 0.0, "update": 0.0, "env_steps": 0}
+
+    def _simulation_seconds(self):
+        if not self.profile:
+            return 0.0
+        timings = self.timed_env.get_attr("step_timings")
+        return sum(t.as_dict()["simulator_call"]["seconds"] for t in timings if t is not None)
+
+    def _on_training_end(self):
+        # learn is called again at every save, its last update ends here
+        if self.rollout_end is not None:
+            self.totals["update"] += time.perf_counter() - self.rollout_end
+        self.rollout_end = None
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.rollout_end is not None:
+            update_seconds = now - self.rollout_end
+            self.totals["update"] += update_seconds
+            self.logger.record("throughput/policy_update_s", update_seconds)
+            self.logger.record(
+                "throughput/update_share", update_seconds / (update_seconds + self.rollout_seconds)
+            )
+        self.rollout_start = now
+        self.rollout_steps = self.num_timesteps
+        self.env_step_seconds = self.timed_env.step_seconds
+        self.simulation_seconds = self._simulation_seconds()
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.perf_counter()
+        self.rollout_seconds = self.rollout_end - self.rollout_start
+        env_steps = self.num_timesteps - self.rollout_steps
+        env_step_seconds = self.timed_env.step_seconds - self.env_step_seconds
+        simulation_seconds = self._simulation_seconds() - self.simulation_seconds
+        self.totals["rollout"] += self.rollout_seconds
+        self.totals["env_steps"] += env_steps
+        self.logger.record("throughput/env_steps_per_s", env_steps / self.rollout_seconds)
+        self.logger.record("throughput/rollout_s", self.rollout_seconds)
+        self.logger.record("throughput/env_step_share", env_step_seconds / self.rollout_seconds)
+        if self.profile:
+            self.logger.record(
+                "throughput/simulation_share",
+                simulation_seconds / (self.rollout_seconds * self.n_step_processes),
+            )
+
+    def summary(self):
+        """the totals over the whole run, as one line"""
+        total = self.totals["rollout"] + self.totals["update"]
+        if total == 0.0:
+            return "nothing was trained"
+        return (
+            f"{self.totals['env_steps']:,} env steps at {self.totals['env_steps'] / self.totals['rollout']:,.0f} "
+            f"steps/s while collecting, {self.totals['rollout']:.1f} s collecting and "
+            f"{self.totals['update']:.1f} s updating the policy ({self.totals['update'] / total:.0%})"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train PPO on the Mars lander")
+    parser.add_argument(
+        "--n-envs",
+        type=int,
+        default=1,
+        help="number of landers to train on in parallel, each in a worker process. 0 for one per core",
+    )
+    parser.add_argument(
+        "--vec-env",
+        choices=VEC_ENV_BACKENDS,
+        default="shared_memory",
+        help="how the parallel landers are run, when --n-envs is more than 1",
+    )
+    parser.add_argument(
+        "--n-workers",
+        type=int,
+        default=None,
+        help="worker processes of the shared_memory backend, defaults to one per core (at most one per lander)",
+    )
+    parser.add_argument(
+        "--frame-skip", type=int, default=1, help="simulation steps per action"
+    )
+    parser.add_argument(
+        "--n-steps",
+        type=int,
+        default=7000,
+        help="rollout length: steps of every env before each policy update. "
+        "the default is a little more than the length of one episode",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--n-epochs", type=int, default=10)
+    # increased lr for the smaller models
+    parser.add_argument("--learning-rate", type=float, default=4e-4)
+    # more randomness, default is zero? highest for this is 0.05!
+    parser.add_argument("--ent-coef", type=float, default=0.01)
+    parser.add_argument(
+        "--net-arch",
+        type=int,
+        nargs="+",
+        default=[8, 8],
+        help="hidden layer sizes of both actor and critic. stable baselines' default is 64 64",
+    )
+    parser.add_argument(
+        "--reward",
+        default="squared_altitude",
+        choices=lander_agent_cpp.REWARD_FUNCTIONS,
+        help="the reward function, computed in C++",
+    )
+    parser.add_argument(
+        "--kinetic-weight",
+        type=float,
+        default=None,
+        help="weight of the kinetic energy in the squared_altitude and kinetic rewards",
+    )
+    parser.add_argument(
+        "--start-cache",
+        default=None,
+        help="a cache saved by start_states.py, to start episodes mid-descent",
+    )
+    parser.add_argument(
+        "--start-cache-probability",
+        type=float,
+        default=0.9,
+        help="share of episodes started from the cache, the rest start 10km up",
+    )
+    parser.add_argument(
+        "--normalize-observations",
+        action="store_true",
+        help="normalize the observations as well as the rewards",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time the phases of every step, log the simulation share of every rollout and print where the "
+        "time went at every save. "
+        "the C++ phases need a build with -DLANDER_PROFILE=ON, and landers in this process (--n-envs 1)",
+    )
+    parser.add_argument("--total-timesteps", type=int, default=128000)
+    parser.add_argument("--save-freq", type=int, default=64000)
+    parser.add_argument("--model-name", default="ppo_potentialonly")
+    parser.add_argument(
+        "--models-dir", default=MODELS_DIR, help="where the model and its statistics are saved"
+    )
+    args = parser.parse_args()
+    if args.n_envs == 0:
+        args.n_envs = os.cpu_count() or 1
+    return args
+
+
+def main():
+    args = parse_args()
+    # with --profile the Python side of every step is timed, for the simulation share of the throughput logs
+    env_kwargs = {"reward": args.reward, "profile": args.profile}
+    if args.kinetic_weight is not None:
+        env_kwargs["reward_params"] = {"kinetic_weight": args.kinetic_weight}
+    if args.start_cache is not None:
+        env_kwargs.update(
+            start_cache=args.start_cache,
+            start_cache_probability=args.start_cache_probability,
+        )
+    env, normalizer = make_env(
+        args.n_envs,
+        args.vec_env,
+        env_kwargs,
+        args.normalize_observations,
+        args.frame_skip,
+        args.n_workers,
+    )
+    timed_env = normalizer.venv
+    throughput = ThroughputCallback(timed_env, profile=args.profile)
+
+    policy_kwargs = dict(net_arch=args.net_arch)
+
+    # Set up the model
+    model = PPO(
+        policy="MlpPolicy",
+        env=env,
+        n_steps=args.n_steps,
+        learning_rate=args.learning_rate,
+        batch_size=args.batch_size,
+        n_epochs=args.n_epochs,
+        # clip_range=0.3,  # allow bigger policy updates
+        ent_coef=args.ent_coef,
+        policy_kwargs=policy_kwargs,
+        verbose=2,
+        device="cuda" if torch.cuda.is_available() else "cpu",
+    )
+    print(
+        f"training on {args.n_envs} landers ({args.vec_env if args.n_envs > 1 else 'in process'}), "
+        f"{args.n_steps * args.n_envs} steps per rollout"
+    )
+
+    # # Load the saved model
+    # model = PPO.load("current_model")
+
+    # Train the model
+
+    # Set up saving parameters
+    save_freq = args.save_freq  # Save every now and then
+    all_timesteps = args.total_timesteps
+    model_path = os.path.join(args.models_dir, args.model_name)
+    os.makedirs(args.models_dir, exist_ok=True)
+    steps = 0
+    # the landers stepped in this process, whose Python timings can be read
+    local_envs = getattr(timed_env.venv, "envs", [])
+    reset_profile(local_envs)
+    start = time.perf_counter()
+    for i in range(0, all_timesteps, save_freq):
+        model.learn(total_timesteps=save_freq, reset_num_timesteps=False, callback=throughput)
+        model.save(model_path)
+        # evaluation and inference load these, and normalize as training does without warming up
+        normalizer.save_stats(model_path)
+        steps += save_freq
+        print(f"Model saved at step {steps}")
+        print(throughput.summary())
+        if args.profile:
+            report = profile_report(local_envs, time.perf_counter() - start)
+            print(format_profile_report(report))
+
+    # # Evaluate the model
+    # mean_reward, std_reward = evaluate_policy(model, env, n_eval_episodes=20)
+    # print(f"Mean return: {mean_reward:.2f} +/- {std_reward:.2f}")
+
+    env.close()
+    print("Training is done!")
+
+
+# the worker processes of the parallel envs import this file again, so training must only start from here
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# %%
+import json
+import os
+import time
+import numpy as np
+
+from lander_env import DEFAULT_GAINS, MODELS_DIR, lander_agent_cpp
+from evaluation import sample_initial_conditions
+
+############################################################################################################################
+# this script searches for better (K_h, K_p, delta) gains for the proportional autopilot
+# all the landings run in C++ across every core, through lander_agent_cpp.evaluate_autopilot_gains
+###########################################################################################################
+
+
+# %%
+def sample_gains(n_gains, seed=0):
+    """K_h and K_p are sampled log-uniformly, delta uniformly. delta must be between 0 and 1"""
+    rng = np.random.default_rng(seed)
+    gains = np.empty((n_gains, 3))
+    gains[:, 0] = 10 ** rng.uniform(-3, -1, n_gains)
+    gains[:, 1] = 10 ** rng.uniform(-1, 1.5, n_gains)
+    gains[:, 2] = rng.uniform(0.05, 0.95, n_gains)
+    return gains
+
+
+def landing_cost(
+    results, descent_weight=100.0, ground_weight=100.0, crash_penalty=1000.0
+):
+    """mean cost of each row of gains, lower is better.
+    fuel used (litres) plus weighted touchdown speeds, with a flat penalty for crashing or never landing"""
+    failed = results["crashed"] | ~results["landed"]
+    cost = (
+        results["fuel_used"]
+        + descent_weight * np.abs(results["descent_rate"])
+        + ground_weight * results["ground_speed"]
+        + crash_penalty * failed
+    )
+    return cost.mean(axis=1)
+
+
+def successive_halving(
+    n_gains=4096, n_episodes=8, eta=4, max_episodes=256, max_steps=20000, seed=0
+):
+    """evaluate every candidate on a few landings, keep the best 1/eta, and give the survivors eta times
+    as many landings. repeats until one candidate is left or max_episodes is reached"""
+    gains = sample_gains(n_gains, seed=seed)
+    # always keep the hand-picked gains in the race, as a reference
+    gains[0] = DEFAULT_GAINS
+    all_init_conditions = sample_initial_conditions(max_episodes, seed=seed + 1)
+
+    while True:
+        start = time.perf_counter()
+        results = lander_agent_cpp.evaluate_autopilot_gains(
+            gains, all_init_conditions[:n_episodes], max_steps=max_steps
+        )
+        cost = landing_cost(results)
+        order = np.argsort(cost)
+        print(
+            f"{len(gains)} candidates x {n_episodes} landings: {results['steps'].sum():,} steps "
+            f"in {time.perf_counter() - start:.2f}s, best cost {cost[order[0]]:.2f}"
+        )
+
+        if len(gains) <= eta or n_episodes * eta > max_episodes:
+            return gains[order], cost[order], results
+
+        gains = gains[order[: max(1, len(gains) // eta)]]
+        n_episodes *= eta
+
+
+def main(save_path=os.path.join(MODELS_DIR, "autopilot_gains.json"), seed=0):
+    gains, cost, _ = successive_halving(seed=seed)
+    K_h, K_p, delta = gains[0]
+    print(f"Best gains: K_h={K_h:.4g}, K_p={K_p:.4g}, delta={delta:.4g}")
+
+    # compare against the hand-picked gains on held-out landings, the search drew its own from seed + 1
+    init_conditions = sample_initial_conditions(256, seed=seed + 2)
+    results = lander_agent_cpp.evaluate_autopilot_gains(
+        np.array([DEFAULT_GAINS, gains[0]]), init_conditions
+    )
+    for name, i in [("Hand-picked", 0), ("Tuned", 1)]:
+        print(
+            f"{name}: cost {landing_cost(results)[i]:.2f}, "
+            f"fuel used {results['fuel_used'][i].mean():.2f} l, "
+            f"descent rate {results['descent_rate'][i].mean():.3f} m/s, "
+            f"ground speed {results['ground_speed'][i].mean():.3f} m/s, "
+            f"crashed {results['crashed'][i].mean():.1%}"
+        )
+
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    with open(save_path, "w") as f:
+        json.dump({"K_h": K_h, "K_p": K_p, "delta": delta}, f, indent=2)
+    print(f"Gains saved to {save_path}")
+
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+import multiprocessing as mp
+import os
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv, VecEnvWrapper
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+from lander_env import LanderEnv
+from normalization import NormalizationStats, stats_path
+
+############################################################################################################################
+# vectorized LanderEnvs for training on many landers at once
+# SharedMemoryVecEnv runs the landers in worker processes, and passes actions, observations, rewards and done flags
+# through shared memory. the pipes to the workers only carry a short command, and the infos of finished episodes
+###########################################################################################################
+
+# the names of the arrays shared between the main process and the workers
+SHARED_ARRAYS = ("actions", "observations", "rewards", "dones", "terminal_observations")
+
+
+def _shared_array(ctx, shape, dtype):
+    """a RawArray, which can be handed to a worker process, and a numpy view onto it"""
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray("b", max(1, int(np.prod(shape)) * dtype.itemsize))
+    return raw, _array_view(raw, shape, dtype)
+
+
+def _array_view(raw, shape, dtype):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _worker(remote, parent_remote, env_fn_wrappers, env_indices, shared):
+    """hosts the envs env_indices, reads their actions from, and writes their results to, the shared arrays"""
+    # Import here so the worker only pulls in what it needs
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    envs = [env_fn_wrapper.var() for env_fn_wrapper in env_fn_wrappers]
+    arrays = {
+        name: _array_view(raw, shape, dtype) for name, (raw, shape, dtype) in shared.items()
+    }
+    actions = arrays["actions"]
+    observations = arrays["observations"]
+    rewards = arrays["rewards"]
+    dones = arrays["dones"]
+    terminal_observations = arrays["terminal_observations"]
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                # only the infos of finished episodes are sent back, keyed by env index
+                infos = {}
+                reset_infos = {}
+                for env, i in zip(envs, env_indices):
+                    observation, reward, terminated, truncated, info = env.step(
+                        actions[i]
+                    )
+                    done = terminated or truncated
+                    if done:
+                        info["TimeLimit.truncated"] = truncated and not terminated
+                        # save final observation where the main process can get it, then reset
+                        terminal_observations[i] = observation
+                        observation, reset_infos[i] = env.reset()
+                        infos[i] = info
+                    observations[i] = observation
+                    rewards[i] = reward
+                    dones[i] = done
+                remote.send((infos, reset_infos))
+            elif cmd == "reset":
+                seeds, options = data
+                reset_infos = {}
+                for env, i in zip(envs, env_indices):
+                    maybe_options = {"options": options[i]} if options[i] else {}
+                    observations[i], reset_infos[i] = env.reset(
+                        seed=seeds[i], **maybe_options
+                    )
+                remote.send(reset_infos)
+            elif cmd == "close":
+                for env in envs:
+                    env.close()
+                remote.close()
+                break
+            else:
+                # the rest act on a single env, data is (env index, arguments)
+                i, args = data
+                env = envs[env_indices.index(i)]
+                if cmd == "env_method":
+                    method = env.get_wrapper_attr(args[0])
+                    remote.send(method(*args[1], **args[2]))
+                elif cmd == "get_attr":
+                    remote.send(env.get_wrapper_attr(args))
+                elif cmd == "set_attr":
+                    remote.send(setattr(env, args[0], args[1]))
+                elif cmd == "is_wrapped":
+                    remote.send(is_wrapped(env, args))
+                else:
+                    raise NotImplementedError(
+                        f"`{cmd}` is not implemented in the worker"
+                    )
+        except (EOFError, KeyboardInterrupt):
+            break
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    A multiprocess vectorized environment, like SubprocVecEnv, but with the bulk data in shared memory.
+
+    Every step, the actions are written into a shared array and each worker gets a one word "step" command.
+    The workers write observations, rewards and done flags straight into shared arrays, so nothing is pickled
+    for an ordinary step. Infos are only sent back for finished episodes (with "terminal_observation" and
+    "TimeLimit.truncated", which is what stable baselines needs); the infos of the other steps are empty dicts.
+
+    Several envs can share one worker process, which cuts the number of round trips per step.
+
+    Attributes:
+        n_workers (int): The number of worker processes.
+    """
+
+    def __init__(
+        self,
+        env_fns: List[Callable[[], gym.Env]],
+        n_workers: Optional[int] = None,
+        start_method: Optional[str] = None,
+    ):
+        """
+        Args:
+            env_fns (list): Functions that each create one environment. They are pickled to the workers.
+            n_workers (int, optional): Number of worker processes, the envs are split between them in
+                contiguous blocks. Defaults to one per env, up to the number of cores.
+            start_method (str, optional): The multiprocessing start method. Defaults to 'forkserver' where it is
+                available, and 'spawn' otherwise. Both of these need the training script to be wrapped in an
+                ``if __name__ == "__main__":`` block.
+        """
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        if n_workers is None:
+            n_workers = min(n_envs, os.cpu_count() or 1)
+        if not 1 <= n_workers <= n_envs:
+            raise ValueError(
+                f"n_workers must be between 1 and the number of envs ({n_envs}), got {n_workers}"
+            )
+        self.n_workers = n_workers
+
+        # the workers build their own envs, this one is only for the spaces
+        env = env_fns[0]()
+        observation_space, action_space = env.observation_space, env.action_space
+        env.close()
+
+        if start_method is None:
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        shapes_and_dtypes = {
+            "actions": ((n_envs, *action_space.shape), action_space.dtype),
+            "observations": ((n_envs, *observation_space.shape), observation_space.dtype),
+            "rewards": ((n_envs,), np.float32),
+            "dones": ((n_envs,), np.bool_),
+            "terminal_observations": (
+                (n_envs, *observation_space.shape),
+                observation_space.dtype,
+            ),
+        }
+        shared = {}
+        self._arrays = {}
+        for name in SHARED_ARRAYS:
+            shape, dtype = shapes_and_dtypes[name]
+            raw, self._arrays[name] = _shared_array(ctx, shape, dtype)
+            shared[name] = (raw, shape, np.dtype(dtype).str)
+
+        # env i lives in worker self._worker_of[i]
+        blocks = np.array_split(np.arange(n_envs), n_workers)
+        self._worker_of = np.repeat(np.arange(n_workers), [len(b) for b in blocks])
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for work_remote, remote, block in zip(self.work_remotes, self.remotes, blocks):
+            env_indices = block.tolist()
+            args = (
+                work_remote,
+                remote,
+                [CloudpickleWrapper(env_fns[i]) for i in env_indices],
+                env_indices,
+                shared,
+            )
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        # after the workers are up, as this asks them for their render_mode
+        super().__init__(n_envs, observation_space, action_space)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._arrays["actions"][:] = np.asarray(actions).reshape(
+            self._arrays["actions"].shape
+        )
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        infos = [{} for _ in range(self.num_envs)]
+        for remote in self.remotes:
+            finished_infos, reset_infos = remote.recv()
+            for i, info in finished_infos.items():
+                info["terminal_observation"] = self._arrays["terminal_observations"][
+                    i
+                ].copy()
+                infos[i] = info
+            for i, reset_info in reset_infos.items():
+                self.reset_infos[i] = reset_info
+        self.waiting = False
+        # copy out of the shared arrays, the workers overwrite them on the next step
+        return (
+            self._arrays["observations"].copy(),
+            self._arrays["rewards"].copy(),
+            self._arrays["dones"].copy(),
+            infos,
+        )
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", (self._seeds, self._options)))
+        for remote in self.remotes:
+            for i, reset_info in remote.recv().items():
+                self.reset_infos[i] = reset_info
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self._arrays["observations"].copy()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _call_each(self, cmd: str, args: Any, indices) -> List[Any]:
+        """send cmd to the worker of every env in indices, and collect the answers in order"""
+        indices = self._get_indices(indices)
+        for i in indices:
+            self.remotes[self._worker_of[i]].send((cmd, (i, args)))
+        # each pipe answers in the order it was asked
+        return [self.remotes[self._worker_of[i]].recv() for i in indices]
+
+    def get_attr(self, attr_name: str, indices=None) -> List[Any]:
+        return self._call_each("get_attr", attr_name, indices)
+
+    def set_attr(self, attr_name: str, value: Any, indices=None) -> None:
+        self._call_each("set_attr", (attr_name, value), indices)
+
+    def env_method(
+        self, method_name: str, *method_args, indices=None, **method_kwargs
+    ) -> List[Any]:
+        return self._call_each(
+            "env_method", (method_name, method_args, method_kwargs), indices
+        )
+
+    def env_is_wrapped(self, wrapper_class, indices=None) -> List[bool]:
+        return self._call_each("is_wrapped", wrapper_class, indices)
+
+
+# the backends make_lander_vec_env can build
+VEC_ENV_BACKENDS = ("shared_memory", "subproc", "dummy")
+
+
+def make_lander_vec_env(
+    n_envs: int,
+    backend: str = "shared_memory",
+    frame_skip: int = 1,
+    n_workers: Optional[int] = None,
+    start_method: Optional[str] = None,
+    seed: Optional[int] = None,
+    env_kwargs: Optional[dict] = None,
+) -> VecEnv:
+    """
+    Create n_envs LanderEnvs behind one vectorized environment.
+
+    Args:
+        n_envs (int): Number of landers.
+        backend (str): "shared_memory" for SharedMemoryVecEnv, "subproc" for stable baselines' SubprocVecEnv
+            (one process per env, everything pickled through pipes), or "dummy" to step them all in this process.
+        frame_skip (int): Passed to every LanderEnv.
+        n_workers (int, optional): Number of worker processes for the shared_memory backend.
+        start_method (str, optional): The multiprocessing start method, for the process based backends.
+        seed (int, optional): Env i is seeded with seed + i on the first reset.
+        env_kwargs (dict, optional): More keyword arguments for every LanderEnv. They are pickled to the
+            workers, so pass a start cache by its path rather than as an object.
+
+    Returns:
+        VecEnv: The vectorized environment. Wrap it in VecNormalize / VecMonitor as needed.
+    """
+    if backend not in VEC_ENV_BACKENDS:
+        raise ValueError(f"backend must be one of {VEC_ENV_BACKENDS}, got {backend!r}")
+    # a partial of the class, rather than a lambda, so it pickles by reference
+    env_fns = [
+        partial(LanderEnv, frame_skip=frame_skip, **(env_kwargs or {}))
+        for _ in range(n_envs)
+    ]
+
+    if backend == "shared_memory":
+        vec_env = SharedMemoryVecEnv(
+            env_fns, n_workers=n_workers, start_method=start_method
+        )
+    elif backend == "subproc":
+        vec_env = SubprocVecEnv(env_fns, start_method=start_method)
+    else:
+        vec_env = DummyVecEnv(env_fns)
+
+    if seed is not None:
+        vec_env.seed(seed)
+    return vec_env
+
+
+class NativeVecNormalize(VecEnvWrapper):
+    """
+    A drop-in for stable baselines' VecNormalize, with the statistics kept in NormalizationStats.
+
+    Args:
+        venv (VecEnv): The landers, e.g. from make_lander_vec_env.
+        stats (NormalizationStats, optional): Statistics to carry on from, e.g. loaded for evaluation.
+            Defaults to fresh ones with the settings below.
+        training (bool): Whether the statistics are updated. Set it to False for evaluation.
+        normalize_observations (bool), normalize_rewards (bool), gamma (float): For fresh statistics.
+    """
+
+    def __init__(
+        self,
+        venv: VecEnv,
+        stats: Optional[NormalizationStats] = None,
+        training: bool = True,
+        normalize_observations: bool = False,
+        normalize_rewards: bool = True,
+        gamma: float = 0.99,
+    ):
+        super().__init__(venv)
+        if stats is None:
+            stats = NormalizationStats(
+                venv.observation_space.shape[0],
+                normalize_observations,
+                normalize_rewards,
+                gamma,
+            )
+        self.stats = stats
+        self.training = training
+        # the discounted return of every lander so far in its episode
+        self.returns = np.zeros(self.num_envs)
+
+    def step_wait(self):
+        observations, rewards, dones, infos = self.venv.step_wait()
+        if self.training and self.stats.normalize_observations:
+            self.stats.obs_rms.update(observations)
+        if self.training and self.stats.normalize_rewards:
+            self.returns = self.returns * self.stats.gamma + rewards
+            self.stats.return_rms.update(self.returns[:, None])
+        self.returns[dones] = 0.0
+
+        # the last observation of a finished episode is normalized like the others
+        for i in np.flatnonzero(dones):
+            if "terminal_observation" in infos[i]:
+                infos[i]["terminal_observation"] = self.stats.observations(
+                    infos[i]["terminal_observation"]
+                )
+        return self.stats.observations(observations), self.stats.rewards(rewards), dones, infos
+
+    def reset(self):
+        observations = self.venv.reset()
+        self.returns = np.zeros(self.num_envs)
+        if self.training and self.stats.normalize_observations:
+            self.stats.obs_rms.update(observations)
+        return self.stats.observations(observations)
+
+    def save_stats(self, model_path: str) -> None:
+        """saves the statistics next to the model, see stats_path"""
+        self.stats.save(stats_path(model_path))
@@ -0,0 +1,152 @@
+import os
+import sys
+from typing import Tuple
+
+import numpy as np
+
+############################################################################################################################
+# the gravity integrators of assignment2.py for many orbits at once. every orbit has its own start, time step and length,
+# and every every-th step is kept, so long runs need not hold all their steps. the loops run in C++ when the lander's
+# python module is built (lander_agent_cpp.propagate_orbits, with the lander's own gravity_force), and otherwise in
+# numpy, one step of every orbit per iteration
+###########################################################################################################
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+try:
+    import build.lander_agent_cpp as lander_agent_cpp
+except ImportError:
+    lander_agent_cpp = None
+
+METHODS = ("euler", "verlet")
+BACKENDS = ("auto", "cpp", "numpy")
+# the gravitational constant and the mass of Mars, as assignment2.py has them
+G = 6.67430e-11
+M = 6.42e23
+
+
+def circular_velocity(r, gm: float = G * M) -> np.ndarray:
+    """the speed of a circular orbit through every position in r, (..., 3)"""
+    return np.sqrt(gm / np.linalg.norm(r, axis=-1))
+
+
+def escape_velocity(r, gm: float = G * M) -> np.ndarray:
+    """the escape speed at every position in r, (..., 3)"""
+    return np.sqrt(2.0 * gm / np.linalg.norm(r, axis=-1))
+
+
+def gravity(r: np.ndarray, gm: float = G * M) -> np.ndarray:
+    """the acceleration at every position in r, (n, 3), zero at the origin as gravitational_force has it"""
+    r2 = np.einsum("ij,ij->i", r, r)
+    scale = np.divide(gm, r2 * np.sqrt(r2), out=np.zeros_like(r2), where=r2 > 0.0)
+    return -scale[:, None] * r
+
+
+def _propagate_numpy(verlet, r0, v0, dt, n, every, gm, r_out, v_out, a_out):
+    """the loops of propagate_orbits in orbits.cpp, every running orbit a row of one array"""
+    # no orbits, nothing to sample, as the cpp backend has it
+    if len(n) == 0:
+        return
+    # longest orbits first, so the ones still running are always the first rows
+    order = np.argsort(-n, kind="stable")
+    r, v, dt, n, every = r0[order], v0[order], dt[order, None], n[order], every[order]
+    r_prev = np.zeros_like(r)
+    dt2 = dt**2
+    # the same sampling for every orbit saves working out which are due at every step
+    common_every = int(every[0]) if (every == every[0]).all() else None
+    # the steps at which an orbit takes its last step, or has stopped
+    changes = {0} | set(n.tolist()) | set((n - 1).tolist())
+
+    for j in range(int(n.max(initial=0))):
+        if j in changes:
+            running = int(np.count_nonzero(n > j))
+            # the orbits taking their last step are the last of the running rows
+            finishing = int(np.count_nonzero(n > j + 1))
+            rows_running = order[:running]
+        R, step = r[:running], dt[:running]
+        a = gravity(R, gm)
+        if verlet:
+            r_next = R + step * v[:running] if j == 0 else 2 * R - r_prev[:running] + a * dt2[:running]
+
+        if common_every is not None:
+            rows = slice(0, running) if j % common_every == 0 else None
+            samples = j // common_every
+        else:
+            rows = np.flatnonzero(j % every[:running] == 0)
+            samples = j // every[rows]
+            rows = rows if len(rows) else None
+        if rows is not None:
+            if verlet and j > 0:
+                V = (r_next[rows] - r_prev[rows]) / (2 * step[rows])
+                # the last step has no next position
+                if finishing < running:
+                    last = np.arange(running)[rows] >= finishing
+                    V[last] = (R[rows][last] - r_prev[rows][last]) / step[rows][last]
+            else:
+                V = v[rows]
+            r_out[rows_running[rows], samples] = R[rows]
+            v_out[rows_running[rows], samples] = V
+            a_out[rows_running[rows], samples] = a[rows]
+
+        if verlet:
+            r_prev[:running] = R
+            r[:running] = r_next
+        else:
+            r[:running] += step * v[:running]
+            v[:running] += step * a
+
+
+def propagate(
+    method: str, r0, v0, dt, t_max, gm: float = G * M, every=1, backend: str = "auto", n_threads: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fly every orbit under gravity alone, all in one call.
+
+    Every orbit takes len(np.arange(0, t_max, dt)) steps and gives the same r, v and a as euler_method_gravity or
+    verlet_method_gravity in assignment2.py would, up to rounding, at steps 0, every, 2 every, ...
+
+    Args:
+        method (str): "euler" or "verlet".
+        r0, v0 (np.ndarray): Initial positions and velocities, (3,) or (n_orbits, 3).
+        dt, t_max, every (float, float, int or np.ndarray): Positive time step, length and sampling of every orbit,
+            broadcast against each other and the orbits.
+        gm (float): The gravitational constant times the mass of the planet. Defaults to assignment2.py's Mars.
+        backend (str): "cpp" for lander_agent_cpp.propagate_orbits, "numpy", or "auto" for cpp if it is built.
+        n_threads (int): Threads of the cpp backend, 0 uses every core.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): t (n_orbits, n_samples), then r, v and a
+            (n_orbits, n_samples, 3), with n_samples the most samples of any orbit. NaN past the end of the shorter
+            orbits.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+    if backend == "cpp" and lander_agent_cpp is None:
+        raise ImportError("backend 'cpp' needs the lander_agent_cpp module, build it with cmake first")
+
+    r0 = np.atleast_2d(np.asarray(r0, dtype=float))
+    v0 = np.atleast_2d(np.asarray(v0, dtype=float))
+    n_orbits = np.broadcast(r0[:, 0], v0[:, 0], np.asarray(dt), np.asarray(t_max), np.asarray(every)).size
+    r0, v0 = (np.ascontiguousarray(np.broadcast_to(x, (n_orbits, 3))) for x in (r0, v0))
+    dt, t_max = (np.ascontiguousarray(np.broadcast_to(np.asarray(x, dtype=float), (n_orbits,))) for x in (dt, t_max))
+    every = np.ascontiguousarray(np.broadcast_to(np.asarray(every, dtype=np.int64), (n_orbits,)))
+    if (every < 1).any():
+        raise ValueError("every must be at least 1")
+    if not (dt > 0.0).all():
+        raise ValueError("dt must be positive")
+    n = np.ceil(t_max / dt).astype(np.int64)
+    n_samples = int(((n - 1) // every + 1).max(initial=0))
+
+    if backend != "numpy" and lander_agent_cpp is not None:
+        r, v, a = lander_agent_cpp.propagate_orbits(method, r0, v0, dt, n, every, gm, n_samples, n_threads)
+    else:
+        r, v, a = (np.full((n_orbits, n_samples, 3), np.nan) for _ in range(3))
+        with np.errstate(over="ignore", invalid="ignore"):
+            _propagate_numpy(method == "verlet", r0.copy(), v0.copy(), dt, n, every, gm, r, v, a)
+
+    steps = np.arange(n_samples) * every[:, None]
+    t = np.where(steps < n[:, None], steps * dt[:, None], np.nan)
+    return t, r, v, a
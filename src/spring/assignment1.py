@@ -3,8 +3,8 @@
 ####################
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
 from utils import get_t
+from ensemble import integrate, stability_sweep
 import time
 
 # %%
@@ -21,67 +21,17 @@ dt = 0.0001
 
 
 # Euler method (vectorized)
+# both methods advance the state with the same 2x2 matrix every step, see ensemble.py
 def euler_method(x0, v0, m, k, t_max, dt):
-    t_array, n = get_t(t_max, dt)
-
-    x = np.zeros(n)
-    v = np.zeros(n)
-    a = np.zeros(n)
-    e = np.zeros(n)
-    # start off initialization
-    x[0] = x0
-    v[0] = v0
-    a[0] = -k * x[0] / m
-    e[0] = 0.5 * k * x[0] ** 2 + 0.5 * m * v[0] ** 2
-
-    for i in range(0, n - 1):
-        # update x with previous x and previous v
-        x[i + 1] = x[i] + dt * v[i]
-        # update v with previous v and update a
-        v[i + 1] = v[i] + dt * a[i]
-        # a uses the current value of x
-        a[i + 1] = -k * x[i + 1] / m
-
-        # update e with all the current values
-        e[i] = 0.5 * k * x[i] ** 2 + 0.5 * m * v[i] ** 2
-
-    return x, v, a, e
+    x, v, a, e = integrate("euler", x0, v0, m, k, dt, t_max)
+    return x[0], v[0], a[0], e[0]
 
 
 # Verlet method (vectorized)
+# the first step is an Euler step, and v is the central difference of x, with the backward difference at the end
 def verlet_method(x0, v0, m, k, t_max, dt):
-    t_array, n = get_t(t_max, dt)
-
-    x = np.zeros(n)
-    v = np.zeros(n)
-    a = np.zeros(n)
-    e = np.zeros(n)
-
-    x[0] = x0
-    v[0] = v0
-    a[0] = -k * x[0] / m
-    e[0] = 0.5 * k * x[0] ** 2 + 0.5 * m * v[0] ** 2
-
-    # Calculate x[1] using Euler method for the first step
-    x[1] = x[0] + v[0] * dt
-
-    # start from first elem
-    # we always calculate the next elem stuff
-    # so we go up till the second time step
-    for i in range(1, n - 1):
-        # use the CURRENT value of x[i] which is populated one time step earlier!
-        a[i] = -k * x[i] / m
-        x[i + 1] = 2 * x[i] - x[i - 1] + a[i] * dt**2
-        v[i] = (x[i + 1] - x[i - 1]) / (2 * dt)
-        e[i] = 0.5 * k * x[i] ** 2 + 0.5 * m * v[i] ** 2
-
-    # Calculate final velocity and acceleration
-    a[-1] = -k * x[-1] / m
-    # just use the last and current x for v
-    v[-1] = (x[-1] - x[-2]) / dt
-    e[-1] = 0.5 * k * x[-1] ** 2 + 0.5 * m * v[-1] ** 2
-
-    return x, v, a, e
+    x, v, a, e = integrate("verlet", x0, v0, m, k, dt, t_max)
+    return x[0], v[0], a[0], e[0]
 
 
 # unlike previously, the analytical solution needs more parameters here than just n
@@ -170,22 +120,8 @@ def analyze_verlet_stability(t_max, dt_values):
     x0 = 0  # initial position
     v0 = 1  # initial velocity
 
-    mse_values = []
-
-    for dt in tqdm(dt_values):
-        t_array = np.arange(0, t_max, dt)
-        n = len(t_array)
-
-        # Verlet method
-        x_verlet, _, _, _ = verlet_method(x0, v0, m, k, t_max, dt)
-
-        # Analytical solution
-        x_analytic, _, _, _ = analytical_solution(x0, v0, m, k, t_max, dt)
-
-        # Calculate MSE
-        mse = np.mean((x_verlet - x_analytic) ** 2)
-
-        mse_values.append(mse)
+    # every dt runs at once, and the errors are summed as the steps come, see ensemble.py
+    mse_values = list(stability_sweep("verlet", dt_values, t_max, x0, v0, m, k))
 
     # Plotting
     plt.figure(figsize=(10, 6))
@@ -0,0 +1,251 @@
+import os
+from typing import Iterator, Tuple
+
+import numpy as np
+
+############################################################################################################################
+# the spring-mass integrators of assignment1.py for a whole ensemble of (x0, v0, m, k, dt) configurations at once. the
+# spring is linear, so one step of either method is a fixed 2x2 matrix acting on the state, and j steps are its j-th
+# power, which has a closed form. the powers for one chunk of steps are built once per configuration, and every chunk
+# is then a few array operations along the ensemble and time axes, instead of a Python iteration per step. the steps
+# come out chunk by chunk, so long runs can be reduced (stability_sweep) or streamed to disk (integrate_to_disk)
+###########################################################################################################
+
+METHODS = ("euler", "verlet")
+
+
+def _configurations(*parameters):
+    """the parameters as float arrays of one length, one element per configuration"""
+    return np.broadcast_arrays(*(np.atleast_1d(np.asarray(p, dtype=float)) for p in parameters))
+
+
+def n_steps(t_max, dt) -> np.ndarray:
+    """the number of steps of every configuration, len(np.arange(0, t_max, dt)) as utils.get_t has it"""
+    return np.ceil(t_max / np.asarray(dt, dtype=float)).astype(np.int64)
+
+
+def step_matrices(method: str, m, k, dt) -> np.ndarray:
+    """
+    The matrix that advances the state by one step, (n_configurations, 2, 2).
+
+    The state at step j is (x_j, v_j) for "euler". For "verlet" it is (x_j, s_j), with s_j = (x_{j+1} - x_j) / dt
+    the velocity between two positions, and s_0 = v0 as verlet_method takes its first step.
+    """
+    m, k, dt = _configurations(m, k, dt)
+    matrices = np.zeros(m.shape + (2, 2))
+    matrices[:, 0, 0] = 1.0
+    matrices[:, 0, 1] = dt
+    matrices[:, 1, 0] = -k / m * dt
+    if method == "euler":
+        # x_{j+1} = x_j + dt v_j, v_{j+1} = v_j + dt a_j
+        matrices[:, 1, 1] = 1.0
+    elif method == "verlet":
+        # x_{j+2} = 2 x_{j+1} - x_j + a_{j+1} dt^2, so s_{j+1} = s_j + dt a_{j+1} with x_{j+1} = x_j + dt s_j
+        matrices[:, 1, 1] = 1.0 - k / m * dt**2
+    else:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    return matrices
+
+
+def matrix_powers(matrices: np.ndarray, n: int) -> np.ndarray:
+    """matrices to the powers 0 to n - 1, (n_configurations, n, 2, 2), by doubling: log2(n) batched products"""
+    powers = np.empty((len(matrices), n, 2, 2))
+    powers[:, 0] = np.eye(2)
+    square = matrices
+    filled = 1
+    while filled < n:
+        take = min(filled, n - filled)
+        # A^(filled + i) = A^filled A^i
+        powers[:, filled : filled + take] = square[:, None] @ powers[:, :take]
+        filled += take
+        square = square @ square
+    return powers
+
+
+def step_powers(method: str, m, k, dt, n: int) -> np.ndarray:
+    """
+    The step matrices to the powers 0 to n - 1, (n_configurations, n, 2, 2).
+
+    Both matrices are rotations in disguise, with omega dt = h: Euler's by the angle arctan(h), and growing by
+    sqrt(1 + h^2) every step, Verlet's by 2 arcsin(h / 2) while h < 2. Their powers are written out with cos and
+    sin of j times the angle, which stays exact to rounding over millions of steps, where products of the
+    matrices would not. Verlet with h >= 2 is unstable, its powers are taken by doubling.
+    """
+    m, k, dt = _configurations(m, k, dt)
+    omega = np.sqrt(k / m)[:, None]
+    h = omega * dt[:, None]
+    j = np.arange(n)
+    powers = np.empty((len(m), n, 2, 2))
+    with np.errstate(over="ignore", invalid="ignore"):
+        if method == "euler":
+            angle = j * np.arctan(h)
+            growth = np.exp(0.5 * j * np.log1p(h**2))
+            cos, sin = growth * np.cos(angle), growth * np.sin(angle)
+            powers[..., 0, 0] = cos
+            powers[..., 0, 1] = sin / omega
+            powers[..., 1, 0] = -omega * sin
+            powers[..., 1, 1] = cos
+        else:
+            stable = h[:, 0] < 2.0
+            h, omega = h[stable], omega[stable]
+            # cos of half the angle
+            q = np.sqrt(1.0 - 0.25 * h**2)
+            angle = j * 2.0 * np.arcsin(0.5 * h)
+            cos, sin = np.cos(angle), np.sin(angle)
+            powers[stable, :, 0, 0] = cos + 0.5 * h / q * sin
+            powers[stable, :, 0, 1] = sin / (omega * q)
+            powers[stable, :, 1, 0] = -omega / q * sin
+            powers[stable, :, 1, 1] = cos - 0.5 * h / q * sin
+            powers[~stable] = matrix_powers(step_matrices(method, m[~stable], k[~stable], dt[~stable]), n)
+    return powers
+
+
+def _active_chunks(method: str, x0, v0, m, k, dt, n, chunk_size: int):
+    """
+    The positions and velocities of the configurations still running, chunk by chunk: (start, active, x, v),
+    with x and v (len(active), steps in the chunk). A configuration's steps past its end are left as they come
+    """
+    powers = step_powers(method, m, k, dt, chunk_size + 1)
+    state = np.stack([x0, v0], axis=1)
+    # the velocity between the last two positions of the chunk before, for Verlet's central difference
+    s_before = np.full(len(x0), np.nan)
+
+    for start in range(0, int(n.max(initial=0)), chunk_size):
+        size = min(chunk_size, int(n.max()) - start)
+        # only the configurations still running are advanced, and copied out when some have stopped
+        active = np.flatnonzero(n > start)
+        everyone = len(active) == len(n)
+        chunk_powers = powers[:, : size + 1] if everyone else powers[active, : size + 1]
+        states = (chunk_powers @ state[active, None, :, None])[..., 0]
+        x = states[:, :size, 0]
+
+        if method == "euler":
+            v = states[:, :size, 1]
+        else:
+            # v_j = (x_{j+1} - x_{j-1}) / 2 dt is the mean of s_j and s_{j-1}
+            s = states[:, :size, 1]
+            v = np.empty_like(x)
+            v[:, 1:] = 0.5 * (s[:, 1:] + s[:, :-1])
+            v[:, 0] = 0.5 * (s[:, 0] + s_before[active])
+            if start == 0:
+                v[:, 0] = v0[active]
+            # the last step of a configuration has no next position, its velocity is s_{j-1}
+            ends = n[active] - 1 - start
+            last = np.flatnonzero((ends >= 0) & (ends < size) & (n[active] > 1))
+            v[last, ends[last]] = np.where(ends[last] > 0, s[last, ends[last] - 1], s_before[active[last]])
+            s_before[active] = s[:, -1]
+
+        state[active] = states[:, size]
+        yield start, active, x, v
+
+
+def integrate_chunks(
+    method: str, x0, v0, m, k, dt, t_max: float, chunk_size: int = 8192
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Integrate every configuration, a chunk of steps at a time.
+
+    The parameters broadcast against each other, so one of them can be an array of values to sweep. Every
+    configuration runs for n_steps(t_max, dt) steps, and gives the same x, v, a and e as euler_method or
+    verlet_method in assignment1.py would, up to rounding: Verlet's velocity is the central difference of the
+    positions, with v0 at the first step and the backward difference at the last.
+
+    Args:
+        method (str): "euler" or "verlet".
+        x0, v0, m, k, dt (float or np.ndarray): Initial position and velocity, mass, spring constant and time step.
+        t_max (float): Length of every run.
+        chunk_size (int): Steps per chunk. Each configuration holds chunk_size 2x2 matrix powers.
+
+    Yields:
+        (int, np.ndarray, np.ndarray, np.ndarray, np.ndarray): The index of the chunk's first step, then x, v, a
+            and e, each (n_configurations, steps in the chunk). Steps past the end of a configuration are NaN.
+    """
+    x0, v0, m, k, dt = _configurations(x0, v0, m, k, dt)
+    n = n_steps(t_max, dt)
+    for start, active, x_active, v_active in _active_chunks(method, x0, v0, m, k, dt, n, chunk_size):
+        x = np.full((len(n), x_active.shape[1]), np.nan)
+        v = np.full_like(x, np.nan)
+        x[active] = x_active
+        v[active] = v_active
+        # the steps past a configuration's end are NaN
+        past_end = np.arange(start, start + x.shape[1]) >= n[:, None]
+        x[past_end] = np.nan
+        v[past_end] = np.nan
+        a = -k[:, None] * x / m[:, None]
+        e = 0.5 * k[:, None] * x**2 + 0.5 * m[:, None] * v**2
+        yield start, x, v, a, e
+
+
+def integrate(method: str, x0, v0, m, k, dt, t_max: float, chunk_size: int = 8192):
+    """
+    Integrate every configuration, with the whole trajectories in memory.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): x, v, a and e, (n_configurations, the most steps of any
+            configuration), NaN past the end of the shorter ones. See integrate_chunks for the arguments.
+    """
+    chunks = list(integrate_chunks(method, x0, v0, m, k, dt, t_max, chunk_size))
+    if not chunks:
+        return tuple(np.zeros((len(_configurations(x0, v0, m, k, dt)[0]), 0)) for _ in range(4))
+    return tuple(np.concatenate([chunk[i] for chunk in chunks], axis=1) for i in range(1, 5))
+
+
+def integrate_to_disk(
+    directory: str, method: str, x0, v0, m, k, dt, t_max: float, chunk_size: int = 8192
+) -> np.ndarray:
+    """
+    Integrate every configuration into x.npy, v.npy, a.npy and e.npy in directory, one chunk at a time.
+
+    Only one chunk is ever in memory. Every file is (n_configurations, the most steps of any configuration),
+    NaN past the end of the shorter ones, and opens zero-copy with np.load(..., mmap_mode="r"). See
+    integrate_chunks for the arguments.
+
+    Returns:
+        np.ndarray: The number of steps of every configuration.
+    """
+    x0, v0, m, k, dt = _configurations(x0, v0, m, k, dt)
+    n = n_steps(t_max, dt)
+    os.makedirs(directory, exist_ok=True)
+    files = [
+        np.lib.format.open_memmap(
+            os.path.join(directory, f"{name}.npy"), mode="w+", dtype=np.float64, shape=(len(n), int(n.max(initial=0)))
+        )
+        for name in ("x", "v", "a", "e")
+    ]
+    for start, *values in integrate_chunks(method, x0, v0, m, k, dt, t_max, chunk_size):
+        for file, value in zip(files, values):
+            file[:, start : start + value.shape[1]] = value
+    for file in files:
+        file.flush()
+    del files
+    return n
+
+
+def analytical_positions(x0, v0, m, k, t) -> np.ndarray:
+    """the exact position at times t, as analytical_solution in assignment1.py. the parameters broadcast with t"""
+    omega = np.sqrt(k / m)
+    amplitude = np.sqrt(x0**2 + (v0 / omega) ** 2)
+    phi = np.arctan2(-v0 / (omega * amplitude), x0 / amplitude)
+    return amplitude * np.cos(omega * t + phi)
+
+
+def stability_sweep(
+    method: str, dt_values, t_max: float, x0=0.0, v0=1.0, m=1.0, k=1.0, chunk_size: int = 8192
+) -> np.ndarray:
+    """
+    The mean squared error of the positions against the exact solution, for every time step in dt_values.
+
+    All the time steps run together, and the errors are summed chunk by chunk, so no trajectory is ever held
+    whole. Runs that blow up give inf or NaN, as the loops in assignment1.py did.
+    """
+    x0, v0, m, k, dt = _configurations(x0, v0, m, k, dt_values)
+    n = n_steps(t_max, dt)
+    squared_error = np.zeros(len(dt))
+    with np.errstate(over="ignore", invalid="ignore"):
+        for start, active, x, _ in _active_chunks(method, x0, v0, m, k, dt, n, chunk_size):
+            steps = np.arange(start, start + x.shape[1])
+            t = steps * dt[active, None]
+            exact = analytical_positions(x0[active, None], v0[active, None], m[active, None], k[active, None], t)
+            running = steps < n[active, None]
+            squared_error[active] += np.where(running, (x - exact) ** 2, 0.0).sum(axis=1)
+    return squared_error / n